@@ -0,0 +1,210 @@
+"""
+jpamb.callgraph
+
+This module provides the call graph of the suite, see 'Suite.callgraph'.
+
+The edges go from a method to the methods it invokes, as they are named
+in the invoke opcodes, so virtual calls are not resolved to overriding
+methods, and dynamic invokes have no edges.
+
+"""
+
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from jpamb import jvm
+
+
+def descriptor_type(json) -> jvm.Type:
+    """The type of a json type, as it is written in a method descriptor.
+
+    'jvm.Type.from_json' reads char[] as String, so the method ids would
+    not match the ids of the cases, like 'Arrays.arraySpellsHello:([C)V'.
+    """
+    if isinstance(json, dict) and json.get("kind") == "array":
+        return jvm.Array(descriptor_type(json["type"]))
+    return jvm.Type.from_json(json)
+
+
+def make_method_id(
+    cn: jvm.ClassName, name: str, params: Iterable, returns
+) -> jvm.AbsMethodID:
+    return jvm.AbsMethodID(
+        classname=cn,
+        extension=jvm.MethodID(
+            name=name,
+            params=jvm.ParameterType(tuple(descriptor_type(t) for t in params)),
+            return_type=descriptor_type(returns) if returns is not None else None,
+        ),
+    )
+
+
+def method_id(cn: jvm.ClassName, method: dict) -> jvm.AbsMethodID:
+    """The method id of a decompiled method in the class cn."""
+    params = (p["type"] for p in method["params"])
+    return make_method_id(cn, method["name"], params, method["returns"]["type"])
+
+
+def invoked_method_id(json: dict) -> jvm.AbsMethodID:
+    """The method id of the method invoked by an invoke opcode."""
+    cn = jvm.ClassName(json["ref"]["name"].replace("/", "."))
+    return make_method_id(cn, json["name"], json["args"], json["returns"])
+
+
+def dotted(method: jvm.AbsMethodID) -> jvm.AbsMethodID:
+    """The method id with a dotted class name.
+
+    The class names in invoke opcodes are slashed, but the method ids of
+    the suite are dotted, so they are normalized here.
+    """
+    cn = method.classname.slashed()
+    if "/" not in cn:
+        return method
+    return jvm.AbsMethodID(jvm.ClassName(cn.replace("/", ".")), method.extension)
+
+
+def class_edges(
+    cn: jvm.ClassName, decompiled: dict
+) -> dict[jvm.AbsMethodID, tuple[jvm.AbsMethodID, ...]]:
+    """The calls made by each method in a decompiled class."""
+    edges = {}
+    for method in decompiled["methods"]:
+        callees = {}
+        if method["code"] is not None:
+            for op in method["code"]["bytecode"]:
+                if op["opr"] == "invoke" and op["access"] != "dynamic":
+                    callees[invoked_method_id(op["method"])] = None
+        edges[method_id(cn, method)] = tuple(callees)
+    return edges
+
+
+@dataclass
+class CallGraph:
+    """A call graph over the methods of the suite.
+
+    The graph is indexed by class, so a class can be replaced with
+    'update' when it is decompiled again. The reverse edges, strongly
+    connected components, the component of each method and the reachable
+    sets are computed on first use, and recomputed after an update.
+    """
+
+    classes: dict[jvm.ClassName, dict[jvm.AbsMethodID, tuple[jvm.AbsMethodID, ...]]]
+    _edges: dict | None = field(default=None, init=False, repr=False)
+    _callers: dict | None = field(default=None, init=False, repr=False)
+    _sccs: tuple | None = field(default=None, init=False, repr=False)
+    _components: dict | None = field(default=None, init=False, repr=False)
+    _reachable: dict = field(default_factory=dict, init=False, repr=False)
+
+    @staticmethod
+    def from_classes(classes: Iterable[tuple[jvm.ClassName, dict]]) -> "CallGraph":
+        return CallGraph({cn: class_edges(cn, d) for cn, d in classes})
+
+    def update(self, cn: jvm.ClassName, decompiled: dict | None):
+        """Replace the methods of the class cn, or remove them if None."""
+        if decompiled is None:
+            self.classes.pop(cn, None)
+        else:
+            self.classes[cn] = class_edges(cn, decompiled)
+        self._edges = None
+        self._callers = None
+        self._sccs = None
+        self._components = None
+        self._reachable.clear()
+
+    @property
+    def edges(self) -> dict[jvm.AbsMethodID, tuple[jvm.AbsMethodID, ...]]:
+        """The callees of every method in the suite."""
+        if self._edges is None:
+            self._edges = {
+                m: callees
+                for edges in self.classes.values()
+                for m, callees in edges.items()
+            }
+        return self._edges
+
+    def methods(self) -> Iterable[jvm.AbsMethodID]:
+        return self.edges.keys()
+
+    def callees(self, method: jvm.AbsMethodID) -> tuple[jvm.AbsMethodID, ...]:
+        return self.edges.get(method, ())
+
+    def callers(self, method: jvm.AbsMethodID) -> tuple[jvm.AbsMethodID, ...]:
+        if self._callers is None:
+            callers = {}
+            for m, callees in self.edges.items():
+                for c in callees:
+                    callers.setdefault(c, []).append(m)
+            self._callers = {c: tuple(ms) for c, ms in callers.items()}
+        return self._callers.get(method, ())
+
+    def reachable(self, method: jvm.AbsMethodID) -> frozenset[jvm.AbsMethodID]:
+        """The methods reachable from method, including itself."""
+        if (result := self._reachable.get(method)) is None:
+            seen = {method}
+            worklist = [method]
+            while worklist:
+                for c in self.callees(worklist.pop()):
+                    if c not in seen:
+                        seen.add(c)
+                        worklist.append(c)
+            result = self._reachable[method] = frozenset(seen)
+        return result
+
+    def sccs(self) -> tuple[frozenset[jvm.AbsMethodID], ...]:
+        """The strongly connected components, callees before callers."""
+        if self._sccs is None:
+            self._sccs = tuple(tarjan(self.edges))
+        return self._sccs
+
+    def is_recursive(self, method: jvm.AbsMethodID) -> bool:
+        """Check if a method can call itself, directly or not."""
+        if method in self.callees(method):
+            return True
+        if self._components is None:
+            self._components = {m: scc for scc in self.sccs() for m in scc}
+        return len(self._components.get(method, ())) > 1
+
+
+def tarjan(
+    edges: dict[jvm.AbsMethodID, tuple[jvm.AbsMethodID, ...]],
+) -> list[frozenset[jvm.AbsMethodID]]:
+    """Tarjan's strongly connected components, without recursion."""
+    index: dict[jvm.AbsMethodID, int] = {}
+    lowlink: dict[jvm.AbsMethodID, int] = {}
+    stack: list[jvm.AbsMethodID] = []
+    on_stack: set[jvm.AbsMethodID] = set()
+    components = []
+
+    for root in edges:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges.get(root, ())))]
+        while work:
+            m, callees = work[-1]
+            for c in callees:
+                if c not in index:
+                    index[c] = lowlink[c] = len(index)
+                    stack.append(c)
+                    on_stack.add(c)
+                    work.append((c, iter(edges.get(c, ()))))
+                    break
+                if c in on_stack:
+                    lowlink[m] = min(lowlink[m], index[c])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[m])
+                if lowlink[m] == index[m]:
+                    component = set()
+                    while True:
+                        c = stack.pop()
+                        on_stack.discard(c)
+                        component.add(c)
+                        if c == m:
+                            break
+                    components.append(frozenset(component))
+    return components
@@ -0,0 +1,239 @@
+"""
+jpamb.cfg
+
+This module provides the control flow graph of a method, with its basic
+blocks, dominators and natural loops.
+
+The graphs are computed from the opcodes, where the targets of the
+branches are indices into the list of opcodes, and exceptional control
+flow is not included. Use 'cfg' to get the graph of a method from a
+suite, which is only computed once per method.
+
+"""
+
+from dataclasses import dataclass
+from typing import Iterable
+
+from jpamb import jvm
+from jpamb.model import Suite
+
+
+@dataclass(frozen=True)
+class BasicBlock:
+    """A basic block is a range of opcodes, only entered at the start."""
+
+    index: int
+    start: int
+    end: int
+
+    @property
+    def opcodes(self) -> range:
+        """The indices of the opcodes in the block"""
+        return range(self.start, self.end)
+
+    def __str__(self):
+        return f"B{self.index}[{self.start}:{self.end}]"
+
+
+@dataclass(frozen=True)
+class Loop:
+    """A natural loop, given by its header and the blocks of its body."""
+
+    header: int
+    body: frozenset[int]
+    latches: tuple[int, ...]
+
+    def __contains__(self, block: int) -> bool:
+        return block in self.body
+
+
+def opcode_successors(i: int, op: jvm.Opcode, size: int) -> tuple[int, ...]:
+    """The indices of the opcodes which can follow the i'th opcode."""
+    match op:
+        case jvm.Goto(target=t):
+            return (t,)
+        case jvm.If(target=t) | jvm.Ifz(target=t):
+            return tuple(dict.fromkeys(s for s in (i + 1, t) if s < size))
+        case jvm.Return() | jvm.Throw():
+            return ()
+    return (i + 1,) if i + 1 < size else ()
+
+
+@dataclass(frozen=True)
+class CFG:
+    """The control flow graph of a method.
+
+    Blocks are referred to by their index in 'blocks', and the entry block
+    is always 0. The blocks not reachable from the entry are not in
+    'rpo', and have no immediate dominator.
+    """
+
+    blocks: tuple[BasicBlock, ...]
+    successors: tuple[tuple[int, ...], ...]
+    predecessors: tuple[tuple[int, ...], ...]
+    block_of: tuple[int, ...]
+    rpo: tuple[int, ...]
+    idom: tuple[int | None, ...]
+    loops: tuple[Loop, ...]
+
+    @staticmethod
+    def from_opcodes(opcodes: Iterable[jvm.Opcode]) -> "CFG":
+        opcodes = list(opcodes)
+        size = len(opcodes)
+        if size == 0:
+            return CFG((), (), (), (), (), (), ())
+
+        op_succs = [opcode_successors(i, op, size) for i, op in enumerate(opcodes)]
+
+        leaders = {0}
+        for i, succs in enumerate(op_succs):
+            if succs != (i + 1,):
+                leaders.update(s for s in succs if s < size)
+                if i + 1 < size:
+                    leaders.add(i + 1)
+        starts = sorted(leaders)
+
+        blocks = tuple(
+            BasicBlock(b, start, end)
+            for b, (start, end) in enumerate(zip(starts, starts[1:] + [size]))
+        )
+        block_of = [0] * size
+        for block in blocks:
+            for i in block.opcodes:
+                block_of[i] = block.index
+
+        successors = tuple(
+            tuple(dict.fromkeys(block_of[s] for s in op_succs[b.end - 1]))
+            for b in blocks
+        )
+        predecessors = [[] for _ in blocks]
+        for b, succs in enumerate(successors):
+            for s in succs:
+                predecessors[s].append(b)
+
+        rpo = reverse_postorder(successors)
+        idom = immediate_dominators(rpo, predecessors)
+        loops = natural_loops(rpo, successors, predecessors, idom)
+
+        return CFG(
+            blocks=blocks,
+            successors=successors,
+            predecessors=tuple(tuple(p) for p in predecessors),
+            block_of=tuple(block_of),
+            rpo=rpo,
+            idom=idom,
+            loops=loops,
+        )
+
+    def dominates(self, a: int, b: int) -> bool:
+        """Check if block a dominates block b."""
+        if self.idom[b] is None and b != 0:
+            return False
+        while b != a:
+            if b == 0:
+                return False
+            b = self.idom[b]
+        return True
+
+    def dominators(self, b: int) -> list[int]:
+        """The dominators of block b, from b to the entry."""
+        if self.idom[b] is None and b != 0:
+            return []
+        doms = [b]
+        while b != 0:
+            b = self.idom[b]
+            doms.append(b)
+        return doms
+
+    def loop_headers(self) -> set[int]:
+        return {loop.header for loop in self.loops}
+
+
+def reverse_postorder(successors: tuple[tuple[int, ...], ...]) -> tuple[int, ...]:
+    """The blocks reachable from the entry in reverse postorder."""
+    seen = {0}
+    order = []
+    stack = [(0, iter(successors[0]))]
+    while stack:
+        b, succs = stack[-1]
+        for s in succs:
+            if s not in seen:
+                seen.add(s)
+                stack.append((s, iter(successors[s])))
+                break
+        else:
+            stack.pop()
+            order.append(b)
+    return tuple(reversed(order))
+
+
+def immediate_dominators(
+    rpo: tuple[int, ...], predecessors: list[list[int]]
+) -> tuple[int | None, ...]:
+    """The immediate dominators, as by Cooper, Harvey and Kennedy.
+
+    The entry is its own immediate dominator, as the algorithm requires.
+    """
+    order = {b: i for i, b in enumerate(rpo)}
+    idom: list[int | None] = [None] * len(predecessors)
+    idom[0] = 0
+
+    def intersect(a: int, b: int) -> int:
+        while a != b:
+            while order[a] > order[b]:
+                a = idom[a]
+            while order[b] > order[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for b in rpo[1:]:
+            new = None
+            for p in predecessors[b]:
+                if idom[p] is not None:
+                    new = p if new is None else intersect(p, new)
+            if idom[b] != new:
+                idom[b] = new
+                changed = True
+    return tuple(idom)
+
+
+def natural_loops(
+    rpo: tuple[int, ...],
+    successors: tuple[tuple[int, ...], ...],
+    predecessors: list[list[int]],
+    idom: tuple[int | None, ...],
+) -> tuple[Loop, ...]:
+    """The natural loops, one per header, ordered by their header in rpo."""
+
+    def dominates(a: int, b: int) -> bool:
+        while b != a:
+            if b == 0:
+                return False
+            b = idom[b]
+        return True
+
+    latches: dict[int, list[int]] = {}
+    for b in rpo:
+        for s in successors[b]:
+            if dominates(s, b):
+                latches.setdefault(s, []).append(b)
+
+    loops = []
+    for header in sorted(latches, key=rpo.index):
+        body = {header}
+        work = list(latches[header])
+        while work:
+            b = work.pop()
+            if b not in body:
+                body.add(b)
+                work.extend(p for p in predecessors[b] if idom[p] is not None)
+        loops.append(Loop(header, frozenset(body), tuple(latches[header])))
+    return tuple(loops)
+
+
+def cfg(suite: Suite, method: jvm.AbsMethodID) -> CFG:
+    """The control flow graph of a method, computed once per suite."""
+    return suite.method_cache(method).analysis("cfg", CFG.from_opcodes)
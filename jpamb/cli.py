@@ -5,18 +5,21 @@ import shutil
 import math
 import sys
 import json
-from inspect import getsourcelines, getsourcefile
 from collections import Counter
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
 
-from jpamb import model, logger, jvm
+from jpamb import model, logger, jvm, opstats
 from jpamb.logger import log
 
+import os
 import subprocess
 import dataclasses
+import functools
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from typing import IO
+from typing import IO, Iterable, Iterator
 
 
 class JpambScore:
@@ -30,6 +33,94 @@ class JpambScore:
         self.rel_time = rel_time
 
 
+def case_selector(f):
+    """Add the options selecting cases by their method, see 'CaseSelector'.
+
+    The options are passed to the command as 'select'.
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args, classes, opcodes, outcomes, params, **kwargs):
+        select = opstats.CaseSelector(classes, opcodes, outcomes, params)
+        return f(*args, select=select, **kwargs)
+
+    def check_classes(ctx, param, classes):
+        suite = ctx.find_object(model.Suite)
+        known = set()
+        for m, _ in suite.case_methods():
+            known |= {m.classname.name, m.classname.dotted()}
+        for cn in classes:
+            if cn not in known:
+                raise click.BadParameter(f"No cases in class {cn!r}")
+        return classes
+
+    def check_opcodes(ctx, param, opcodes):
+        if opcodes:
+            stats = opstats.opcode_stats(ctx.find_object(model.Suite))
+            for opcode in opcodes:
+                try:
+                    stats.mnemonics(opcode)
+                except ValueError as e:
+                    raise click.BadParameter(str(e))
+        return opcodes
+
+    def check_params(ctx, param, params):
+        for t in params:
+            try:
+                _, rest = jvm.Type.decode(t)
+            except ValueError as e:
+                raise click.BadParameter(str(e))
+            if rest:
+                raise click.BadParameter(f"Expected a single type, but got {t!r}")
+        return params
+
+    options = [
+        click.option(
+            "--class",
+            "classes",
+            multiple=True,
+            callback=check_classes,
+            help="only select cases of methods in this class.",
+        ),
+        click.option(
+            "--has-opcode",
+            "opcodes",
+            multiple=True,
+            callback=check_opcodes,
+            help="only select cases of methods containing this opcode, "
+            "like NewArray or invokevirtual.",
+        ),
+        click.option(
+            "--outcome",
+            "outcomes",
+            multiple=True,
+            type=click.Choice(model.QUERIES),
+            help="only select cases with this expected outcome.",
+        ),
+        click.option(
+            "--param-type",
+            "params",
+            multiple=True,
+            callback=check_params,
+            help="only select cases of methods with a parameter of this type, "
+            "like [I.",
+        ),
+    ]
+    for option in reversed(options):
+        wrapper = option(wrapper)
+    return wrapper
+
+
+def selected(suite, select: opstats.CaseSelector, cases=False):
+    """The selected methods, or cases, or None if everything is selected."""
+    if not select:
+        return None
+    stats = opstats.opcode_stats(suite)
+    if cases:
+        return select.cases(suite, stats)
+    return select.methods(suite, stats)
+
+
 def re_parser(ctx_, parms_, expr):
     import re
 
@@ -120,14 +211,130 @@ def run(cmd: list[str], /, timeout=2.0, logout=None, logerr=None, **kwargs):
         e.stderr = "".join(stderr)
         e.stdout = "".join(stdout)
         raise e
-    except subprocess.TimeoutExpired:
+    except subprocess.TimeoutExpired as e:
         if cp:
             cp.terminate()
             if cp.stdout:
                 cp.stdout.close()
             if cp.stderr:
                 cp.stderr.close()
-        raise
+        e.stderr = "".join(stderr)
+        e.stdout = "".join(stdout)
+        raise e
+
+
+@dataclasses.dataclass
+class Container:
+    """Runs commands in a docker image.
+
+    By default every command runs in a new container. Inside a 'with'
+    block all commands are instead run with 'exec' in one long-lived
+    container, which avoids starting a container per command. The commands
+    are wrapped in 'timeout', so a command which timed out does not keep
+    running in the container.
+    """
+
+    dockerbin: str
+    image: str
+    workfolder: Path
+    id: str | None = None
+
+    def __enter__(self):
+        out, _ = run(
+            [
+                self.dockerbin,
+                "run",
+                "--rm",
+                "--detach",
+                "-v",
+                f"{self.workfolder}:/workspace",
+                "--entrypoint",
+                "sleep",
+                self.image,
+                "infinity",
+            ],
+            timeout=600,
+        )
+        self.id = out.strip()
+        log.debug(f"Started container {self.id}")
+        return self
+
+    def __exit__(self, *exc):
+        run([self.dockerbin, "kill", self.id], timeout=60)
+        log.debug(f"Stopped container {self.id}")
+        self.id = None
+
+    def run(self, args: list[str], /, timeout=2.0, **kwargs):
+        if self.id is None:
+            cmd = [
+                self.dockerbin,
+                "run",
+                "--rm",
+                "-v",
+                f"{self.workfolder}:/workspace",
+                self.image,
+            ]
+            if "stdin" in kwargs:
+                cmd.insert(2, "--interactive")
+        else:
+            # outlive the timeout of 'run', so the result is the same
+            cmd = [self.dockerbin, "exec", self.id]
+            if "stdin" in kwargs:
+                cmd.insert(2, "--interactive")
+            cmd += ["timeout", "--signal=KILL", f"{timeout + 1}"]
+        return run(cmd + args, timeout=timeout, **kwargs)
+
+
+def run_cases(
+    container: Container,
+    classpath: str,
+    cases: Iterable[model.Case],
+    timeout: float = 2.0,
+    startup: float = 60.0,
+) -> Iterator[tuple[model.Case, str]]:
+    """Run the cases in one JVM, using 'jpamb.Runtime --batch'.
+
+    Yields each case with its result, in order. The runtime stops after a
+    case times out, so it is started again on the remaining cases. If the
+    runtime itself hangs, longer than startup and the timeout of each case,
+    the case it was running is "*" and the runtime is started again on the
+    rest.
+    """
+    import tempfile
+
+    cases = list(cases)
+    while cases:
+        with tempfile.TemporaryFile("w+") as f:
+            for case in cases:
+                f.write(f"{case.methodid.encode()} {case.input.encode()}\n")
+            f.seek(0)
+            try:
+                out, _ = container.run(
+                    [
+                        "java",
+                        "-cp",
+                        classpath,
+                        "-ea",
+                        "jpamb.Runtime",
+                        "--batch",
+                        str(int(timeout * 1000)),
+                    ],
+                    stdin=f,
+                    logerr=log.debug,
+                    timeout=timeout * len(cases) + startup,
+                )
+            except subprocess.TimeoutExpired as e:
+                # the cases before the hanging one have already been printed
+                done = (e.stdout or "").splitlines()
+                if len(done) < len(cases):
+                    hung = cases[len(done)]
+                    log.warning(f"jpamb.Runtime hung, reporting {hung} as *")
+                out = "\n".join(done + ["*"])
+        results = out.splitlines()
+        if not results:
+            raise RuntimeError(f"jpamb.Runtime gave no result for {cases[0]}")
+        yield from zip(cases, results)
+        cases = cases[len(results) :]
 
 
 @dataclasses.dataclass
@@ -252,14 +459,16 @@ def checkhealth(suite):
 )
 @click.argument("PROGRAM", nargs=-1)
 @click.pass_obj
-def test(suite, program, report, filter, fail_fast, with_python, timeout):
+@case_selector
+def test(suite, program, report, filter, fail_fast, with_python, timeout, select):
     """Test run a PROGRAM."""
 
     program = resolve_cmd(program, with_python)
+    methods = selected(suite, select)
 
     r = Reporter(report)
 
-    if not filter:
+    if not filter and methods is None:
         with r.context("Info"):
             out = r.run(program + ("info",), timeout=timeout)
             info = model.AnalysisInfo.parse(out)
@@ -272,6 +481,8 @@ def test(suite, program, report, filter, fail_fast, with_python, timeout):
     for methodid, correct in suite.case_methods():
         if filter and not filter.search(str(methodid)):
             continue
+        if methods is not None and methodid not in methods:
+            continue
 
         with r.context(f"Case {methodid}"):
             out = r.run(program + (str(methodid),), timeout=timeout)
@@ -318,11 +529,13 @@ def test(suite, program, report, filter, fail_fast, with_python, timeout):
 )
 @click.argument("PROGRAM", nargs=-1)
 @click.pass_obj
-def interpret(suite, program, report, filter, with_python, timeout, stepwise):
+@case_selector
+def interpret(suite, program, report, filter, with_python, timeout, stepwise, select):
     """Use PROGRAM as an interpreter."""
 
     r = Reporter(report)
     program = resolve_cmd(program, with_python)
+    cases = selected(suite, select, cases=True)
 
     last_case = None
     if stepwise:
@@ -344,6 +557,8 @@ def interpret(suite, program, report, filter, with_python, timeout, stepwise):
 
         if filter and not filter.search(str(case)):
             continue
+        if cases is not None and case not in cases:
+            continue
 
         with r.context(f"Case {case}"):
             try:
@@ -400,10 +615,12 @@ def interpret(suite, program, report, filter, with_python, timeout, stepwise):
     help="A file to write the report to",
 )
 @click.argument("PROGRAM", nargs=-1)
-def evaluate(ctx, program, report, timeout, iterations, with_python):
+@case_selector
+def evaluate(ctx, program, report, timeout, iterations, with_python, select):
     """Evaluate the PROGRAM."""
 
     program = resolve_cmd(program, with_python)
+    methods = selected(ctx.obj, select)
 
     def calibrate(count=100_000):
         from time import perf_counter_ns
@@ -434,6 +651,8 @@ def evaluate(ctx, program, report, timeout, iterations, with_python):
     bymethod = {}
 
     for methodid, correct in ctx.obj.case_methods():
+        if methods is not None and methodid not in methods:
+            continue
         log.success(f"Running on {methodid}")
         results = []
 
@@ -521,8 +740,28 @@ def evaluate(ctx, program, report, timeout, iterations, with_python):
     help="test that all cases are correct.",
     default=None,
 )
+@click.option(
+    "--incremental / --full",
+    help="only redo the work downstream of changes since the last build.",
+    default=True,
+)
+@click.option(
+    "--session / --no-session",
+    help="run all steps in one long-lived container.",
+    default=False,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    help="the number of classes to decompile at the same time.",
+    type=click.IntRange(min=1),
+    default=os.cpu_count() or 1,
+    show_default=True,
+)
 @click.pass_obj
-def build(suite, compile, decompile, document, test, docker):
+def build(
+    suite, compile, decompile, document, test, docker, incremental, session, jobs
+):
     """Rebuild all benchmarks."""
 
     if not any(s for s in [compile, decompile, document, test]):
@@ -538,23 +777,43 @@ def build(suite, compile, decompile, document, test, docker):
 
     log.info(f"Using docker: {dockerbin}")
 
-    cmd = [
-        dockerbin,
-        "run",
-        "--rm",
-        "-v",
-        f"{suite.workfolder}:/workspace",
-        docker,
-    ]
+    container = Container(dockerbin, docker, suite.workfolder)
+    if session:
+        click.get_current_context().with_resource(container)
+
     def _rel(path: Path) -> str:
         return path.relative_to(suite.workfolder).as_posix()
 
+    root = suite.workfolder
+    manifest = model.BuildManifest.load(suite.manifest_file)
+    if not incremental:
+        # only forget the steps that are redone, so the others stay current
+        for step, sections in [
+            (compile, ["sources"]),
+            (decompile, ["classes", "decompiled"]),
+            (test, ["tests"]),
+        ]:
+            if step:
+                for section in sections:
+                    manifest.sections.pop(section, None)
+
+    # the tests run the cases with jpamb.Runtime, so it must be up to date
+    runtime = suite.sourcefile(jvm.ClassName("jpamb.Runtime"))
+    if test and not compile and manifest.changed("sources", [runtime], root):
+        log.info("jpamb.Runtime has changed since it was compiled")
+        compile = True
+
+    if compile:
+        sources = manifest.changed("sources", suite.sourcefiles(), root)
+        if not sources and suite.case_file.exists():
+            log.info("Sources are up to date")
+            compile = False
+
     if compile:
-        log.info("Compiling")
-        run(
-            cmd
-            + ["javac", "-d", "target/classes"]
-            + list(_rel(a) for a in suite.sourcefiles()),
+        log.info(f"Compiling {len(sources)} sources")
+        container.run(
+            ["javac", "-d", "target/classes", "-cp", "target/classes"]
+            + list(_rel(a) for a in sources),
             logerr=log.warning,
             logout=log.info,
             timeout=600,
@@ -562,24 +821,37 @@ def build(suite, compile, decompile, document, test, docker):
 
         log.info("Building Stats")
 
-        res, x = run(
-            cmd + ["java", "-cp", "target/classes", "jpamb.Runtime"],
+        res, x = container.run(
+            ["java", "-cp", "target/classes", "jpamb.Runtime"],
             logout=log.info,
             logerr=log.debug,
             timeout=60,
         )
         suite.case_file.parent.mkdir(exist_ok=True, parents=True)
         suite.case_file.write_text("\n".join(sorted(res.splitlines())))
+        suite.invalidate_cache()
+
+        manifest.record("sources", sources, root)
+        manifest.save(suite.manifest_file)
 
         # TODO: Compute distribution.csv
 
     if decompile:
         log.info("Decompiling")
-        for cl in suite.classes():
+        outdated = [
+            cl
+            for cl in suite.classes()
+            if manifest.changed("classes", [suite.classfile(cl)], root)
+            or not suite.decompiledfile(cl).exists()
+            or manifest.changed("decompiled", [suite.decompiledfile(cl)], root)
+        ]
+        if not outdated:
+            log.info("Decompiled classes are up to date")
+
+        def decompile_class(cl):
             log.info(f"Decompiling {cl}")
-            res, t = run(
-                cmd
-                + [
+            res, t = container.run(
+                [
                     "jvm2json",
                     "-s",
                     _rel(suite.classfile(cl)),
@@ -590,60 +862,50 @@ def build(suite, compile, decompile, document, test, docker):
             file.parent.mkdir(exist_ok=True, parents=True)
             with open(file, "w") as f:
                 json.dump(json.loads(res), f, indent=2, sort_keys=True)
+            return file
+
+        # the work is done by jvm2json, so threads are enough
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            files = executor.map(decompile_class, outdated)
+            for cl, file in zip(outdated, files):
+                suite.invalidate_class(cl)
+                manifest.record("classes", [suite.classfile(cl)], root)
+                manifest.record("decompiled", [file], root)
+        manifest.save(suite.manifest_file)
+        opstats.opcode_stats(suite)
         log.success("Done decompiling")
 
     if document:
         log.info("Documenting")
+        stats = opstats.opcode_stats(suite)
         opcode_counts = Counter()
-        opcode_urls = {}
         class_opcodes = {}
         for case in suite.cases:
-            class_opcodes[str(case.methodid.classname).split(".")[-1]] = set()
-            list_ops = []
-            for opcode in suite.method_opcodes(case.methodid):
-                index = opcode.mnemonic()  # opcode.real().split()[0]
-                list_ops.append(index)
-
-                opcode_urls[index] = (
-                    opcode.mnemonic(),
-                    opcode.url(),
-                    opcode,
-                )
-
-                opcode_counts[index] += 1
-
-            for o in list_ops:
-                class_opcodes[str(case.methodid.classname).split(".")[-1]].add(o)
+            histogram = stats.method(case.methodid)
+            opcode_counts.update(histogram)
+            classname = str(case.methodid.classname).split(".")[-1]
+            class_opcodes.setdefault(classname, set()).update(histogram)
 
         with open("OPCODES.md", "w") as document:
             document.write("#Bytecode instructions\n")
             document.write("| Mnemonic | Opcode Name |  Exists in |  Count |\n")
             document.write("| :---- | :---- | :----- | -----: |\n")
 
-            for op, count in opcode_counts.most_common():
-                (mnemonic, url, opcode) = opcode_urls[op]
+            for op, count in sorted(opcode_counts.items(), key=lambda a: -a[1]):
+                info = stats.opcodes[op]
                 in_classes = ""
 
                 for classname in class_opcodes:
                     if op in class_opcodes[classname]:
                         in_classes += " " + classname
 
-                folder = Path(getsourcefile(opcode.__class__)).parent
-                while folder.name != "jpamb":
-                    folder = folder.parent
-
-                root = folder.parent
-
-                rel = Path(getsourcefile(opcode.__class__)).relative_to(root)
-                giturl = f"{rel}?plain=1#L{getsourcelines(opcode.__class__)[1]}"
-
                 document.write(
                     " | ["
-                    + mnemonic
+                    + op
                     + "]("
-                    + url
+                    + info.url
                     + ") | "
-                    + f"[{opcode.__class__.__name__}]({giturl})"
+                    + f"[{info.name}]({info.source})"
                     + " | "
                     + in_classes
                     + " | "
@@ -654,35 +916,39 @@ def build(suite, compile, decompile, document, test, docker):
     if test:
         log.info("Testing")
 
+        # a case is tested again if the class file of any class it can call
+        # changes, or the class file of the runtime that runs it
+        tested = manifest.section("tests")
+        file_hashes = {}
+
+        def dependency_hash(case: model.Case) -> str:
+            digest = hashlib.sha256()
+            for file in suite.dependencies(case.methodid):
+                if file not in file_hashes:
+                    file_hashes[file] = model.file_hash(file)
+                digest.update(file_hashes[file].encode())
+            return digest.hexdigest()
+
+        case_hashes = {}
+        cases = []
         for case in suite.cases:
-            log.info(f"Testing {case}")
-
-            folder = suite.classfiles_folder
-
-            try:
-                res, x = run(
-                    cmd
-                    + [
-                        "java",
-                        "-cp",
-                        _rel(folder),
-                        "-ea",
-                        "jpamb.Runtime",
-                        case.methodid.encode(),
-                        case.input.encode(),
-                    ],
-                    logout=log.info,
-                    logerr=log.debug,
-                    timeout=2,
-                )
-            except subprocess.TimeoutExpired:
-                res = "*"
+            case_hashes[case] = dependency_hash(case)
+            if tested.get(case.encode()) == case_hashes[case]:
+                log.debug(f"Already tested {case}")
+            else:
+                cases.append(case)
 
+        log.info(f"Testing {len(cases)} cases")
+        folder = suite.classfiles_folder
+        for case, res in run_cases(container, _rel(folder), cases, timeout=2):
             if case.result == res.strip():
                 log.success(f"Correct {case}")
+                tested[case.encode()] = case_hashes[case]
             else:
                 log.error(f"Incorrect (got {res.strip()}) expected {case}")
+                tested.pop(case.encode(), None)
 
+        manifest.save(suite.manifest_file)
         log.success("Done testing")
 
 
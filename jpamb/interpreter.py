@@ -0,0 +1,747 @@
+"""
+jpamb.interpreter
+
+This module provides a reference interpreter, which executes the cases
+concretely using the table driven semantics in 'SEMANTICS'.
+
+Every opcode is compiled once into a step function, which takes the
+'State' and the current 'Frame', and returns None to continue or the
+result of the case, e.g. "ok" or "divide by zero". Values are plain
+python values: ints for int, boolean and char, floats, str for strings,
+None for null, and 'JavaArray' and 'JavaObject' for the rest.
+
+Override the semantics of some opcodes by copying the table:
+
+    semantics = SEMANTICS.copy()
+
+    @semantics.register(jvm.Push)
+    def push(op): ...
+
+    Interpreter(suite, semantics).run(methodid, input)
+
+Attach a 'jpamb.tracer.Tracer' to observe the execution, without a tracer
+the interpreter runs without any tracing overhead. The opcodes fused into
+a superinstruction are reported one by one, at their own offsets.
+
+"""
+
+from dataclasses import dataclass
+from typing import Callable
+
+from jpamb import jvm
+from jpamb.callgraph import dotted
+from jpamb.model import Input, Suite
+from jpamb.tracer import Tracer, is_branch
+
+
+class JavaArray:
+    """An array on the heap"""
+
+    __slots__ = ("type", "items")
+
+    def __init__(self, type: jvm.Type, items: list):
+        self.type = type
+        self.items = items
+
+    def __repr__(self):
+        return f"JavaArray({self.type}, {self.items!r})"
+
+
+class JavaObject:
+    """An object on the heap"""
+
+    __slots__ = ("classname", "fields")
+
+    def __init__(self, classname: jvm.ClassName):
+        self.classname = classname
+        self.fields = {}
+
+    def __repr__(self):
+        return f"JavaObject({self.classname})"
+
+
+class Frame:
+    """A method frame, with the compiled code of the method."""
+
+    __slots__ = ("method", "code", "locals", "stack", "pc")
+
+    def __init__(self, method: jvm.AbsMethodID, code: list["Step"], locals: list):
+        self.method = method
+        self.code = code
+        self.locals = locals
+        self.stack = []
+        self.pc = 0
+
+    def __repr__(self):
+        return f"<{self.locals}, {self.stack}, {self.method}:{self.pc}>"
+
+
+@dataclass
+class State:
+    interpreter: "Interpreter"
+    frames: list[Frame]
+
+    def __str__(self):
+        return " ".join(repr(f) for f in self.frames)
+
+
+type Step = Callable[[State, Frame], str | None]
+
+SEMANTICS = jvm.Semantics()
+"""The reference semantics of the opcodes."""
+
+EXCEPTIONS = {
+    "AssertionError": "assertion error",
+    "ArithmeticException": "divide by zero",
+    "ArrayIndexOutOfBoundsException": "out of bounds",
+    "NullPointerException": "null pointer",
+}
+"""The results of the exceptions, by their simple class name."""
+
+
+def throw(classname: jvm.ClassName | str) -> str:
+    """The result of throwing an exception, as exceptions are never caught."""
+    name = str(classname).replace("/", ".").rsplit(".", 1)[-1]
+    try:
+        return EXCEPTIONS[name]
+    except KeyError:
+        raise NotImplementedError(f"Unhandled exception {classname}") from None
+
+
+def i32(x: int) -> int:
+    return (x + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+
+
+def java_div(a: int, b: int) -> int:
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def from_value(value: jvm.Value):
+    """Convert an input value to the representation of the interpreter."""
+    match value.type:
+        case jvm.Boolean():
+            return int(value.value)
+        case jvm.Char():
+            return ord(value.value)
+        case jvm.Array(contains=contains):
+            if value.value is None:
+                return None
+            items = [from_value(jvm.Value(contains, v)) for v in value.value]
+            return JavaArray(contains, items)
+    return value.value
+
+
+def default(type: jvm.Type):
+    match type:
+        case jvm.Float() | jvm.Double():
+            return 0.0
+        case jvm.Int() | jvm.Boolean() | jvm.Char() | jvm.Short() | jvm.Byte():
+            return 0
+    return None
+
+
+@SEMANTICS.register(jvm.Push)
+def push(op: jvm.Push) -> Step:
+    value = from_value(op.value)
+
+    def step(state: State, frame: Frame):
+        frame.stack.append(value)
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.Load)
+def load(op: jvm.Load) -> Step:
+    index = op.index
+
+    def step(state: State, frame: Frame):
+        frame.stack.append(frame.locals[index])
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.Store)
+def store(op: jvm.Store) -> Step:
+    index = op.index
+
+    def step(state: State, frame: Frame):
+        locals = frame.locals
+        if index >= len(locals):
+            locals.extend([None] * (index + 1 - len(locals)))
+        locals[index] = frame.stack.pop()
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.Dup)
+def dup(op: jvm.Dup) -> Step:
+    if op.words != 1:
+        raise NotImplementedError(f"Unhandled {op!r}")
+
+    def step(state: State, frame: Frame):
+        frame.stack.append(frame.stack[-1])
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.Incr)
+def incr(op: jvm.Incr) -> Step:
+    index, amount = op.index, op.amount
+
+    def step(state: State, frame: Frame):
+        frame.locals[index] = i32(frame.locals[index] + amount)
+        frame.pc += 1
+
+    return step
+
+
+INT_BINARY: dict[jvm.BinaryOpr, Callable[[int, int], int]] = {
+    jvm.BinaryOpr.Add: lambda a, b: i32(a + b),
+    jvm.BinaryOpr.Sub: lambda a, b: i32(a - b),
+    jvm.BinaryOpr.Mul: lambda a, b: i32(a * b),
+    jvm.BinaryOpr.Div: lambda a, b: i32(java_div(a, b)),
+    jvm.BinaryOpr.Rem: lambda a, b: a - b * java_div(a, b),
+}
+
+FLOAT_BINARY: dict[jvm.BinaryOpr, Callable[[float, float], float]] = {
+    jvm.BinaryOpr.Add: lambda a, b: a + b,
+    jvm.BinaryOpr.Sub: lambda a, b: a - b,
+    jvm.BinaryOpr.Mul: lambda a, b: a * b,
+    jvm.BinaryOpr.Div: lambda a, b: (
+        a / b if b != 0 else (a * float("inf") if a != 0 else float("nan"))
+    ),
+    jvm.BinaryOpr.Rem: lambda a, b: (
+        a - b * int(a / b) if b != 0 else float("nan")
+    ),
+}
+
+
+@SEMANTICS.register(jvm.Binary)
+def binary(op: jvm.Binary) -> Step:
+    match op.type:
+        case jvm.Int():
+            fn = INT_BINARY[op.operant]
+            checked = op.operant in (jvm.BinaryOpr.Div, jvm.BinaryOpr.Rem)
+        case jvm.Float() | jvm.Double():
+            fn = FLOAT_BINARY[op.operant]
+            checked = False
+        case _:
+            raise NotImplementedError(f"Unhandled {op!r}")
+
+    def step(state: State, frame: Frame):
+        stack = frame.stack
+        b = stack.pop()
+        a = stack.pop()
+        if checked and b == 0:
+            return "divide by zero"
+        stack.append(fn(a, b))
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.CompareFloating)
+def compare_floating(op: jvm.CompareFloating) -> Step:
+    nan_value = op.nan_value
+
+    def step(state: State, frame: Frame):
+        b = frame.stack.pop()
+        a = frame.stack.pop()
+        if a > b:
+            frame.stack.append(1)
+        elif a < b:
+            frame.stack.append(-1)
+        elif a == b:
+            frame.stack.append(0)
+        else:
+            frame.stack.append(nan_value)
+        frame.pc += 1
+
+    return step
+
+
+def to_int(v: int | float) -> int:
+    """Convert to an int, wrapping ints like l2i and saturating floats like
+    f2i and d2i, where NaN is 0."""
+    if not isinstance(v, float):
+        return i32(v)
+    if v != v:
+        return 0
+    if v >= 0x7FFFFFFF:
+        return 0x7FFFFFFF
+    if v <= -0x80000000:
+        return -0x80000000
+    return int(v)
+
+
+CAST: dict[type[jvm.Type], Callable] = {
+    jvm.Int: to_int,
+    jvm.Short: lambda v: (int(v) + 0x8000 & 0xFFFF) - 0x8000,
+    jvm.Byte: lambda v: (int(v) + 0x80 & 0xFF) - 0x80,
+    jvm.Char: lambda v: int(v) & 0xFFFF,
+    jvm.Float: float,
+    jvm.Double: float,
+}
+
+
+@SEMANTICS.register(jvm.Cast)
+def cast(op: jvm.Cast) -> Step:
+    try:
+        fn = CAST[type(op.to_)]
+    except KeyError:
+        raise NotImplementedError(f"Unhandled {op!r}") from None
+
+    def step(state: State, frame: Frame):
+        frame.stack.append(fn(frame.stack.pop()))
+        frame.pc += 1
+
+    return step
+
+
+CONDITIONS: dict[str, Callable] = {
+    "eq": lambda a, b: a == b,
+    "ne": lambda a, b: a != b,
+    "lt": lambda a, b: a < b,
+    "le": lambda a, b: a <= b,
+    "gt": lambda a, b: a > b,
+    "ge": lambda a, b: a >= b,
+    "is": lambda a, b: a is b,
+    "isnot": lambda a, b: a is not b,
+}
+
+
+@SEMANTICS.register(jvm.If)
+def if_(op: jvm.If) -> Step:
+    cond, target = CONDITIONS[op.condition], op.target
+
+    def step(state: State, frame: Frame):
+        b = frame.stack.pop()
+        a = frame.stack.pop()
+        frame.pc = target if cond(a, b) else frame.pc + 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.Ifz)
+def ifz(op: jvm.Ifz) -> Step:
+    cond, target = CONDITIONS[op.condition], op.target
+    zero = None if op.condition in ("is", "isnot") else 0
+
+    def step(state: State, frame: Frame):
+        a = frame.stack.pop()
+        frame.pc = target if cond(a, zero) else frame.pc + 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.Goto)
+def goto(op: jvm.Goto) -> Step:
+    target = op.target
+
+    def step(state: State, frame: Frame):
+        frame.pc = target
+
+    return step
+
+
+@SEMANTICS.register(jvm.Return)
+def return_(op: jvm.Return) -> Step:
+    has_value = op.type is not None
+
+    def step(state: State, frame: Frame):
+        frames = state.frames
+        frames.pop()
+        if not frames:
+            # some cases have the returned string as their result
+            if has_value and isinstance(result := frame.stack[-1], str):
+                return result
+            return "ok"
+        caller = frames[-1]
+        if has_value:
+            caller.stack.append(frame.stack.pop())
+        caller.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.Get)
+def get(op: jvm.Get) -> Step:
+    if not (op.static and op.field.extension.name == "$assertionsDisabled"):
+        raise NotImplementedError(f"Unhandled {op!r}")
+
+    def step(state: State, frame: Frame):
+        # assertions are always enabled
+        frame.stack.append(0)
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.New)
+def new(op: jvm.New) -> Step:
+    classname = op.classname
+
+    def step(state: State, frame: Frame):
+        frame.stack.append(JavaObject(classname))
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.Throw)
+def throw_(op: jvm.Throw) -> Step:
+    def step(state: State, frame: Frame):
+        exception = frame.stack.pop()
+        if exception is None:
+            return "null pointer"
+        return throw(exception.classname)
+
+    return step
+
+
+@SEMANTICS.register(jvm.NewArray)
+def new_array(op: jvm.NewArray) -> Step:
+    if op.dim != 1:
+        raise NotImplementedError(f"Unhandled {op!r}")
+    type, value = op.type, default(op.type)
+
+    def step(state: State, frame: Frame):
+        size = frame.stack.pop()
+        if size < 0:
+            return throw("NegativeArraySizeException")
+        frame.stack.append(JavaArray(type, [value] * size))
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.ArrayLength)
+def array_length(op: jvm.ArrayLength) -> Step:
+    def step(state: State, frame: Frame):
+        array = frame.stack.pop()
+        if array is None:
+            return "null pointer"
+        frame.stack.append(len(array.items))
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.ArrayLoad)
+def array_load(op: jvm.ArrayLoad) -> Step:
+    def step(state: State, frame: Frame):
+        index = frame.stack.pop()
+        array = frame.stack.pop()
+        if array is None:
+            return "null pointer"
+        if not 0 <= index < len(array.items):
+            return "out of bounds"
+        frame.stack.append(array.items[index])
+        frame.pc += 1
+
+    return step
+
+
+@SEMANTICS.register(jvm.ArrayStore)
+def array_store(op: jvm.ArrayStore) -> Step:
+    def step(state: State, frame: Frame):
+        value = frame.stack.pop()
+        index = frame.stack.pop()
+        array = frame.stack.pop()
+        if array is None:
+            return "null pointer"
+        if not 0 <= index < len(array.items):
+            return "out of bounds"
+        array.items[index] = value
+        frame.pc += 1
+
+    return step
+
+
+def substring(s: str, begin: int, end: int) -> str:
+    if not 0 <= begin <= end <= len(s):
+        raise IndexError(f"substring({begin}, {end}) of {s!r}")
+    return s[begin:end]
+
+
+STRING_METHODS: dict[str, Callable] = {
+    "length": len,
+    "charAt": lambda s, i: ord(s[i]),
+    "equals": lambda s, o: int(s == o),
+    "isEmpty": lambda s: int(not s),
+    "toUpperCase": str.upper,
+    "toLowerCase": str.lower,
+    "substring": lambda s, i, j=None: substring(s, i, len(s) if j is None else j),
+}
+"""The implemented methods of java.lang.String, with the receiver first."""
+
+
+def invoke(method: jvm.AbsMethodID, receiver: bool) -> Step:
+    """Invoke a method of the suite, with or without a receiver."""
+    method = dotted(method)
+    nargs = len(method.extension.params) + receiver
+
+    def step(state: State, frame: Frame):
+        stack = frame.stack
+        args = stack[len(stack) - nargs :]
+        del stack[len(stack) - nargs :]
+        if receiver and args[0] is None:
+            return "null pointer"
+        state.frames.append(state.interpreter.frame(method, args))
+
+    return step
+
+
+def native(method: jvm.AbsMethodID, fn: Callable) -> Step:
+    """Invoke a method implemented in python, on a receiver."""
+    nargs = len(method.extension.params) + 1
+    returns = method.extension.return_type is not None
+
+    def step(state: State, frame: Frame):
+        stack = frame.stack
+        args = stack[len(stack) - nargs :]
+        del stack[len(stack) - nargs :]
+        if args[0] is None:
+            return "null pointer"
+        try:
+            result = fn(*args)
+        except IndexError:
+            return throw("StringIndexOutOfBoundsException")
+        if returns:
+            stack.append(result)
+        frame.pc += 1
+
+    return step
+
+
+def is_java_class(cn: jvm.ClassName) -> bool:
+    return str(cn).replace("/", ".").startswith("java.")
+
+
+@SEMANTICS.register(jvm.InvokeStatic)
+def invoke_static(op: jvm.InvokeStatic) -> Step:
+    if is_java_class(op.method.classname):
+        raise NotImplementedError(f"Unhandled {op!r}")
+    return invoke(op.method, receiver=False)
+
+
+@SEMANTICS.register(jvm.InvokeSpecial)
+def invoke_special(op: jvm.InvokeSpecial) -> Step:
+    if not is_java_class(op.method.classname):
+        return invoke(op.method, receiver=True)
+    if op.method.extension.name != "<init>":
+        raise NotImplementedError(f"Unhandled {op!r}")
+    # the constructors of the java classes are not modelled
+    return native(op.method, lambda *args: None)
+
+
+@SEMANTICS.register(jvm.InvokeVirtual, jvm.InvokeInterface)
+def invoke_virtual(op: jvm.InvokeVirtual | jvm.InvokeInterface) -> Step:
+    method = op.method
+    if not is_java_class(method.classname):
+        return invoke(method, receiver=True)
+    cn = str(method.classname).replace("/", ".")
+    if cn == "java.lang.String" and method.extension.name in STRING_METHODS:
+        return native(method, STRING_METHODS[method.extension.name])
+    raise NotImplementedError(f"Unhandled {op!r}")
+
+
+def fused(steps: tuple[Step, ...]) -> Step:
+    """Execute the steps of a superinstruction as one step.
+
+    The steps keep their own updates of the pc, see 'jvm.Superinstruction'.
+    """
+
+    def step(state: State, frame: Frame):
+        for s in steps:
+            if (result := s(state, frame)) is not None:
+                return result
+
+    return step
+
+
+SUPERINSTRUCTIONS = {}
+"""Specialized steps for the superinstructions, by their opcode classes."""
+
+
+def superinstruction(*kinds: type[jvm.Opcode]):
+    def decorator(compile):
+        SUPERINSTRUCTIONS[kinds] = compile
+        return compile
+
+    return decorator
+
+
+@superinstruction(jvm.Load, jvm.Load, jvm.Binary)
+def load_load_binary(a: jvm.Load, b: jvm.Load, op: jvm.Binary) -> Step | None:
+    if op.type is not jvm.Int():
+        return None
+    i, j, fn = a.index, b.index, INT_BINARY[op.operant]
+    checked = op.operant in (jvm.BinaryOpr.Div, jvm.BinaryOpr.Rem)
+
+    def step(state: State, frame: Frame):
+        locals = frame.locals
+        if checked and locals[j] == 0:
+            frame.pc += 2
+            return "divide by zero"
+        frame.stack.append(fn(locals[i], locals[j]))
+        frame.pc += 3
+
+    return step
+
+
+@superinstruction(jvm.Load, jvm.Push, jvm.If)
+def load_push_if(a: jvm.Load, b: jvm.Push, op: jvm.If) -> Step:
+    i, value = a.index, from_value(b.value)
+    cond, target = CONDITIONS[op.condition], op.target
+
+    def step(state: State, frame: Frame):
+        frame.pc = target if cond(frame.locals[i], value) else frame.pc + 3
+
+    return step
+
+
+@superinstruction(jvm.Load, jvm.Load, jvm.If)
+def load_load_if(a: jvm.Load, b: jvm.Load, op: jvm.If) -> Step:
+    i, j = a.index, b.index
+    cond, target = CONDITIONS[op.condition], op.target
+
+    def step(state: State, frame: Frame):
+        locals = frame.locals
+        frame.pc = target if cond(locals[i], locals[j]) else frame.pc + 3
+
+    return step
+
+
+@superinstruction(jvm.Load, jvm.Ifz)
+def load_ifz(a: jvm.Load, op: jvm.Ifz) -> Step:
+    i = a.index
+    cond, target = CONDITIONS[op.condition], op.target
+    zero = None if op.condition in ("is", "isnot") else 0
+
+    def step(state: State, frame: Frame):
+        frame.pc = target if cond(frame.locals[i], zero) else frame.pc + 2
+
+    return step
+
+
+@superinstruction(jvm.Incr, jvm.Goto)
+def incr_goto(a: jvm.Incr, op: jvm.Goto) -> Step:
+    i, amount, target = a.index, a.amount, op.target
+
+    def step(state: State, frame: Frame):
+        frame.locals[i] = i32(frame.locals[i] + amount)
+        frame.pc = target
+
+    return step
+
+
+def unsupported(op: jvm.Opcode) -> Step:
+    """A step which fails, for opcodes without semantics."""
+
+    def step(state: State, frame: Frame):
+        raise NotImplementedError(f"No semantics for {op!r}")
+
+    return step
+
+
+class Interpreter:
+    """The reference interpreter, see the module documentation."""
+
+    def __init__(
+        self,
+        suite: Suite,
+        semantics: jvm.Semantics = SEMANTICS,
+        max_steps: int = 1000,
+        superinstructions: bool = False,
+        tracer: Tracer | None = None,
+    ):
+        self.suite = suite
+        self.semantics = semantics
+        self.max_steps = max_steps
+        self.superinstructions = superinstructions
+        self.tracer = tracer
+        self.steps = 0
+        self._code: dict[jvm.AbsMethodID, list[Step]] = {}
+        self._opcodes: dict[jvm.AbsMethodID, list[jvm.Opcode]] = {}
+
+    def compile(self, op: jvm.Opcode) -> Step:
+        """Compile an opcode, opcodes without semantics fail when executed."""
+        if isinstance(op, jvm.Superinstruction):
+            kinds = tuple(type(o) for o in op.opcodes)
+            # the specialized steps only apply with the reference semantics
+            if (compile := SUPERINSTRUCTIONS.get(kinds)) and all(
+                self.semantics.table.get(k) is SEMANTICS.table.get(k) for k in kinds
+            ):
+                if (step := compile(*op.opcodes)) is not None:
+                    return step
+            return fused(tuple(self.compile(o) for o in op.opcodes))
+        try:
+            return self.semantics.compile(op)
+        except NotImplementedError:
+            return unsupported(op)
+
+    def code(self, method: jvm.AbsMethodID) -> list[Step]:
+        """The compiled code of a method, compiled on first use."""
+        try:
+            return self._code[method]
+        except KeyError:
+            pass
+        cache = self.suite.method_cache(method)
+        opcodes = cache.superinstructions if self.superinstructions else cache.opcodes
+        self._opcodes[method] = opcodes
+        code = self._code[method] = [self.compile(op) for op in opcodes]
+        return code
+
+    def frame(self, method: jvm.AbsMethodID, args: list) -> Frame:
+        return Frame(method, self.code(method), args)
+
+    def run(self, method: jvm.AbsMethodID, input: Input) -> str:
+        """Run a case, returns "*" if it does not finish in max_steps.
+
+        The number of steps taken is stored in 'steps'.
+        """
+        args = [from_value(v) for v in input.values]
+        frames = [self.frame(method, args)]
+        state = State(self, frames)
+        if self.tracer is not None:
+            return self.traced(state, self.tracer)
+        for self.steps in range(1, self.max_steps + 1):
+            frame = frames[-1]
+            if (result := frame.code[frame.pc](state, frame)) is not None:
+                return result
+        return "*"
+
+    def traced(self, state: State, tracer: Tracer) -> str:
+        """Run like 'run', but report every step to the tracer."""
+        frames = state.frames
+        tracer.on_call(state, frames[0].method, frames[0].locals)
+        for self.steps in range(1, self.max_steps + 1):
+            frame = frames[-1]
+            method, offset, depth = frame.method, frame.pc, len(frames)
+            op, last = self._opcodes[method][offset], offset
+            if isinstance(op, jvm.Superinstruction):
+                # report the fused opcodes at their own offsets, so tracers
+                # see the same opcodes with and without superinstructions
+                for i, inner in enumerate(op.opcodes):
+                    tracer.on_step(state, method, offset + i, inner)
+                last = offset + len(op) - 1
+            else:
+                tracer.on_step(state, method, offset, op)
+            if (result := frame.code[offset](state, frame)) is not None:
+                return result
+            if len(frames) > depth:
+                tracer.on_call(state, frames[-1].method, frames[-1].locals)
+            elif len(frames) < depth:
+                value = frames[-1].stack[-1] if op.type is not None else None
+                tracer.on_return(state, method, value)
+            elif is_branch(op):
+                tracer.on_branch(state, method, last, frame.pc)
+            elif isinstance(op, (jvm.New, jvm.NewArray)):
+                tracer.on_alloc(state, method, offset, frame.stack[-1])
+        return "*"
@@ -1,2 +1,4 @@
 from jpamb.jvm.base import *
 from jpamb.jvm.opcode import *
+from jpamb.jvm.compact import *
+from jpamb.jvm.peephole import *
@@ -10,20 +10,38 @@ from jpamb import jvm
 
 """
 
+import array
 from collections import namedtuple
-from functools import total_ordering
+from functools import cached_property, total_ordering
 import re
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Callable, Protocol, Self, Iterable, Optional, Iterator, NoReturn
 
 
 @dataclass(frozen=True, order=True)
 class ClassName:
-    """The name of a class, inner classes must use the $ syntax"""
+    """The name of a class, inner classes must use the $ syntax
+
+    Class names are interned, so two class names are equal exactly when
+    they are the same object.
+    """
+
+    _instance = dict()
+
+    def __new__(cls, _as_string: str) -> "ClassName":
+        if (self := cls._instance.get(_as_string)) is None:
+            self = cls._instance[_as_string] = super().__new__(cls)
+        return self
 
     _as_string: str
 
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __reduce__(self):
+        return (ClassName, (self._as_string,))
+
     @property
     def packages(self) -> list[str]:
         """Get a list of packages"""
@@ -61,16 +79,82 @@ class ClassName:
 
     @staticmethod
     def decode(input: str) -> "ClassName":
-        return ClassName(input)
+        return ClassName._instance.get(input) or ClassName(input)
 
     @staticmethod
     def from_parts(*args: str) -> "ClassName":
         return ClassName(".".join(args))
 
 
+@dataclass
+class JsonMemo[T]:
+    """A structural memoization table for decoding jvm2json output.
+
+    The same few json shapes recur many times in the decompiled classes,
+    so each shape is decoded once and looked up by a canonical key after
+    that. The hits and misses are counted, see 'json_memo_stats'.
+    """
+
+    name: str
+    table: dict[object, T] = field(default_factory=dict)
+    hits: int = 0
+    misses: int = 0
+
+    def lookup(self, key, decode: Callable[[], T]) -> T:
+        """Find the value of key, or decode it if it is not yet known."""
+        try:
+            value = self.table[key]
+        except KeyError:
+            self.misses += 1
+            value = self.table[key] = decode()
+        else:
+            self.hits += 1
+        return value
+
+    def clear(self):
+        self.table.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self.table), "hits": self.hits, "misses": self.misses}
+
+
+TYPE_MEMO: JsonMemo["Type"] = JsonMemo("type")
+PARAMS_MEMO: JsonMemo["ParameterType"] = JsonMemo("params")
+METHOD_MEMO: JsonMemo["AbsMethodID"] = JsonMemo("method")
+VALUE_MEMO: JsonMemo["Value"] = JsonMemo("value")
+
+
+def json_memo_stats() -> dict[str, dict[str, int]]:
+    """The statistics of the json memoization tables."""
+    return {
+        m.name: m.stats() for m in (TYPE_MEMO, PARAMS_MEMO, METHOD_MEMO, VALUE_MEMO)
+    }
+
+
+def json_type_key(json) -> object:
+    """The canonical key of a json type, ignoring annotations."""
+    if isinstance(json, str):
+        return json
+    if "base" in json:
+        return json_type_key(json["base"])
+    match json.get("kind"):
+        case "array":
+            return ("array", json_type_key(json["type"]))
+        case "class":
+            return ("class", json["name"])
+    # Not a known shape, it will fail to decode below.
+    return ("unknown", repr(json))
+
+
 @total_ordering
 class Type(ABC):
-    """A jvm type"""
+    """A jvm type
+
+    Types are interned, so two types are equal exactly when they are the
+    same object. Types are ordered by their encoding.
+    """
 
     @abstractmethod
     def encode(self) -> str: ...
@@ -133,14 +217,26 @@ class Type(ABC):
 
         return r, input[i + 1 :]
 
+    @cached_property
+    def sort_key(self) -> str:
+        """The key types are ordered by, computed once per type"""
+        return self.encode()
+
     def __lt__(self, other):
-        return self.encode() <= other.encode()
+        if not isinstance(other, Type):
+            return NotImplemented
+        return self.sort_key < other.sort_key
 
-    def __eq__(self, other):
-        return self.encode() <= other.encode()
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
 
     @staticmethod
     def from_json(json: str) -> "Type":
+        return TYPE_MEMO.lookup(json_type_key(json), lambda: Type.decode_json(json))
+
+    @staticmethod
+    def decode_json(json: str) -> "Type":
+        """Decode a json type without memoization"""
         if isinstance(json, str):
             match json:
                 case "integer":
@@ -160,7 +256,8 @@ class Type(ABC):
                 case "string":
                     return String()
         if "base" in json:
-            return Type.from_json(json["base"])
+            # shares the key of the base, so no need to look it up again
+            return Type.decode_json(json["base"])
         if "kind" in json:
             match json["kind"]:
                 case "array":
@@ -187,14 +284,14 @@ class Type(ABC):
         return self.encode()
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class StackType(Type):
 
     def is_stacktype(self):
         return True
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Boolean(Type):
     """
     A boolean
@@ -214,7 +311,7 @@ class Boolean(Type):
         return "bool"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Int(StackType):
     """
     A 32bit signed integer
@@ -234,7 +331,7 @@ class Int(StackType):
         return "int"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Byte(Type):
     """
     An 8bit signed integer
@@ -254,7 +351,7 @@ class Byte(Type):
         return "byte"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Char(Type):
     """
     An 16bit character
@@ -274,7 +371,7 @@ class Char(Type):
         return "char"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Short(Type):
     """
     An 16bit signed integer
@@ -294,7 +391,7 @@ class Short(Type):
         return "short"
 
 
-@dataclass(frozen=True, order=True)
+@dataclass(frozen=True, eq=False)
 class Reference(StackType):
     """An unknown reference"""
 
@@ -312,7 +409,7 @@ class Reference(StackType):
         return "ref"
 
 
-@dataclass(frozen=True, order=True)
+@dataclass(frozen=True, eq=False)
 class Object(Type):
     """
     A reference to an object of an known class.
@@ -336,7 +433,7 @@ class Object(Type):
     def math(self):
         return f"object {self.name}"
 
-@dataclass(frozen=True, order=True)
+@dataclass(frozen=True, eq=False)
 class String(Type):
     _instance = None
     def __new__(cls) -> "String":
@@ -350,7 +447,7 @@ class String(Type):
     def math(self):
         return "string"
 
-@dataclass(frozen=True, order=True)
+@dataclass(frozen=True, eq=False)
 class Array(Type):
     """
     A reference to an array of known type
@@ -375,7 +472,7 @@ class Array(Type):
         return f"array {self.contains.math()}"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Long(StackType):
     """
     A 64bit signed integer
@@ -395,7 +492,7 @@ class Long(StackType):
         return "long"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Float(Type):
     """
     A 32bit floating point number
@@ -415,7 +512,7 @@ class Float(Type):
         return "float"
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, eq=False)
 class Double(StackType):
     """
     A 64bit floating point number
@@ -464,6 +561,19 @@ class ParameterType:
 
     @staticmethod
     def from_json(inputs: list[dict], annotated=False) -> "ParameterType":
+        if annotated:
+            for t in inputs:
+                assert "annotations" in t, f"parameters should be annotated was: {t}"
+            key = tuple(json_type_key(t["type"]) for t in inputs)
+        else:
+            key = tuple(json_type_key(t) for t in inputs)
+        return PARAMS_MEMO.lookup(
+            key, lambda: ParameterType.decode_json(inputs, annotated)
+        )
+
+    @staticmethod
+    def decode_json(inputs: list[dict], annotated=False) -> "ParameterType":
+        """Decode json parameters without memoization"""
         params: list[Type] = []
         for t in inputs:
             if annotated:
@@ -484,14 +594,36 @@ METHOD_ID_RE = re.compile(METHOD_ID_RE_RAW)
 
 @dataclass(frozen=True, order=True)
 class MethodID:
-    """A method ID consist of a name, a list of parameter types and a return type."""
+    """A method ID consist of a name, a list of parameter types and a return type.
+
+    Method ids are interned, so two method ids are equal exactly when they
+    are the same object.
+    """
+
+    _instance = dict()
+    _decoded = dict()
+
+    def __new__(cls, name: str, params: ParameterType, return_type: Type | None):
+        key = (name, params, return_type)
+        if (self := cls._instance.get(key)) is None:
+            self = cls._instance[key] = super().__new__(cls)
+        return self
 
     name: str
     params: ParameterType
     return_type: Type | None
 
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __reduce__(self):
+        return (MethodID, (self.name, self.params, self.return_type))
+
     @staticmethod
     def decode(input: str):
+        if (mid := MethodID._decoded.get(input)) is not None:
+            return mid
+
         if (match := METHOD_ID_RE.match(input)) is None:
             raise ValueError("invalid method name: %r", input)
 
@@ -503,11 +635,13 @@ class MethodID:
                     f"could not decode method id, bad return type {match['return']!r}"
                 )
 
-        return MethodID(
+        mid = MethodID(
             name=match["method_name"],
             params=ParameterType.decode(match["params"]),
             return_type=return_type,
         )
+        MethodID._decoded[input] = mid
+        return mid
 
     def encode(self) -> str:
         rt = self.return_type.encode() if self.return_type is not None else "V"
@@ -547,9 +681,30 @@ ABSOLUTE_RE = re.compile(r"(?P<class_name>.+)\.(?P<rest>.*)")
 
 @dataclass(frozen=True, order=True)
 class Absolute[T: Encodable](ABC):
+    """An absolute reference to a member of a class.
+
+    Absolute ids are interned, so two ids are equal exactly when they are
+    the same object.
+    """
+
+    _instance = dict()
+    _decoded = dict()
+
+    def __new__(cls, classname: ClassName, extension: T) -> "Self":
+        key = (cls, classname, extension)
+        if (self := cls._instance.get(key)) is None:
+            self = cls._instance[key] = super().__new__(cls)
+        return self
+
     classname: ClassName
     extension: T
 
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __reduce__(self):
+        return (self.__class__, (self.classname, self.extension))
+
     def __post_init__(self):
         assert (
             self.__class__ != Absolute
@@ -557,10 +712,15 @@ class Absolute[T: Encodable](ABC):
 
     @classmethod
     def decode(cls, input, decode: Callable[[str], T]) -> "Self":
+        if (absolute := cls._decoded.get((cls, input))) is not None:
+            return absolute
+
         if (match := ABSOLUTE_RE.match(input)) is None:
             raise ValueError("invalid absolute method name: %r", input)
 
-        return cls(ClassName.decode(match["class_name"]), decode(match["rest"]))
+        absolute = cls(ClassName.decode(match["class_name"]), decode(match["rest"]))
+        cls._decoded[(cls, input)] = absolute
+        return absolute
 
     def encode(self) -> str:
         return f"{self.classname.encode()}.{self.extension.encode()}"
@@ -581,6 +741,18 @@ class AbsMethodID(Absolute[MethodID]):
 
     @classmethod
     def from_json(cls, json: dict) -> "Self":
+        returns = json["returns"]
+        key = (
+            json["ref"]["name"],
+            json["name"],
+            tuple(json_type_key(t) for t in json["args"]),
+            json_type_key(returns) if returns is not None else None,
+        )
+        return METHOD_MEMO.lookup(key, lambda: cls.decode_json(json))
+
+    @classmethod
+    def decode_json(cls, json: dict) -> "Self":
+        """Decode a json method reference without memoization"""
         return cls(
             classname=ClassName.decode(json["ref"]["name"]),
             extension=MethodID(
@@ -625,6 +797,24 @@ class Value:
         vp.eof()
         return value
 
+    @staticmethod
+    def decode_bulk(inputs: Iterable[str]) -> list[list["Value"]]:
+        """Decode many comma seperated lists of values in one pass.
+
+        The distinct inputs are joined by newlines and scanned by a single
+        parser, so each distinct input is only decoded once.
+        """
+        inputs = list(inputs)
+        distinct = list(dict.fromkeys(inputs))
+        vp = ValueParser("\n".join(distinct))
+        decoded = {}
+        for i, input in enumerate(distinct):
+            decoded[input] = vp.parse_comma_seperated_values(end_by="END")
+            if i + 1 < len(distinct):
+                vp.expect("END")
+        vp.eof()
+        return [list(decoded[input]) for input in inputs]
+
     def encode(self) -> str:
         match self.type:
             case Boolean():
@@ -679,6 +869,21 @@ class Value:
 
     @classmethod
     def from_json(cls, json: dict | None) -> Self:
+        if json is None:
+            return VALUE_MEMO.lookup((cls, None), lambda: cls.decode_json(json))
+        value = json["value"]
+        if isinstance(value, (int, float, str)):
+            # the type of the value is in the key, as 1 == 1.0 == True, and
+            # floats are keyed by repr, as 0.0 == -0.0 and nan != nan
+            if isinstance(value, float):
+                value = repr(value)
+            key = (cls, json_type_key(json["type"]), type(json["value"]), value)
+            return VALUE_MEMO.lookup(key, lambda: cls.decode_json(json))
+        return cls.decode_json(json)
+
+    @classmethod
+    def decode_json(cls, json: dict | None) -> Self:
+        """Decode a json value without memoization"""
         if json is None:
             return cls(Reference(), None)
         try:
@@ -688,6 +893,10 @@ class Value:
 
         return cls(type, json["value"])
 
+    def compact(self) -> "CompactValue | Value":
+        """Get the compact representation of the value, if it has one."""
+        return CompactValue.from_value(self)
+
     def __str__(self) -> str:
         return self.math()
 
@@ -695,35 +904,315 @@ class Value:
         return f"({self.type.math()} {self.value})"
 
 
+class CompactValue:
+    """A compact jvm value.
+
+    Compact values are small slotted structs tagged by their class, which
+    are cheaper to create than a 'Value'. They have the same 'type' and
+    'value' attributes, and compare equal to the 'Value' they represent.
+    Compact values are shared, and should never be mutated.
+    """
+
+    __slots__ = ("value",)
+
+    type: Type
+    _by_type: dict[Type, type["CompactValue"]] = {}
+
+    def __init__(self, value: object):
+        self.value = value
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "type" in cls.__dict__:
+            CompactValue._by_type[cls.type] = cls
+
+    @staticmethod
+    def from_value(value: Value) -> "CompactValue | Value":
+        """Convert a value to a compact value, values of types without a
+        compact representation are returned as is."""
+        if (cls := CompactValue._by_type.get(value.type)) is None:
+            return value
+        return cls.of(value.value)
+
+    @classmethod
+    def of(cls, value) -> Self:
+        return cls(value)
+
+    def to_value(self) -> Value:
+        return Value(self.type, self.value)
+
+    def encode(self) -> str:
+        return self.to_value().encode()
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, (CompactValue, Value)):
+            return NotImplemented
+        return self.type is other.type and self.value == other.value
+
+    def __hash__(self):
+        return hash((self.type, self.value))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.value!r})"
+
+    def __str__(self) -> str:
+        return self.math()
+
+    def math(self) -> str:
+        return f"({self.type.math()} {self.value})"
+
+
+class CompactInt(CompactValue):
+    """A compact int, small ints are cached."""
+
+    __slots__ = ()
+    type = Int()
+
+    @classmethod
+    def of(cls, value: int) -> "CompactInt":
+        if -128 <= value < 1024:
+            return _SMALL_INTS[value + 128]
+        return cls(value)
+
+    def encode(self) -> str:
+        return str(self.value)
+
+
+_SMALL_INTS = tuple(CompactInt(i) for i in range(-128, 1024))
+
+
+class CompactBoolean(CompactValue):
+    """A compact boolean, there are only two."""
+
+    __slots__ = ()
+    type = Boolean()
+
+    @classmethod
+    def of(cls, value: bool) -> "CompactBoolean":
+        return _TRUE if value else _FALSE
+
+    def encode(self) -> str:
+        return "true" if self.value else "false"
+
+
+_TRUE = CompactBoolean(True)
+_FALSE = CompactBoolean(False)
+
+
+class CompactChar(CompactValue):
+    """A compact char."""
+
+    __slots__ = ()
+    type = Char()
+
+    def encode(self) -> str:
+        return f"'{self.value}'"
+
+
+class CompactFloat(CompactValue):
+    """A compact float."""
+
+    __slots__ = ()
+    type = Float()
+
+    def encode(self) -> str:
+        return str(self.value)
+
+
+class CompactString(CompactValue):
+    """A compact string."""
+
+    __slots__ = ()
+    type = String()
+
+
+class CompactReference(CompactValue):
+    """A compact reference, null is cached."""
+
+    __slots__ = ()
+    type = Reference()
+
+    @classmethod
+    def of(cls, value) -> "CompactReference":
+        if value is None:
+            return _NULL
+        return cls(value)
+
+
+_NULL = CompactReference(None)
+
+
+# The array.array typecodes of 32 bit ints and 16 bit chars
+INT32 = next(code for code in "ilq" if array.array(code).itemsize == 4)
+UTF16 = "H"
+
+
+class CompactArray(CompactValue):
+    """A compact array backed by a buffer.
+
+    The value is a read-only memoryview over an 'array.array', so the
+    length is O(1) and slicing does not copy. Like other compact values
+    arrays are immutable, use 'replace' to get a changed copy.
+    """
+
+    __slots__ = ()
+    typecode: str
+    prefix: str
+
+    value: memoryview
+
+    @classmethod
+    def of(cls, content: Iterable) -> Self:
+        """Copy the content into a new array."""
+        return cls.from_buffer(array.array(cls.typecode, content))
+
+    @classmethod
+    def from_buffer(cls, buffer: array.array) -> Self:
+        """Wrap a buffer, which must not be changed afterwards."""
+        return cls(memoryview(buffer).toreadonly())
+
+    @classmethod
+    def decode(cls, input: str) -> Self:
+        """Decode an array in the wire format, e.g. '[I:1, 2]'.
+
+        The elements are parsed straight into the buffer, unless the input
+        has to be tokenized.
+        """
+        if not input.startswith(cls.prefix) or not input.endswith("]"):
+            raise ValueError(f"Expected {cls.prefix}...], but got {input!r}")
+        vp = ValueParser(input)
+        body = vp.scan_array_body(len(cls.prefix), cls.prefix)
+        if body is None:
+            return cls.of(vp.parse_array().value)
+        vp.eof()
+        return cls.from_buffer(array.array(cls.typecode, cls.scan_units(body)))
+
+    @staticmethod
+    def scan_units(body: str) -> Iterable:
+        """The units of the elements in the content of an array."""
+        return map(int, body.split(",")) if body.strip(" \t") else ()
+
+    @staticmethod
+    def to_unit(element):
+        return element
+
+    @staticmethod
+    def from_unit(unit):
+        return unit
+
+    def __len__(self) -> int:
+        return len(self.value)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.__class__(self.value[index])
+        return self.from_unit(self.value[index])
+
+    def replace(self, index: int, element) -> Self:
+        """A copy of the array with the element at index replaced."""
+        buffer = array.array(self.typecode, self.value)
+        buffer[index] = self.to_unit(element)
+        return self.from_buffer(buffer)
+
+    def __iter__(self):
+        return map(self.from_unit, self.value)
+
+    def to_value(self) -> Value:
+        return Value(self.type, tuple(self))
+
+    def encode(self) -> str:
+        return self.prefix + ", ".join(self.encode_elements()) + "]"
+
+    def encode_elements(self) -> Iterable[str]:
+        return map(str, self.value.tolist())
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, (CompactValue, Value)):
+            return NotImplemented
+        return self.type is other.type and tuple(self) == tuple(other.value)
+
+    def __hash__(self):
+        return hash((self.type, tuple(self)))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.value.tolist()!r})"
+
+    def math(self) -> str:
+        return f"({self.type.math()} {tuple(self)})"
+
+
+class CompactIntArray(CompactArray):
+    """An int array backed by a buffer of 32 bit ints."""
+
+    __slots__ = ()
+    type = Array(Int())
+    typecode = INT32
+    prefix = "[I:"  # ]
+
+
+class CompactCharArray(CompactArray):
+    """A char array backed by a buffer of UTF-16 code units."""
+
+    __slots__ = ()
+    type = Array(Char())
+    typecode = UTF16
+    prefix = "[C:"  # ]
+
+    to_unit = staticmethod(ord)
+    from_unit = staticmethod(chr)
+
+    @classmethod
+    def of(cls, content: Iterable[str]) -> Self:
+        return super().of(map(ord, content))
+
+    @staticmethod
+    def scan_units(body: str) -> Iterable:
+        return map(ord, CHAR_RE.findall(body))
+
+    def encode_elements(self) -> Iterable[str]:
+        return map("'{}'".format, self)
+
+
+VALUE_TOKENS = [
+    ("OPEN_ARRAY", r"\[[IC]:"),
+    ("CLOSE_ARRAY", r"\]"),
+    ("STRING", r'"(?:[^"\\]|\\.)*"'),
+    ("FLOAT", r"-?\d+\.\d+"),
+    ("INT", r"-?\d+"),
+    ("BOOL", r"true|false"),
+    ("CHAR", r"'[^']'"),
+    ("COMMA", r","),
+    ("END", r"\n"),
+    ("SKIP", r"[ \t]+"),
+]
+VALUE_TOKEN_RE = re.compile("|".join(f"(?P<{n}>{m})" for n, m in VALUE_TOKENS))
+
+# The contents of int and char arrays, which can be decoded without tokenizing
+INT_ARRAY_RE = re.compile(r"[ \t]*-?\d+(?:[ \t]*,[ \t]*-?\d+)*[ \t]*|[ \t]*")
+CHAR_ARRAY_RE = re.compile(r"[ \t]*'[^']'(?:[ \t]*,[ \t]*'[^']')*[ \t]*|[ \t]*")
+CHAR_RE = re.compile(r"'([^'])'")
+
+
 @dataclass
 class ValueParser:
     Token = namedtuple("Token", "kind value")
 
     input: str
     head: Optional["ValueParser.Token"]
-    _tokens: Iterator["ValueParser.Token"]
+    pos: int
 
     def __init__(self, input) -> None:
         self.input = input
-        self._tokens = ValueParser.tokenize(input)
+        self.pos = 0
         self.next()
 
     @staticmethod
     def tokenize(string):
-        token_specification = [
-            ("OPEN_ARRAY", r"\[[IC]:"),
-            ("CLOSE_ARRAY", r"\]"),
-            ("STRING", r'"(?:[^"\\]|\\.)*"'),
-            ("FLOAT", r"-?\d+\.\d+"),
-            ("INT", r"-?\d+"),
-            ("BOOL", r"true|false"),
-            ("CHAR", r"'[^']'"),
-            ("COMMA", r","),
-            ("SKIP", r"[ \t]+"),
-        ]
-        tok_regex = "|".join(f"(?P<{n}>{m})" for n, m in token_specification)
-
-        for m in re.finditer(tok_regex, string):
+        for m in VALUE_TOKEN_RE.finditer(string):
             kind, value = m.lastgroup, m.group()
             if kind == "SKIP":
                 continue
@@ -734,10 +1223,12 @@ class ValueParser:
         return ValueParser(string).parse_comma_seperated_values()
 
     def next(self):
-        try:
-            self.head = next(self._tokens)
-        except StopIteration:
-            self.head = None
+        while (m := VALUE_TOKEN_RE.search(self.input, self.pos)) is not None:
+            self.pos = m.end()
+            if (kind := m.lastgroup) != "SKIP":
+                self.head = ValueParser.Token(kind, m.group())
+                return
+        self.head = None
 
     def expected(self, expected) -> NoReturn:
         raise ValueError(f"Expected {expected} but got {self.head} in {self.input}")
@@ -796,6 +1287,7 @@ class ValueParser:
         return float(tok.value)
 
     def parse_array(self):
+        start = self.pos
         key = self.expect("OPEN_ARRAY")
         if key.value == "[I:":  # ]
             type = Array(Int())
@@ -806,12 +1298,38 @@ class ValueParser:
         else:
             self.expected("int or char array")
 
+        if (content := self.scan_array(start, key.value)) is not None:
+            return Value(type, content)
+
         inputs = self.parse_comma_seperated_values(parser, "CLOSE_ARRAY")
 
         self.expect("CLOSE_ARRAY")
 
         return Value(type, tuple(inputs))
 
+    def scan_array(self, start: int, kind: str) -> tuple | None:
+        """Decode the content of an array starting at start directly from
+        the input, or return None if it has to be tokenized."""
+        if (body := self.scan_array_body(start, kind)) is None:
+            return None
+        if kind == "[I:":  # ]
+            return tuple(map(int, body.split(","))) if body.strip(" \t") else ()
+        return tuple(CHAR_RE.findall(body))
+
+    def scan_array_body(self, start: int, kind: str) -> str | None:
+        """The content of an array starting at start, if it can be decoded
+        without tokenizing, the parser continues after the array."""
+        end = self.input.find("]", start)
+        if end == -1:
+            return None
+        body = self.input[start:end]
+        pattern = INT_ARRAY_RE if kind == "[I:" else CHAR_ARRAY_RE  # ]
+        if pattern.fullmatch(body) is None:
+            return None
+        self.pos = end + 1
+        self.next()
+        return body
+
     def parse_comma_seperated_values(self, parser=None, end_by=None):
         if self.head is None:
             return []
@@ -0,0 +1,149 @@
+"""
+jpamb.jvm.compact
+
+This module contains a columnar representation of the bytecode of a
+method, which stores each opcode as a row in a set of parallel arrays.
+
+"""
+
+from dataclasses import dataclass, field, fields
+from typing import Iterable
+
+import array
+
+from jpamb.jvm import base as jvm
+from jpamb.jvm.opcode import Opcode
+
+
+@dataclass(frozen=True)
+class OpcodeLayout:
+    """How the fields of an opcode class are placed in the columns."""
+
+    kind: type[Opcode]
+    ints: tuple[str, ...]
+    bools: frozenset[str]
+    type: str | None
+    target: bool
+    consts: tuple[str, ...]
+
+    @staticmethod
+    def of(kind: type[Opcode]) -> "OpcodeLayout":
+        ints, bools, consts = [], set(), []
+        type, target = None, False
+        for f in fields(kind):
+            if f.name == "offset":
+                continue
+            if f.name == "target":
+                target = True
+            elif f.type in (int, bool) and len(ints) < 2:
+                ints.append(f.name)
+                if f.type is bool:
+                    bools.add(f.name)
+            elif f.type in (jvm.Type, jvm.Type | None) and type is None:
+                type = f.name
+            else:
+                consts.append(f.name)
+        return OpcodeLayout(
+            kind, tuple(ints), frozenset(bools), type, target, tuple(consts)
+        )
+
+
+KINDS: tuple[type[Opcode], ...] = tuple(Opcode._registry.values())
+"""The opcode classes, a kind id is an index into this tuple."""
+
+LAYOUTS: tuple[OpcodeLayout, ...] = tuple(OpcodeLayout.of(k) for k in KINDS)
+
+KIND_IDS: dict[type[Opcode], int] = {k: i for i, k in enumerate(KINDS)}
+
+NO_OPERAND = -1
+"""The id of a missing type, target or constant."""
+
+
+def _column(typecode: str = jvm.INT32) -> array.array:
+    return array.array(typecode)
+
+
+@dataclass
+class CompactMethod:
+    """A method stored as parallel arrays, one row per opcode.
+
+    The columns are the kind of the opcode (an index into 'KINDS'), its
+    offset, up to two int operands, the id of its type in 'type_pool', its
+    branch target, and the id of its remaining operands in 'const_pool'.
+    Missing operands are 'NO_OPERAND'. Use 'LAYOUTS' to see which fields of an
+    opcode are placed in which column.
+    """
+
+    kinds: array.array = field(default_factory=lambda: _column("B"))
+    offsets: array.array = field(default_factory=_column)
+    arg1: array.array = field(default_factory=lambda: _column("q"))
+    arg2: array.array = field(default_factory=lambda: _column("q"))
+    types: array.array = field(default_factory=_column)
+    targets: array.array = field(default_factory=_column)
+    consts: array.array = field(default_factory=_column)
+    type_pool: list[jvm.Type | None] = field(default_factory=list)
+    const_pool: list[tuple] = field(default_factory=list)
+
+    @staticmethod
+    def from_opcodes(opcodes: Iterable[Opcode]) -> "CompactMethod":
+        method = CompactMethod()
+        type_ids: dict[jvm.Type | None, int] = {}
+        const_ids: dict[tuple, int] = {}
+
+        def intern(pool, ids, value, key=None):
+            key = value if key is None else key
+            if (i := ids.get(key)) is None:
+                i = ids[key] = len(pool)
+                pool.append(value)
+            return i
+
+        for op in opcodes:
+            kind = KIND_IDS[type(op)]
+            layout = LAYOUTS[kind]
+            ints = [int(getattr(op, name)) for name in layout.ints]
+            ints += [NO_OPERAND] * (2 - len(ints))
+            method.kinds.append(kind)
+            method.offsets.append(op.offset)
+            method.arg1.append(ints[0])
+            method.arg2.append(ints[1])
+            method.types.append(
+                intern(method.type_pool, type_ids, getattr(op, layout.type))
+                if layout.type
+                else NO_OPERAND
+            )
+            method.targets.append(op.target if layout.target else NO_OPERAND)
+            if layout.consts:
+                consts = tuple(getattr(op, name) for name in layout.consts)
+                # keyed by repr, as 0.0 == -0.0 and 1 == True
+                key = tuple((type(c), repr(c)) for c in consts)
+                method.consts.append(
+                    intern(method.const_pool, const_ids, consts, key)
+                )
+            else:
+                method.consts.append(NO_OPERAND)
+        return method
+
+    def to_opcodes(self) -> list[Opcode]:
+        with Opcode.trusted():
+            return [self[i] for i in range(len(self))]
+
+    def kind(self, i: int) -> type[Opcode]:
+        """The class of the i'th opcode."""
+        return KINDS[self.kinds[i]]
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, i: int) -> Opcode:
+        """Reconstruct the i'th opcode."""
+        layout = LAYOUTS[self.kinds[i]]
+        kwargs = {"offset": self.offsets[i]}
+        for name, column in zip(layout.ints, (self.arg1, self.arg2)):
+            kwargs[name] = bool(column[i]) if name in layout.bools else column[i]
+        if layout.type:
+            kwargs[layout.type] = self.type_pool[self.types[i]]
+        if layout.target:
+            kwargs["target"] = self.targets[i]
+        if layout.consts:
+            kwargs.update(zip(layout.consts, self.const_pool[self.consts[i]]))
+        return layout.kind(**kwargs)
@@ -7,9 +7,11 @@ each instruction.
 
 """
 
-from dataclasses import dataclass, fields
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field, fields
 from abc import ABC, abstractmethod
-from typing import Self
+from typing import Callable, ClassVar, Self
 
 import enum
 import sys
@@ -18,6 +20,11 @@ from jpamb.jvm import base as jvm
 
 logger.add(sys.stderr, format="[{level}] {message}")
 
+# Whether to check the types of the fields when constructing opcodes, see
+# 'Opcode.trusted'. It is a context variable, so skipping the validation in
+# one thread or task does not skip it in the others.
+_validate: ContextVar[bool] = ContextVar("validate", default=True)
+
 
 @dataclass(frozen=True, order=True)
 class Opcode(ABC):
@@ -25,79 +32,89 @@ class Opcode(ABC):
 
     offset: int
 
+    # The opcode classes by their "opr", or by ("opr", "access") for invokes.
+    _registry: ClassVar[dict[str | tuple[str, str], type["Opcode"]]] = {}
+
+    def __init_subclass__(
+        cls, opr: str | None = None, access: str | None = None, **kwargs
+    ):
+        super().__init_subclass__(**kwargs)
+        if opr is None:
+            return
+        key = opr if access is None else (opr, access)
+        assert key not in Opcode._registry, f"{key!r} is already registered"
+        Opcode._registry[key] = cls
+
     def __post_init__(self):
+        if not _validate.get():
+            return
         for f in fields(self):
             v = getattr(self, f.name)
             assert isinstance(
                 v, f.type
             ), f"Expected {f.name!r} to be type {f.type}, but was {v!r}, in {self!r}"
 
+    @staticmethod
+    @contextmanager
+    def trusted():
+        """Skip the validation of opcodes constructed in this context.
+
+        Only use this on input that has already been validated, e.g. by
+        `jpamb build` or `jpamb checkhealth`. This only affects the current
+        thread or asyncio task.
+        """
+        token = _validate.set(False)
+        try:
+            yield
+        finally:
+            _validate.reset(token)
+
     @classmethod
     def from_json(cls, json: dict) -> "Opcode":
-        match json["opr"]:
-            case "push":
-                opr = Push
-            case "newarray":
-                opr = NewArray
-            case "dup":
-                opr = Dup
-            case "array_store":
-                opr = ArrayStore
-            case "array_load":
-                opr = ArrayLoad
-            case "binary":
-                opr = Binary
-            case "store":
-                opr = Store
-            case "load":
-                opr = Load
-            case "comparefloating":
-                opr = CompareFloating
-            case "arraylength":
-                opr = ArrayLength
-            case "if":
-                opr = If
-            case "get":
-                opr = Get
-            case "ifz":
-                opr = Ifz
-            case "cast":
-                opr = Cast
-            case "new":
-                opr = New
-            case "throw":
-                opr = Throw
-            case "incr":
-                opr = Incr
-            case "goto":
-                opr = Goto
-            case "return":
-                opr = Return
-            case "invoke":
-                match json["access"]:
-                    case "virtual":
-                        opr = InvokeVirtual
-                    case "static":
-                        opr = InvokeStatic
-                    case "interface":
-                        opr = InvokeInterface
-                    case "special":
-                        opr = InvokeSpecial
-                    case "dynamic":
-                        opr = InvokeDynamic
-                    case access:
-                        raise NotImplementedError(
-                            f"Unhandled invoke access {access!r} (implement yourself)"
-                        )
-            case opr:
-                raise NotImplementedError(
-                    f"Unhandled opcode {opr!r} (implement yourself)"
-                )
+        try:
+            opr = Opcode._registry[json["opr"]]
+        except KeyError:
+            opr = Opcode._lookup_access(json)
         try:
             return opr.from_json(json)
         except NotImplementedError as e:
             raise NotImplementedError(f"Unhandled opcode {json!r}") from e
 
+    @staticmethod
+    def _lookup_access(json: dict) -> type["Opcode"]:
+        """Find an opcode which is also dispatched on its access, like invoke."""
+        try:
+            return Opcode._registry[json["opr"], json.get("access")]
+        except KeyError:
+            pass
+        if "access" in json:
+            raise NotImplementedError(
+                f"Unhandled {json['opr']} access {json['access']!r} (implement yourself)"
+            )
+        raise NotImplementedError(
+            f"Unhandled opcode {json['opr']!r} (implement yourself)"
+        )
+
+    @staticmethod
+    def decode_method(bytecode: list[dict], trusted: bool = False) -> list["Opcode"]:
+        """Decode the bytecode of a whole method.
+
+        The operands of the opcodes, types, values and method ids, are
+        interned, so equal operands are shared between the opcodes. If trusted,
+        the opcodes are not validated, see 'Opcode.trusted'.
+        """
+        registry = Opcode._registry
+        with Opcode.trusted() if trusted else nullcontext():
+            opcodes = []
+            for json in bytecode:
+                if (opr := registry.get(json["opr"])) is None:
+                    opr = Opcode._lookup_access(json)
+                try:
+                    opcodes.append(opr.from_json(json))
+                except NotImplementedError as e:
+                    raise NotImplementedError(f"Unhandled opcode {json!r}") from e
+        return opcodes
+
     def help(self):
         logger.warning("Instructions can be found at: " + self.url())
         if self.semantics():
@@ -118,7 +135,7 @@ class Opcode(ABC):
 
 
 @dataclass(frozen=True, order=True)
-class Push(Opcode):
+class Push(Opcode, opr="push"):
     """The push opcode"""
 
     value: jvm.Value
@@ -172,6 +189,13 @@ class Push(Opcode):
                     return "iconst_i"
                 else:
                     return "ldc"
+            case jvm.Float():
+                # fconst_<f> only pushes +0.0, 1.0 and 2.0
+                if repr(self.value.value) in ("0.0", "1.0", "2.0"):
+                    return "fconst_f"
+                return "ldc"
+            case jvm.String():
+                return "ldc"
             case jvm.Reference():
                 return "aconst_null"
 
@@ -182,7 +206,7 @@ class Push(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class NewArray(Opcode):
+class NewArray(Opcode, opr="newarray"):
     """The new array opcode"""
 
     type: jvm.Type
@@ -221,7 +245,7 @@ class NewArray(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class Dup(Opcode):
+class Dup(Opcode, opr="dup"):
     """The dublicate the stack opcode"""
 
     words: int
@@ -256,7 +280,7 @@ class Dup(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class ArrayStore(Opcode):
+class ArrayStore(Opcode, opr="array_store"):
     """The Array Store command that stores a value in the array."""
 
     type: jvm.Type
@@ -288,7 +312,7 @@ class ArrayStore(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class Cast(Opcode):
+class Cast(Opcode, opr="cast"):
     """Cast one type to another"""
 
     from_: jvm.Type
@@ -322,7 +346,7 @@ class Cast(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class ArrayLoad(Opcode):
+class ArrayLoad(Opcode, opr="array_load"):
     """The Array Load command that load a value from the array."""
 
     type: jvm.Type
@@ -356,7 +380,7 @@ class ArrayLoad(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class ArrayLength(Opcode):
+class ArrayLength(Opcode, opr="arraylength"):
     """
     arraylength:
      - Takes an array reference from the operand stack
@@ -390,7 +414,7 @@ class ArrayLength(Opcode):
 
 
 @dataclass(frozen=True, order=True)  # make it work for
-class InvokeVirtual(Opcode):
+class InvokeVirtual(Opcode, opr="invoke", access="virtual"):
     """The invoke virtual opcode for calling instance methods"""
 
     method: jvm.AbsMethodID
@@ -425,7 +449,7 @@ class InvokeVirtual(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class InvokeStatic(Opcode):
+class InvokeStatic(Opcode, opr="invoke", access="static"):
     """The invoke static opcode for calling static methods"""
 
     method: jvm.AbsMethodID
@@ -460,7 +484,7 @@ class InvokeStatic(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class InvokeInterface(Opcode):
+class InvokeInterface(Opcode, opr="invoke", access="interface"):
     """The invoke interface opcode for calling interface methods"""
 
     method: jvm.AbsMethodID
@@ -498,7 +522,7 @@ class InvokeInterface(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class InvokeSpecial(Opcode):
+class InvokeSpecial(Opcode, opr="invoke", access="special"):
     """The invoke special opcode for calling constructors, private methods,
     and superclass methods.
 
@@ -547,7 +571,7 @@ class InvokeSpecial(Opcode):
         return f"invoke special{interface_str} {self.method}"
 
 @dataclass(frozen=True, order=True)
-class InvokeDynamic(Opcode):
+class InvokeDynamic(Opcode, opr="invoke", access="dynamic"):
     """The invokedynamic opcode for dynamic method invocation.
     
     According to the JVM spec, invokedynamic:
@@ -599,7 +623,7 @@ class InvokeDynamic(Opcode):
         return f"invoke dynamic {self.name} {self.descriptor} (bootstrap={self.bootstrap_index})"
 
 @dataclass(frozen=True, order=True)
-class Store(Opcode):
+class Store(Opcode, opr="store"):
     """The store opcode that stores values to local variables"""
 
     type: jvm.Type
@@ -667,7 +691,7 @@ class BinaryOpr(enum.Enum):
 
 
 @dataclass(frozen=True, order=True)
-class Binary(Opcode):
+class Binary(Opcode, opr="binary"):
     type: jvm.Type
     operant: BinaryOpr
 
@@ -704,7 +728,7 @@ class Binary(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class Load(Opcode):
+class Load(Opcode, opr="load"):
     """The load opcode that loads values from local variables"""
 
     type: jvm.Type
@@ -742,7 +766,7 @@ class Load(Opcode):
         return f"load:{self.type} {self.index}"
 
 @dataclass(frozen=True, order=True)
-class CompareFloating(Opcode):
+class CompareFloating(Opcode, opr="comparefloating"):
     """The fcmp opcode that compares two floating point values.
     
     According to JVM spec:
@@ -783,7 +807,7 @@ class CompareFloating(Opcode):
         return f"fcmp{suffix} {self.type}"
 
 @dataclass(frozen=True, order=True)
-class If(Opcode):
+class If(Opcode, opr="if"):
     """The if opcode that performs conditional jumps based on comparison of two values.
 
     According to the JVM spec, if instructions:
@@ -848,7 +872,7 @@ class If(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class Get(Opcode):
+class Get(Opcode, opr="get"):
     """The get opcode that retrieves field values (static or instance).
 
     According to the JVM spec:
@@ -909,7 +933,7 @@ class Get(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class Ifz(Opcode):
+class Ifz(Opcode, opr="ifz"):
     """The ifz opcode that performs conditional jumps based on comparison with zero/null.
 
     According to the JVM spec, ifz instructions:
@@ -977,7 +1001,7 @@ class Ifz(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class New(Opcode):
+class New(Opcode, opr="new"):
     """The new opcode that creates a new instance of a class.
 
     According to the JVM spec:
@@ -1016,7 +1040,7 @@ class New(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class Throw(Opcode):
+class Throw(Opcode, opr="throw"):
     """The throw opcode that throws an exception object.
 
     According to the JVM spec:
@@ -1053,7 +1077,7 @@ class Throw(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class Incr(Opcode):
+class Incr(Opcode, opr="incr"):
     """The increment opcode that adds a constant value to a local variable.
 
     According to the JVM spec:
@@ -1095,7 +1119,7 @@ class Incr(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class Goto(Opcode):
+class Goto(Opcode, opr="goto"):
     """The goto opcode that performs an unconditional jump.
 
     According to the JVM spec:
@@ -1135,7 +1159,7 @@ class Goto(Opcode):
 
 
 @dataclass(frozen=True, order=True)
-class Return(Opcode):
+class Return(Opcode, opr="return"):
     """The return opcode that returns (with optional value) from a method.
 
     According to the JVM spec:
@@ -1202,3 +1226,40 @@ class Return(Opcode):
     def __str__(self):
         type = str(self.type) if self.type is not None else "V"
         return f"return:{type}"
+
+
+@dataclass
+class Semantics:
+    """A table of the executable semantics of the opcode classes.
+
+    The semantics of an opcode class is a function that compiles an opcode
+    into a step function, which executes the opcode. What a step function
+    takes and returns is up to the interpreter using the table, see
+    'jpamb.interpreter' for the reference interpreter. To override the
+    semantics of some opcodes, copy the table and register new functions.
+    """
+
+    table: dict[type[Opcode], Callable[[Opcode], Callable]] = field(
+        default_factory=dict
+    )
+
+    def register(self, *kinds: type[Opcode]):
+        """Register the decorated function as the semantics of kinds."""
+
+        def decorator(compile: Callable[[Opcode], Callable]):
+            for kind in kinds:
+                self.table[kind] = compile
+            return compile
+
+        return decorator
+
+    def compile(self, opcode: Opcode) -> Callable:
+        """Compile an opcode into its step function."""
+        try:
+            compile = self.table[type(opcode)]
+        except KeyError:
+            raise NotImplementedError(f"No semantics for {opcode!r}") from None
+        return compile(opcode)
+
+    def copy(self) -> "Semantics":
+        return Semantics(dict(self.table))
@@ -0,0 +1,88 @@
+"""
+jpamb.jvm.peephole
+
+This module contains a peephole pass, which fuses common sequences of
+opcodes into superinstructions, so interpreters dispatch fewer times.
+
+"""
+
+from dataclasses import dataclass
+from typing import Iterable
+
+from jpamb.jvm.opcode import Binary, Goto, If, Ifz, Incr, Load, Opcode, Push
+
+PATTERNS: tuple[tuple[type[Opcode], ...], ...] = (
+    (Load, Load, Binary),
+    (Load, Push, If),
+    (Load, Load, If),
+    (Load, Ifz),
+    (Incr, Goto),
+)
+"""The sequences to fuse, the longest matching sequence is preferred."""
+
+
+@dataclass(frozen=True, order=True)
+class Superinstruction(Opcode):
+    """A sequence of opcodes which are executed as one.
+
+    A superinstruction replaces the first opcode of the sequence, and the
+    rest of the sequence is kept in place, so the indices of the method
+    are unchanged. Only the last opcode in the sequence may branch, and
+    no other opcode than the first is the target of a branch, so after the
+    superinstruction is executed the execution continues at the index
+    after the sequence, or at the target of the last opcode.
+    """
+
+    opcodes: tuple
+
+    def real(self) -> str:
+        return "; ".join(op.real() for op in self.opcodes)
+
+    def semantics(self) -> str | None:
+        return None
+
+    def mnemonic(self) -> str:
+        return "+".join(op.mnemonic() for op in self.opcodes)
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    def __str__(self):
+        return "super[" + "; ".join(str(op) for op in self.opcodes) + "]"
+
+
+def branch_targets(opcodes: Iterable[Opcode]) -> set[int]:
+    return {op.target for op in opcodes if isinstance(op, (Goto, If, Ifz))}
+
+
+def fuse(
+    opcodes: Iterable[Opcode],
+    patterns: Iterable[tuple[type[Opcode], ...]] = PATTERNS,
+) -> tuple[Opcode, ...]:
+    """Fuse the sequences matching the patterns into superinstructions.
+
+    The result has the same length as the input, and the opcode at index
+    i is either the original opcode, or a 'Superinstruction' whose first
+    opcode is the original opcode.
+    """
+    opcodes = tuple(opcodes)
+    patterns = sorted(patterns, key=len, reverse=True)
+    targets = branch_targets(opcodes)
+    result = list(opcodes)
+    i = 0
+    while i < len(opcodes):
+        for pattern in patterns:
+            end = i + len(pattern)
+            if end > len(opcodes):
+                continue
+            if not all(isinstance(op, p) for op, p in zip(opcodes[i:end], pattern)):
+                continue
+            if any(j in targets for j in range(i + 1, end)):
+                continue
+            result[i] = Superinstruction(opcodes[i].offset, opcodes[i:end])
+            i = end
+            break
+        else:
+            i += 1
+    return tuple(result)
+
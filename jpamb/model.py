@@ -6,7 +6,8 @@ This module provides the basic data model for working with the JPAMB.
 """
 
 from contextlib import contextmanager
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
 from loguru import logger
 import collections
@@ -16,10 +17,13 @@ import os
 import shutil
 import subprocess
 
-from typing import Iterable
+from typing import TYPE_CHECKING, Callable, Iterable
 
 from jpamb import jvm
 
+if TYPE_CHECKING:
+    from jpamb.callgraph import CallGraph
+
 
 @dataclass(frozen=True, order=True)
 class Input:
@@ -30,12 +34,29 @@ class Input:
     values: tuple[jvm.Value, ...]
 
     @staticmethod
+    @lru_cache(maxsize=1 << 16)
     def decode(input: str) -> "Input":
+        """Decode an input, inputs are cached by their string."""
         if input[0] != "(" and input[-1] != ")":
             raise ValueError(f"Expected input to be in parenthesis, but got {input}")
         values = jvm.Value.decode_many(input)
         return Input(tuple(values))
 
+    @staticmethod
+    def decode_bulk(inputs: Iterable[str]) -> list["Input"]:
+        """Decode many inputs in one pass, see 'jvm.Value.decode_bulk'."""
+        inputs = list(inputs)
+        for input in inputs:
+            if input[0] != "(" and input[-1] != ")":
+                raise ValueError(
+                    f"Expected input to be in parenthesis, but got {input}"
+                )
+        decoded = {}
+        for input, values in zip(inputs, jvm.Value.decode_bulk(inputs)):
+            if input not in decoded:
+                decoded[input] = Input(tuple(values))
+        return [decoded[input] for input in inputs]
+
     def encode(self) -> str:
         return "(" + ", ".join(v.encode() for v in self.values) + ")"
 
@@ -217,6 +238,92 @@ class Response:
         return total
 
 
+def file_hash(file: Path) -> str:
+    """The sha256 hash of the content of a file."""
+    import hashlib
+
+    with open(file, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+@dataclass
+class BuildManifest:
+    """The content hashes of the files used in the last build.
+
+    The hashes are grouped in sections, like "sources" or "classes", and
+    files are stored relative to the root of the suite. This is used by
+    'jpamb build' to only redo the work downstream of a change.
+    """
+
+    sections: dict[str, dict[str, str]] = field(default_factory=dict)
+
+    @staticmethod
+    def load(file: Path) -> "BuildManifest":
+        """Load the manifest, or an empty manifest if there is none."""
+        import json
+
+        try:
+            with open(file) as f:
+                return BuildManifest(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return BuildManifest()
+
+    def save(self, file: Path):
+        import json
+
+        file.parent.mkdir(exist_ok=True, parents=True)
+        with open(file, "w") as f:
+            json.dump(self.sections, f, indent=2, sort_keys=True)
+
+    def section(self, name: str) -> dict[str, str]:
+        return self.sections.setdefault(name, {})
+
+    def changed(self, name: str, files: Iterable[Path], root: Path) -> list[Path]:
+        """The files which have changed since they were recorded."""
+        section = self.section(name)
+        return [
+            f
+            for f in files
+            if section.get(f.relative_to(root).as_posix()) != file_hash(f)
+        ]
+
+    def record(self, name: str, files: Iterable[Path], root: Path):
+        """Record the current content of the files."""
+        section = self.section(name)
+        for f in files:
+            section[f.relative_to(root).as_posix()] = file_hash(f)
+
+
+@dataclass
+class MethodCache:
+    """The cached information about a method, see 'Suite.method_cache'.
+
+    Besides the opcodes and the sizes of the frame, it holds the analyses
+    computed from them, like the control flow graph in 'jpamb.cfg', so they
+    are only computed once.
+    """
+
+    opcodes: tuple[jvm.Opcode, ...]
+    max_locals: int = 0
+    max_stack: int = 0
+    analyses: dict[str, object] = field(default_factory=dict)
+
+    def analysis[T](
+        self, name: str, compute: Callable[[tuple[jvm.Opcode, ...]], T]
+    ) -> T:
+        """Get the named analysis of the opcodes, computing it on first use."""
+        try:
+            return self.analyses[name]
+        except KeyError:
+            result = self.analyses[name] = compute(self.opcodes)
+            return result
+
+    @property
+    def superinstructions(self) -> tuple[jvm.Opcode, ...]:
+        """The opcodes with common sequences fused, see 'jvm.fuse'."""
+        return self.analysis("superinstructions", jvm.fuse)
+
+
 class Suite:
     """The suite!
 
@@ -242,12 +349,30 @@ class Suite:
     def invalidate_cache(self):
         """Invalidate the case, and require a recomputation of the cached values."""
         self._cases = None
+        self._methods: dict[tuple[jvm.AbsMethodID, bool], MethodCache] = {}
+        self._callgraph = None
+
+    def invalidate_class(self, cn: jvm.ClassName):
+        """Invalidate the cached values of a class, after it is decompiled again."""
+        for key in [k for k in self._methods if k[0].classname is cn]:
+            del self._methods[key]
+        if self._callgraph is not None:
+            try:
+                decompiled = self.findclass(cn)
+            except FileNotFoundError:
+                decompiled = None
+            self._callgraph.update(cn, decompiled)
 
     @property
     def stats_folder(self) -> Path:
         """The folder to place the statistics about the repository"""
         return self.workfolder / "target" / "stats"
 
+    @property
+    def manifest_file(self) -> Path:
+        """The file containing the build manifest, see 'BuildManifest'"""
+        return self.workfolder / "target" / "manifest.json"
+
     @property
     def classfiles_folder(self) -> Path:
         """The folder containing the class files"""
@@ -308,9 +433,55 @@ class Suite:
             raise IndexError(f"Could not find {methodid}")
         return method
 
-    def method_opcodes(self, method: jvm.Absolute[jvm.MethodID]) -> list[jvm.Opcode]:
-        for op in self.findmethod(method)["code"]["bytecode"]:
-            yield jvm.Opcode.from_json(op)
+    def method_opcodes(
+        self, method: jvm.Absolute[jvm.MethodID], trusted: bool = False
+    ) -> list[jvm.Opcode]:
+        """The opcodes of a method, if trusted the opcodes are not validated."""
+        yield from self.method_cache(method, trusted).opcodes
+
+    def method_cache(
+        self, method: jvm.Absolute[jvm.MethodID], trusted: bool = False
+    ) -> MethodCache:
+        """The cached opcodes and analyses of a method.
+
+        The opcodes are decoded on first use, if trusted without validation.
+        The trusted and validated opcodes are cached apart, so untrusted
+        callers never see unvalidated opcodes, but trusted callers use the
+        validated opcodes when they have already been decoded.
+        """
+        if (cache := self._methods.get((method, False))) is not None:
+            return cache
+        if trusted and (cache := self._methods.get((method, True))) is not None:
+            return cache
+        code = self.findmethod(method)["code"]
+        opcodes = tuple(jvm.Opcode.decode_method(code["bytecode"], trusted=trusted))
+        cache = self._methods[method, trusted] = MethodCache(
+            opcodes, max_locals=code["max_locals"], max_stack=code["max_stack"]
+        )
+        return cache
+
+    def callgraph(self) -> "CallGraph":
+        """The call graph of all the decompiled classes in the suite."""
+        from jpamb.callgraph import CallGraph
+
+        if self._callgraph is None:
+            self._callgraph = CallGraph.from_classes(
+                (cn, self.findclass(cn))
+                for cn in self.classes()
+                if self.decompiledfile(cn).exists()
+            )
+        return self._callgraph
+
+    def dependencies(self, method: jvm.AbsMethodID) -> list[Path]:
+        """The class files the result of running method depends on.
+
+        These are the class files of the classes reachable from method in
+        the call graph, and the class file of jpamb.Runtime which runs it.
+        """
+        classes = {m.classname for m in self.callgraph().reachable(method)}
+        classes.add(jvm.ClassName("jpamb.Runtime"))
+        files = (self.classfile(cn) for cn in sorted(classes, key=str))
+        return [f for f in files if f.exists()]
 
     def classes(self) -> Iterable[jvm.ClassName]:
         for file in self.classfiles():
@@ -322,6 +493,11 @@ class Suite:
     def case_file(self) -> Path:
         return self.stats_folder / "cases.txt"
 
+    @property
+    def opcode_stats_file(self) -> Path:
+        """The file containing the opcode statistics, see 'jpamb.opstats'"""
+        return self.stats_folder / "opcodes.json"
+
     @property
     def version(self):
         with open(self.workfolder / "CITATION.cff") as f:
@@ -333,7 +509,13 @@ class Suite:
     def cases(self) -> tuple[Case, ...]:
         if self._cases is None:
             with open(self.case_file) as f:
-                self._cases = tuple(Case.decode(line) for line in f)
+                matches = [Case.match(line) for line in f]
+            # the inputs are decoded together, in one pass of the scanner
+            inputs = Input.decode_bulk(m.group(2) for m in matches)
+            self._cases = tuple(
+                Case(jvm.AbsMethodID.decode(m.group(1)), input, m.group(3))
+                for m, input in zip(matches, inputs)
+            )
         return self._cases
 
     def case_methods(self) -> Iterable[tuple[jvm.Absolute[jvm.MethodID], set[str]]]:
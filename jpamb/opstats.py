@@ -0,0 +1,274 @@
+"""
+jpamb.opstats
+
+This module provides an index of opcode statistics for the suite, with
+the opcode histograms of every method and class, and the documentation
+and source location of each opcode.
+
+The index is stored in 'target/stats/opcodes.json', and 'opcode_stats'
+only decodes the classes whose decompiled file has changed since the index
+was saved, so documentation and filters can use it without decoding the
+bytecode again. The whole index is recomputed when the module defining the
+opcodes, or the module computing the method ids, changes, as the source
+locations or the keys would be stale otherwise.
+
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from inspect import getsourcefile, getsourcelines
+from pathlib import Path
+from typing import Iterable
+
+import json
+
+from loguru import logger
+
+from jpamb import jvm, model
+from jpamb.callgraph import method_id
+
+
+@dataclass(frozen=True)
+class OpcodeInfo:
+    """The documentation of an opcode, and where it is implemented."""
+
+    name: str
+    url: str
+    source: str
+
+    @staticmethod
+    def of(opcode: jvm.Opcode) -> "OpcodeInfo":
+        kind = type(opcode)
+        file = Path(getsourcefile(kind))
+        root = file.parent
+        while root.name != "jpamb":
+            root = root.parent
+        rel = file.relative_to(root.parent).as_posix()
+        return OpcodeInfo(
+            name=kind.__name__,
+            url=opcode.url(),
+            source=f"{rel}?plain=1#L{getsourcelines(kind)[1]}",
+        )
+
+
+@dataclass
+class ClassStats:
+    """The opcode histograms of the methods of a class.
+
+    The methods are their encoded method ids, and the histograms count the
+    opcodes by their mnemonic. Methods with opcodes which are not supported
+    by 'jpamb.jvm' are left out. 'hash' is the hash of the decompiled file
+    the histograms are computed from.
+    """
+
+    hash: str
+    methods: dict[str, dict[str, int]]
+
+    @staticmethod
+    def from_json(
+        cn: jvm.ClassName, decompiled: dict, hash: str, opcodes: dict
+    ) -> "ClassStats":
+        """Compute the histograms, and add the opcodes seen to opcodes."""
+        methods = {}
+        for method in decompiled["methods"]:
+            if method["code"] is None:
+                continue
+            histogram = Counter()
+            examples = {}
+            try:
+                for op in jvm.Opcode.decode_method(
+                    method["code"]["bytecode"], trusted=True
+                ):
+                    mnemonic = op.mnemonic()
+                    histogram[mnemonic] += 1
+                    examples.setdefault(mnemonic, op)
+            except NotImplementedError:
+                continue
+            for mnemonic, op in examples.items():
+                if mnemonic not in opcodes:
+                    opcodes[mnemonic] = OpcodeInfo.of(op)
+            methods[method_id(cn, method).encode()] = dict(histogram)
+        return ClassStats(hash, methods)
+
+    def histogram(self) -> Counter[str]:
+        total = Counter()
+        for histogram in self.methods.values():
+            total.update(histogram)
+        return total
+
+
+def opcode_source_hash() -> str:
+    """The hash of the modules defining the opcodes and the method ids."""
+    import hashlib
+
+    digest = hashlib.sha256()
+    for module in (jvm.Opcode, method_id):
+        digest.update(model.file_hash(Path(getsourcefile(module))).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class OpcodeStats:
+    """The opcode statistics of all the decompiled classes in the suite.
+
+    'source' is the hash of the modules the statistics are computed with,
+    see 'opcode_source_hash'.
+    """
+
+    classes: dict[str, ClassStats] = field(default_factory=dict)
+    opcodes: dict[str, OpcodeInfo] = field(default_factory=dict)
+    source: str = ""
+
+    @staticmethod
+    def load(file: Path) -> "OpcodeStats":
+        """Load the index, or an empty index if there is none."""
+        try:
+            with open(file) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return OpcodeStats()
+        return OpcodeStats(
+            classes={cn: ClassStats(**c) for cn, c in data["classes"].items()},
+            opcodes={m: OpcodeInfo(**o) for m, o in data["opcodes"].items()},
+            source=data.get("source", ""),
+        )
+
+    def save(self, file: Path):
+        file.parent.mkdir(exist_ok=True, parents=True)
+        with open(file, "w") as f:
+            json.dump(
+                {
+                    "classes": {
+                        cn: {"hash": c.hash, "methods": c.methods}
+                        for cn, c in self.classes.items()
+                    },
+                    "opcodes": {m: vars(o) for m, o in self.opcodes.items()},
+                    "source": self.source,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+    def update(self, suite: model.Suite) -> bool:
+        """Recompute the classes which have changed, and return if any did."""
+        changed = False
+        if (source := opcode_source_hash()) != self.source:
+            self.classes.clear()
+            self.opcodes.clear()
+            self.source = source
+            changed = True
+        seen = set()
+        for cn in suite.classes():
+            file = suite.decompiledfile(cn)
+            if not file.exists():
+                continue
+            seen.add(cn.dotted())
+            hash = model.file_hash(file)
+            if (old := self.classes.get(cn.dotted())) and old.hash == hash:
+                continue
+            self.classes[cn.dotted()] = ClassStats.from_json(
+                cn, suite.findclass(cn), hash, self.opcodes
+            )
+            changed = True
+        for cn in set(self.classes) - seen:
+            del self.classes[cn]
+            changed = True
+        return changed
+
+    def method(self, method: jvm.AbsMethodID) -> dict[str, int]:
+        """The histogram of a method, which is empty if it is unknown."""
+        c = self.classes.get(method.classname.dotted())
+        return c.methods.get(method.encode(), {}) if c else {}
+
+    def histogram(self, methods: Iterable[jvm.AbsMethodID]) -> Counter[str]:
+        """The opcodes of the methods, counted once per occurrence."""
+        total = Counter()
+        for m in methods:
+            total.update(self.method(m))
+        return total
+
+    def mnemonics(self, opcode: str) -> set[str]:
+        """The mnemonics of an opcode, given by its class name or mnemonic."""
+        known = {kind.__name__ for kind in jvm.Opcode._registry.values()}
+        if opcode not in known and opcode not in self.opcodes:
+            raise ValueError(f"Unknown opcode {opcode!r}")
+        return {m for m, info in self.opcodes.items() if opcode in (m, info.name)}
+
+
+@dataclass(frozen=True)
+class CaseSelector:
+    """Select cases by the method they run, and their expected outcome.
+
+    A method is selected if it is in one of the classes, contains all the
+    opcodes, and has all the parameter types. Classes are given by their
+    name or dotted name, opcodes by their class name (like 'NewArray') or
+    mnemonic, and parameter types in their encoded form (like '[I'). Empty
+    selectors select everything. Methods without opcode statistics, e.g.
+    because their class is not decompiled, are not selected by opcode, and
+    a warning is logged for each.
+    """
+
+    classes: tuple[str, ...] = ()
+    opcodes: tuple[str, ...] = ()
+    outcomes: tuple[str, ...] = ()
+    params: tuple[str, ...] = ()
+
+    def __bool__(self) -> bool:
+        return any((self.classes, self.opcodes, self.outcomes, self.params))
+
+    def _method_filter(self, stats: OpcodeStats):
+        opcodes = [stats.mnemonics(o) for o in self.opcodes]
+        missing = set()
+
+        def select(method: jvm.AbsMethodID) -> bool:
+            cn = method.classname
+            if self.classes and not (
+                cn.name in self.classes or cn.dotted() in self.classes
+            ):
+                return False
+            if self.params:
+                params = {t.encode() for t in method.extension.params}
+                if not params.issuperset(self.params):
+                    return False
+            if opcodes:
+                histogram = stats.method(method)
+                if not histogram and method not in missing:
+                    missing.add(method)
+                    logger.warning(
+                        f"No opcode statistics for {method}, so it is not selected"
+                    )
+                if not all(histogram.keys() & mnemonics for mnemonics in opcodes):
+                    return False
+            return True
+
+        return select
+
+    def methods(
+        self, suite: model.Suite, stats: OpcodeStats
+    ) -> set[jvm.AbsMethodID]:
+        """The methods with a selected case."""
+        select = self._method_filter(stats)
+        return {
+            m
+            for m, outcomes in suite.case_methods()
+            if select(m) and (not self.outcomes or outcomes & set(self.outcomes))
+        }
+
+    def cases(self, suite: model.Suite, stats: OpcodeStats) -> set[model.Case]:
+        select = self._method_filter(stats)
+        return {
+            case
+            for case in suite.cases
+            if select(case.methodid)
+            and (not self.outcomes or case.result in self.outcomes)
+        }
+
+
+def opcode_stats(suite: model.Suite) -> OpcodeStats:
+    """The opcode statistics of the suite, updated and saved if needed."""
+    file = suite.opcode_stats_file
+    stats = OpcodeStats.load(file)
+    if stats.update(suite):
+        stats.save(file)
+    return stats
@@ -0,0 +1,162 @@
+"""
+jpamb.tracer
+
+This module provides the hooks through which the interpreters report
+what they execute, see 'Tracer', and the tracers for debug logging,
+coverage and opcode counts.
+
+An interpreter only calls the hooks when a tracer is attached, and runs
+its plain loop otherwise, so tracing costs nothing when it is not used.
+The calls, returns, branches and allocations are derived from the effect
+of each step, so the semantics of the opcodes do not know about tracing.
+
+"""
+
+from collections import Counter
+from typing import Callable
+
+from loguru import logger
+
+from jpamb import jvm
+
+
+class Tracer:
+    """A tracer whose hooks do nothing, override the ones needed.
+
+    The state and the values are in the representation of the
+    interpreter, and the offsets are indices into the opcodes of the
+    method.
+    """
+
+    def on_step(self, state, method: jvm.AbsMethodID, offset: int, opcode: jvm.Opcode):
+        """Called before the opcode at offset is executed."""
+
+    def on_call(self, state, method: jvm.AbsMethodID, args):
+        """Called when a frame for method is pushed, with its arguments."""
+
+    def on_return(self, state, method: jvm.AbsMethodID, value):
+        """Called when method returns to its caller, value is None for void."""
+
+    def on_branch(self, state, method: jvm.AbsMethodID, offset: int, target: int):
+        """Called after a branch at offset, with the offset executed next."""
+
+    def on_alloc(self, state, method: jvm.AbsMethodID, offset: int, value):
+        """Called after an object or array is allocated at offset."""
+
+
+class Tracers(Tracer):
+    """Several tracers attached at once, called in order."""
+
+    def __init__(self, *tracers: Tracer):
+        self.tracers = tracers
+
+    def on_step(self, state, method, offset, opcode):
+        for t in self.tracers:
+            t.on_step(state, method, offset, opcode)
+
+    def on_call(self, state, method, args):
+        for t in self.tracers:
+            t.on_call(state, method, args)
+
+    def on_return(self, state, method, value):
+        for t in self.tracers:
+            t.on_return(state, method, value)
+
+    def on_branch(self, state, method, offset, target):
+        for t in self.tracers:
+            t.on_branch(state, method, offset, target)
+
+    def on_alloc(self, state, method, offset, value):
+        for t in self.tracers:
+            t.on_alloc(state, method, offset, value)
+
+
+class LoggingTracer(Tracer):
+    """Logs every event, by default at the debug level."""
+
+    def __init__(self, log: Callable[[str], None] = logger.debug):
+        self.log = log
+
+    def on_step(self, state, method, offset, opcode):
+        self.log(f"STEP {opcode}\n{state}")
+
+    def on_call(self, state, method, args):
+        self.log(f"CALL {method} {args}")
+
+    def on_return(self, state, method, value):
+        self.log(f"RETURN {method} {value}")
+
+    def on_branch(self, state, method, offset, target):
+        self.log(f"BRANCH {method}:{offset} -> {target}")
+
+    def on_alloc(self, state, method, offset, value):
+        self.log(f"ALLOC {method}:{offset} {value}")
+
+
+class Coverage(Tracer):
+    """The offsets reached in each method, as a byte per offset.
+
+    Without counts a byte is 1 if the offset was reached, with counts it
+    is the number of times it was reached, saturating at 255. A hit map
+    only extends to the last offset reached.
+    """
+
+    def __init__(self, counts: bool = False):
+        self.counts = counts
+        self.hits: dict[jvm.AbsMethodID, bytearray] = {}
+
+    def on_step(self, state, method, offset, opcode):
+        hits = self.hits.get(method)
+        if hits is None:
+            hits = self.hits[method] = bytearray()
+        if offset >= len(hits):
+            hits.extend(bytes(offset + 1 - len(hits)))
+        if not self.counts:
+            hits[offset] = 1
+        elif hits[offset] < 255:
+            hits[offset] += 1
+
+    def offsets(self) -> set[str]:
+        """The reached offsets, formatted as 'method:offset'."""
+        return {
+            f"{m}:{i}" for m, hits in self.hits.items() for i, h in enumerate(hits) if h
+        }
+
+    def encode(self) -> str:
+        """The hit maps as 'method=hex', separated by spaces."""
+        return " ".join(f"{m}={hits.hex()}" for m, hits in self.hits.items())
+
+    @staticmethod
+    def decode(line: str, counts: bool = False) -> "Coverage":
+        coverage = Coverage(counts)
+        for entry in line.split():
+            m, hits = entry.rsplit("=", 1)
+            coverage.hits[jvm.AbsMethodID.decode(m)] = bytearray.fromhex(hits)
+        return coverage
+
+
+class OpcodeCounter(Tracer):
+    """Counts the executed opcodes."""
+
+    def __init__(self):
+        self.counts: Counter[jvm.Opcode] = Counter()
+
+    def on_step(self, state, method, offset, opcode):
+        self.counts[opcode] += 1
+
+    def histogram(self) -> Counter[str]:
+        """The counts by mnemonic, or by class name if it has none."""
+        histogram = Counter()
+        for op, count in self.counts.items():
+            try:
+                histogram[op.mnemonic()] += count
+            except NotImplementedError:
+                histogram[type(op).__name__] += count
+        return histogram
+
+
+def is_branch(opcode: jvm.Opcode) -> bool:
+    """Check if the opcode, or the last opcode of a superinstruction, branches."""
+    if isinstance(opcode, jvm.Superinstruction):
+        opcode = opcode.opcodes[-1]
+    return isinstance(opcode, (jvm.Goto, jvm.If, jvm.Ifz))
@@ -73,6 +73,16 @@ def get_all_offsets(methodid: str) -> set[str]:
     return offsets
 
 
+def parse_coverage(line: str) -> list[str]:
+    """Parse the hit maps printed by the interpreter, where each byte is
+    nonzero if the offset was reached, into a list of 'method:offset'."""
+    trace = []
+    for entry in line.split():
+        mid, hits = entry.rsplit("=", 1)
+        trace.extend(f"{mid}:{i}" for i, h in enumerate(bytes.fromhex(hits)) if h)
+    return trace
+
+
 def run_interpreter(methodid: str, input_str: str, capture_output: bool = True) -> tuple[int, str, list[str]]:
     """Run `solutions/interpreter.py` with the given method id and input string.
 
@@ -99,13 +109,8 @@ def run_interpreter(methodid: str, input_str: str, capture_output: bool = True)
             max_value = int(max_value / 2)
             min_value = int(min_value / 2)
 
-        # Parse the trace line into a list of strings
-        if not arr_literal:
-            # print(f"Debug: no trace line from interpreter")
-            trace = []
-        else:
-            # print(f"Debug: trace line from interpreter: {arr_literal}")
-            trace = arr_literal.split(',')
+        # Parse the coverage line, 'method=hex' per method, into a list of 'method:offset'
+        trace = parse_coverage(arr_literal)
 
         # Filter out entry method offsets for Calls cases to match get_all_offsets logic
         if "jpamb.cases.Calls" in methodid:
@@ -176,23 +181,13 @@ def _analyze_method(analyser: list[str], method_id: str, type: jvm.Type) -> list
             for v in analyses:
                 # Parse array literals like "[I: 1, 2, 3]" or "[C: 'h', 'e']"
                 if isinstance(v, str) and v.startswith("["):
-                    # Extract type and contents
-                    array_type = v[1]  # 'I' or 'C'
-                    content_str = v.split(": ", 1)[1].rstrip("]")
-                    
-                    if array_type == 'I':
-                        if content_str:
-                            content = [int(x.strip()) for x in content_str.split(",")]
-                        else:
-                            content = []
-                        inputs.append(jvm.Value.array(jvm.Int(), content))
-                    elif array_type == 'C':
-                        if content_str:
-                            # Parse "'h', 'e', 'l'" into ['h', 'e', 'l']
-                            chars = [c.strip().strip("'") for c in content_str.split(",")]
-                            inputs.append(jvm.Value.array(jvm.Char(), chars))
-                        else:
-                            inputs.append(jvm.Value.array(jvm.Char(), []))
+                    # Decode straight into a compact buffer backed array
+                    array_cls = {"I": jvm.CompactIntArray, "C": jvm.CompactCharArray}.get(v[1])
+                    if array_cls is not None:
+                        try:
+                            inputs.append(array_cls.decode(v))
+                        except ValueError:
+                            continue
         case _:
             print(f"\033[91m⚠️   Analysis for type {type} not implemented; continuing without seeding\033[0m")
     return inputs
@@ -226,10 +221,10 @@ def _gen_for_type(type: jvm.Type, rng: random.Random, max_str: int, max_arr: int
             length = rng.randint(0, max_arr)
             if isinstance(contains, jvm.Int):
                 content = [rng.randint(-100, 100) for _ in range(length)]
-                return jvm.Value.array(jvm.Int(), content)
+                return jvm.CompactIntArray.of(content)
             if isinstance(contains, jvm.Char):
                 content = [rng.choice(string.ascii_letters) for _ in range(length)]
-                return jvm.Value.array(jvm.Char(), content)
+                return jvm.CompactCharArray.of(content)
             # fallback to null reference for unsupported arrays
             return jvm.Value(jvm.Reference(), None)
         case jvm.Reference():
@@ -242,12 +237,17 @@ def _gen_for_type(type: jvm.Type, rng: random.Random, max_str: int, max_arr: int
             return jvm.Value(jvm.Reference(), None)
 
 
+def _wrap_int32(x: int) -> int:
+    """Wrap an int into the range of a java int, like java arithmetic."""
+    return (x + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+
+
 def _mutate_input(value: jvm.Value, rng: random.Random) -> jvm.Value:
     match value:
         case jvm.Value(jvm.Int(), int_val):
             # Mutate integer by adding or subtracting a small random value
             delta = rng.randint(-10, 10)
-            return jvm.Value.int(int_val + delta)
+            return jvm.Value.int(_wrap_int32(int_val + delta))
         case jvm.Value(jvm.Float(), float_val):
             # Mutate float by adding a small random delta
             delta = rng.uniform(-1.0, 1.0)
@@ -277,6 +277,14 @@ def _mutate_input(value: jvm.Value, rng: random.Random) -> jvm.Value:
                 return jvm.Value.string(new_str)
             else:
                 return value
+        case jvm.CompactIntArray() if len(value) > 0:
+            # Mutate int array by adding delta to an element, the array is copied
+            idx = rng.randint(0, len(value) - 1)
+            return value.replace(idx, _wrap_int32(value[idx] + rng.randint(-10, 10)))
+        case jvm.CompactCharArray() if len(value) > 0:
+            # Mutate char array by changing a character, the array is copied
+            idx = rng.randint(0, len(value) - 1)
+            return value.replace(idx, rng.choice(string.ascii_letters))
         case jvm.Value(jvm.Array(contains), arr_val):
     # Mutate array by modifying an element or changing length
             if arr_val and len(arr_val) > 0:
@@ -291,7 +299,7 @@ def _mutate_input(value: jvm.Value, rng: random.Random) -> jvm.Value:
                     # For int arrays, mutate by adding delta
                     delta = rng.randint(-10, 10)
                     new_arr = list(arr_val)
-                    new_arr[idx] = arr_val[idx] + delta
+                    new_arr[idx] = _wrap_int32(arr_val[idx] + delta)
                     return jvm.Value.array(contains, new_arr)
                 else:
                     return value
@@ -356,9 +364,9 @@ def fuzz_method(
             # mutation
             parent_input = rng.choice(corpus)
             try:
-                input_value = _mutate_input(parent_input, rng)  # you'll write this small helper
-            except Exception:
-                input_value = []
+                input_value = _mutate_input(parent_input, rng)
+            except ValueError:
+                input_value = parent_input
             values = [input_value]
         else:
             # full random
@@ -1,6 +1,10 @@
 import jpamb
 from jpamb import jvm
+from jpamb.cfg import CFG
+from jpamb.interpreter import JavaArray, JavaObject
+from jpamb.tracer import Coverage, LoggingTracer, Tracer, Tracers, is_branch
 from dataclasses import dataclass, field
+from typing import Callable
 import sys
 
 import sys
@@ -9,11 +13,7 @@ from loguru import logger
 from jpamb.jvm.base import Value
 
 logger.remove()
-logger.add(sys.stderr, format="[{level}] {message}")
-
-methodid, input = jpamb.getcase()
-
-trace = set()
+logger.add(sys.stderr, format="[{level}] {message}", level="INFO")
 
 # ┌ Case jpamb.cases.Simple.checkBeforeDivideByN2:(0) -> ok ------------------- This one is nor working anymore
 # uv run solutions/interpreter.py "jpamb.cases.Simple.checkBeforeDivideByN2:(I)I" "(0)"
@@ -39,16 +39,50 @@ class PC:
 class Bytecode:
     suite: jpamb.Suite
     methods: dict[jvm.AbsMethodID, list[jvm.Opcode]]
+    handlers: dict[jvm.AbsMethodID, list] = field(default_factory=dict)
+    headers: dict[jvm.AbsMethodID, set[int]] = field(default_factory=dict)
+    sizes: dict[jvm.AbsMethodID, tuple[int, int]] = field(default_factory=dict)
 
     def __getitem__(self, pc: PC) -> jvm.Opcode:
         try:
             opcodes = self.methods[pc.method]
         except KeyError:
-            opcodes = list(self.suite.method_opcodes(pc.method))
+            opcodes = list(self.suite.method_opcodes(pc.method, trusted=True))
             self.methods[pc.method] = opcodes
 
         return opcodes[pc.offset]
 
+    def frame_sizes(self, method: jvm.AbsMethodID) -> tuple[int, int]:
+        """The max locals and max stack of the method."""
+        try:
+            return self.sizes[method]
+        except KeyError:
+            cache = self.suite.method_cache(method, trusted=True)
+            sizes = self.sizes[method] = (cache.max_locals, cache.max_stack)
+            return sizes
+
+    def loop_headers(self, method: jvm.AbsMethodID) -> set[int]:
+        """The offsets which are targets of back edges in the method."""
+        try:
+            return self.headers[method]
+        except KeyError:
+            self[PC(method, 0)]
+            g = CFG.from_opcodes(self.methods[method])
+            headers = {g.blocks[h].start for h in g.loop_headers()}
+            self.headers[method] = headers
+            return headers
+
+    def handler(self, pc: PC):
+        """The opcode at pc and its handler, resolved once per method."""
+        try:
+            handlers = self.handlers[pc.method]
+        except KeyError:
+            self[pc]
+            handlers = [(op, resolve(op)) for op in self.methods[pc.method]]
+            self.handlers[pc.method] = handlers
+
+        return handlers[pc.offset]
+
 
 @dataclass
 class Stack[T]:
@@ -77,723 +111,814 @@ class Stack[T]:
         return "".join(f"{v}" for v in self.items)
 
 
+class OperandStack:
+    """An operand stack, preallocated to the max stack of the method.
+
+    It grows past the max stack if needed, as some handlers push more than
+    the JVM would.
+    """
+
+    __slots__ = ("items", "size")
+
+    def __init__(self, capacity: int):
+        self.items: list = [None] * capacity
+        self.size = 0
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def peek(self):
+        return self.items[self.size - 1]
+
+    def pop(self):
+        if self.size == 0:
+            raise IndexError("pop from empty stack")
+        self.size -= 1
+        return self.items[self.size]
+
+    def push(self, value):
+        try:
+            self.items[self.size] = value
+        except IndexError:
+            self.items.append(value)
+        self.size += 1
+        return self
+
+    def values(self) -> list:
+        return self.items[: self.size]
+
+    def __str__(self):
+        if not self:
+            return "ϵ"
+        return "".join(f"{v}" for v in self.values())
+
+
+class Heap:
+    """An arena of the objects, arrays and strings allocated in a run.
+
+    A reference is the index of its object in the arena, so references are
+    never reused. Objects and arrays are laid out as 'JavaObject' and
+    'JavaArray', and strings are python strings.
+    """
+
+    __slots__ = ("objects",)
+
+    def __init__(self):
+        self.objects: list[JavaObject | JavaArray | str] = []
+
+    def alloc(self, obj: JavaObject | JavaArray | str) -> int:
+        self.objects.append(obj)
+        return len(self.objects) - 1
+
+    def __getitem__(self, ref: int) -> JavaObject | JavaArray | str:
+        return self.objects[ref]
+
+    def __contains__(self, ref) -> bool:
+        return isinstance(ref, int) and 0 <= ref < len(self.objects)
+
+    def __repr__(self):
+        return f"Heap({self.objects!r})"
+
+
 suite = jpamb.Suite()
 bc = Bytecode(suite, dict())
 
 
-@dataclass
+@dataclass(slots=True)
 class Frame:
-    locals: dict[int, jvm.Value]
-    stack: Stack[jvm.Value]
+    locals: list[jvm.Value | None]
+    stack: OperandStack
     pc: PC
 
     def __str__(self):
-        locals = ", ".join(f"{k}:{v}" for k, v in sorted(self.locals.items()))
+        locals = ", ".join(
+            f"{k}:{v}" for k, v in enumerate(self.locals) if v is not None
+        )
         return f"<{{{locals}}}, {self.stack}, {self.pc}>"
 
     def from_method(method: jvm.AbsMethodID) -> "Frame":
-        return Frame({}, Stack.empty(), PC(method, 0))
+        max_locals, max_stack = bc.frame_sizes(method)
+        return Frame([None] * max_locals, OperandStack(max_stack), PC(method, 0))
 
 
 @dataclass
 class State:
-    heap: dict[int, jvm.Value]
+    heap: Heap
     frames: Stack[Frame]
 
     def __str__(self):
         return f"{self.heap} {self.frames}"
 
 
+type Handler = Callable[[State, Frame, jvm.Opcode], State | str]
+
+DISPATCH: dict[tuple, Handler] = {}
+"""The handlers of the opcodes, keyed on their class, type and operator."""
+
+
+def handles(*keys: tuple):
+    def register(handler: Handler) -> Handler:
+        for key in keys:
+            DISPATCH[key] = handler
+        return handler
+
+    return register
+
+
+def dispatch_key(opr: jvm.Opcode) -> tuple:
+    """The key of an opcode in DISPATCH."""
+    match opr:
+        case jvm.Binary(type=t, operant=o):
+            return (jvm.Binary, type(t), o)
+        case jvm.Cast(from_=f, to_=t):
+            return (jvm.Cast, type(f), type(t))
+        case (
+            jvm.Load(type=t)
+            | jvm.Store(type=t)
+            | jvm.Return(type=t)
+            | jvm.NewArray(type=t)
+            | jvm.ArrayLoad(type=t)
+            | jvm.ArrayStore(type=t)
+        ):
+            return (type(opr), type(t))
+    return (type(opr),)
+
+
+def unhandled(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    # opr.help()
+    raise NotImplementedError(f"Don't know how to handle: {opr!r}")
+
+
+def resolve(opr: jvm.Opcode) -> Handler:
+    return DISPATCH.get(dispatch_key(opr), unhandled)
+
+
 def step(state: State) -> State | str:
     assert isinstance(state, State), f"expected frame but got {state}"
     frame = state.frames.peek()
-    opr = bc[frame.pc]
-    
-    trace.add(str(frame.pc))
+    opr, handler = bc.handler(frame.pc)
+    return handler(state, frame, opr)
 
-    logger.debug(f"STEP {opr}\n{state}")
-    match opr:
-        case jvm.Push(value=v):
-            frame.stack.push(v)
-            frame.pc += 1
-            return state
-        
-        case jvm.Load(type=jvm.Int(), index=i):
-            frame.stack.push(frame.locals[i])
-            frame.pc += 1
-            return state
-        
-        case jvm.Load(type=jvm.Float(), index=i):
-            frame.stack.push(frame.locals[i])
-            frame.pc += 1
-            return state
-        
-        case jvm.Binary(type=jvm.Int(), operant=jvm.BinaryOpr.Div): # Binary Division
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            # assert v2.value > 0, "Helooooo we need to do something here!!!"
-            assert v1.type is jvm.Int(), f"expected int, but got {v1}"
-            assert v2.type is jvm.Int(), f"expected int, but got {v2}"
-            if v2.value == 0:
-                return "divide by zero"
-
-            frame.stack.push(jvm.Value.int(v1.value // v2.value))
+
+def traced_step(state: State, tracer: Tracer) -> State | str:
+    """Take a step, and report it and its effect to the tracer."""
+    frames = state.frames.items
+    frame = frames[-1]
+    pc, depth = frame.pc, len(frames)
+    method, offset = pc.method, pc.offset
+    opr, handler = bc.handler(pc)
+    tracer.on_step(state, method, offset, opr)
+    res = handler(state, frame, opr)
+    if isinstance(res, str):
+        return res
+    frames = state.frames.items
+    if len(frames) > depth:
+        tracer.on_call(state, frames[-1].pc.method, frames[-1].locals)
+    elif len(frames) < depth:
+        value = frames[-1].stack.peek() if opr.type is not None else None
+        tracer.on_return(state, method, value)
+    elif is_branch(opr):
+        tracer.on_branch(state, method, offset, frame.pc.offset)
+    elif isinstance(opr, (jvm.New, jvm.NewArray)):
+        tracer.on_alloc(state, method, offset, frame.stack.peek())
+    return res
+
+
+@handles((jvm.Push,))
+def push(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v = opr.value
+    frame.stack.push(v)
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Load, jvm.Int))
+def load_int(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    i = opr.index
+    frame.stack.push(frame.locals[i])
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Load, jvm.Float))
+def load_float(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    i = opr.index
+    frame.stack.push(frame.locals[i])
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Binary, jvm.Int, jvm.BinaryOpr.Div))  # Binary Division
+def int_div(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+    assert v1.type is jvm.Int(), f"expected int, but got {v1}"
+    assert v2.type is jvm.Int(), f"expected int, but got {v2}"
+    if v2.value == 0:
+        return "divide by zero"
+
+    frame.stack.push(jvm.CompactInt.of(v1.value // v2.value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Binary, jvm.Int, jvm.BinaryOpr.Sub))  # Binary subtraction
+def int_sub(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+    assert v1.type is jvm.Int(), f"expected int, but got {v1}"
+    assert v2.type is jvm.Int(), f"expected int, but got {v2}"
+    frame.stack.push(jvm.CompactInt.of(v1.value - v2.value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Binary, jvm.Int, jvm.BinaryOpr.Add))  # Binary addition
+def int_add(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+
+    try:
+        result = v1.value + v2.value
+    except Exception as e:
+        return "assertion error"
+
+    frame.stack.push(jvm.CompactInt.of(result))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Binary, jvm.Int, jvm.BinaryOpr.Mul))  # Binary multiplication
+def int_mul(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+    assert v1.type is jvm.Int(), f"expected int, but got {v1}"
+    assert v2.type is jvm.Int(), f"expected int, but got {v2}"
+    frame.stack.push(jvm.CompactInt.of(v1.value * v2.value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Binary, jvm.Int, jvm.BinaryOpr.Rem))  # Binary remainder
+def int_rem(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+    assert v1.type is jvm.Int(), f"expected int, but got {v1}"
+    assert v2.type is jvm.Int(), f"expected int, but got {v2}"
+    if v2.value == 0:
+        return "divide by zero"
+    frame.stack.push(jvm.CompactInt.of(v1.value % v2.value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Binary, jvm.Float, jvm.BinaryOpr.Add))  # Float addition
+def float_add(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+    frame.stack.push(jvm.CompactFloat(v1.value + v2.value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Binary, jvm.Float, jvm.BinaryOpr.Sub))  # Float subtraction
+def float_sub(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+    frame.stack.push(jvm.CompactFloat(v1.value - v2.value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Binary, jvm.Float, jvm.BinaryOpr.Mul))  # Float multiplication
+def float_mul(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+    frame.stack.push(jvm.CompactFloat(v1.value * v2.value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Binary, jvm.Float, jvm.BinaryOpr.Div))  # Float division
+def float_div(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+    if v2.value == 0.0:
+        return "divide by zero"
+    frame.stack.push(jvm.CompactFloat(v1.value / v2.value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.CompareFloating,))
+def compare_floating(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    typ, nan_val = opr.type, opr.nan_value
+    v2, v1 = frame.stack.pop(), frame.stack.pop()
+
+    # Compare the two float values
+    if v1.value > v2.value:
+        result = 1
+    elif v1.value < v2.value:
+        result = -1
+    elif v1.value == v2.value:
+        result = 0
+    else:
+        # One or both are NaN
+        result = nan_val
+
+    frame.stack.push(jvm.CompactInt.of(result))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Return, jvm.Int))
+def return_int(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v1 = frame.stack.pop()
+    state.frames.pop()
+    if state.frames:
+        frame = state.frames.peek()
+        frame.stack.push(v1)
+        frame.pc += 1
+        return state
+    else:
+        return "ok"
+
+
+@handles((jvm.Return, jvm.Reference))
+def return_reference(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v1 = frame.stack.pop()
+    state.frames.pop()
+    if state.frames:
+        frame = state.frames.peek()
+        frame.stack.push(v1)
+        frame.pc += 1
+        return state
+    else:
+        if isinstance(v1.type, jvm.String):
+            return v1.value
+        elif v1.value in state.heap:
+            obj = state.heap[v1.value]
+            if isinstance(obj, str):
+                return obj
+        return "ok"
+
+
+@handles((jvm.Return, type(None)))
+def return_void(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    state.frames.pop()
+    if state.frames:
+        frame = state.frames.peek()
+        frame.pc += 1
+        return state
+    else:
+        return "ok"
+
+
+@handles((jvm.Get,))
+def get(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    is_static, field = opr.static, opr.field
+
+    # Handle $assertionsDisabled field
+    if "$assertionsDisabled" in str(field):
+        frame.stack.push(jvm.CompactInt.of(0))  # assertions are enabled
+        frame.pc += 1
+        return state
+
+    if any(v is not None for v in frame.locals[:2]):
+        if frame.locals[0] == jvm.CompactInt.of(0):
+            frame.stack.push(jvm.CompactInt.of(0))
             frame.pc += 1
-            return state
-        
-        case jvm.Binary(type=jvm.Int(), operant=jvm.BinaryOpr.Sub): # Binary subtraction
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            assert v1.type is jvm.Int(), f"expected int, but got {v1}"
-            assert v2.type is jvm.Int(), f"expected int, but got {v2}"
-            frame.stack.push(jvm.Value.int(v1.value - v2.value))
+        if frame.locals[0] == jvm.CompactInt.of(1):
+            frame.stack.push(jvm.CompactInt.of(1))
             frame.pc += 1
             return state
-        
-        case jvm.Binary(type=jvm.Int(), operant=jvm.BinaryOpr.Add): # Binary addition
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            logger.debug(f"{v1} + {v2}")
-
+        else:
+            return "assertion error"
+    else:
+        return "assertion error"
 
-            try:
-                result = v1.value + v2.value
-            except Exception as e:
-                return "assertion error"
 
-            frame.stack.push(jvm.Value.int(result))
+@handles((jvm.Ifz,))
+def ifz(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    cond, val = opr.condition, opr.target
+    v = frame.stack.pop()
+    if cond == 'eq': # equal to zero
+        if v == jvm.CompactInt.of(0):
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-        
-        case jvm.Binary(type=jvm.Int(), operant=jvm.BinaryOpr.Mul): # Binary multiplication
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            assert v1.type is jvm.Int(), f"expected int, but got {v1}"
-            assert v2.type is jvm.Int(), f"expected int, but got {v2}"
-            frame.stack.push(jvm.Value.int(v1.value * v2.value))
+    elif cond == 'ne': # not equal to zero
+        if v != jvm.CompactInt.of(0):
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-        
-        case jvm.Binary(type=jvm.Int(), operant=jvm.BinaryOpr.Rem): # Binary remainder
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            assert v1.type is jvm.Int(), f"expected int, but got {v1}"
-            assert v2.type is jvm.Int(), f"expected int, but got {v2}"
-            if v2.value == 0:
-                return "divide by zero"
-            frame.stack.push(jvm.Value.int(v1.value % v2.value))
+    elif cond == 'gt': # greater than zero
+        if v.value > 0:
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-        
-        case jvm.Binary(type=jvm.Float(), operant=jvm.BinaryOpr.Add):  # Float addition
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            frame.stack.push(jvm.Value.float(v1.value + v2.value))
+    elif cond == 'ge': # greater than or equal to zero
+        if v.value >= 0:
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-
-        case jvm.Binary(type=jvm.Float(), operant=jvm.BinaryOpr.Sub):  # Float subtraction
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            frame.stack.push(jvm.Value.float(v1.value - v2.value))
+    elif cond == 'is': # if null (reference == null)
+        if v.value is None:
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
+    elif cond == 'isnot': # if not null (reference != null)
+        if v.value is not None:
+            frame.pc = PC(frame.pc.method, val)
+        else:
+            frame.pc += 1
+    return state      
+
+
+@handles((jvm.New,))
+def new(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    name = opr.classname
+    obj_ref = state.heap.alloc(JavaObject(name))
+    frame.stack.push(obj_ref)
+    frame.pc += 1
+    return state
 
-        case jvm.Binary(type=jvm.Float(), operant=jvm.BinaryOpr.Mul):  # Float multiplication
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            frame.stack.push(jvm.Value.float(v1.value * v2.value))
+
+@handles((jvm.Dup,))
+def dup(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v = frame.stack.peek()
+    frame.stack.push(v)
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.InvokeStatic,))
+def invoke_static(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    mid = opr.method
+
+    params = getattr(mid.extension, "params", None)
+    param_elems = getattr(params, "_elements", ()) if params is not None else ()
+    param_count = len(param_elems)
+
+    args = [frame.stack.pop() for _ in range(param_count)][::-1]
+
+    callee = Frame.from_method(mid)
+    for i, a in enumerate(args):
+        callee.locals[i] = a
+
+    state.frames.push(callee)
+    return state
+
+
+@handles((jvm.InvokeSpecial,))
+def invoke_special(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    mid = opr.method
+    method_name = mid.extension.name
+    if method_name == "<init>":
+        # Simulate object creation (same as jvm.New)
+        obj_ref = state.heap.alloc(JavaObject(mid.classname))
+        frame.stack.push(obj_ref)
+        frame.pc += 1
+        return state
+    else:
+        # Handle other special methods
+        frame.pc += 1
+        return state
+
+
+def string_at(state: State, ref: int) -> str:
+    """The string at ref in the heap, or "" if it is not a string."""
+    obj = state.heap[ref]
+    return obj if isinstance(obj, str) else ""
+
+
+@handles((jvm.InvokeVirtual,))
+def invoke_virtual(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    mid = opr.method
+    if str(mid.classname) == "java/lang/String" or str(mid.classname) == "java.lang.String":
+
+        if mid.extension.name == "length":
+            string_ref = frame.stack.pop()  
+            if string_ref.value is None:
+                return "null pointer"
+            string_value = string_at(state, string_ref.value)
+            length = len(string_value)
+            frame.stack.push(jvm.CompactInt.of(length))
             frame.pc += 1
             return state
 
-        case jvm.Binary(type=jvm.Float(), operant=jvm.BinaryOpr.Div):  # Float division
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            if v2.value == 0.0:
-                return "divide by zero"
-            frame.stack.push(jvm.Value.float(v1.value / v2.value))
+        elif mid.extension.name == "toUpperCase":
+            string_ref = frame.stack.pop() 
+            if string_ref.value is None:
+                return "null pointer"
+            string_value = string_at(state, string_ref.value)
+            upper = string_value.upper()
+            new_string_ref = state.heap.alloc(upper)
+            frame.stack.push(jvm.Value(jvm.Reference(), new_string_ref))
             frame.pc += 1
             return state
-        
-        case jvm.CompareFloating(type=typ, nan_value=nan_val):
-            v2, v1 = frame.stack.pop(), frame.stack.pop()
-            
-            # Compare the two float values
-            if v1.value > v2.value:
-                result = 1
-            elif v1.value < v2.value:
-                result = -1
-            elif v1.value == v2.value:
-                result = 0
+
+        elif mid.extension.name == "charAt":
+            index = frame.stack.pop()  
+            string_ref = frame.stack.pop()  
+            if string_ref.value is None:
+                return "null pointer"
+            string_value = string_at(state, string_ref.value)
+            if 0 <= index.value < len(string_value):
+                char = string_value[index.value]
+                frame.stack.push(jvm.CompactInt.of(ord(char)))
             else:
-                # One or both are NaN
-                result = nan_val
-            
-            frame.stack.push(jvm.Value.int(result))
+                return "out of bounds"
             frame.pc += 1
             return state
 
-        case jvm.Return(type=jvm.Int()):
-            v1 = frame.stack.pop()
-            state.frames.pop()
-            if state.frames:
-                frame = state.frames.peek()
-                frame.stack.push(v1)
-                frame.pc += 1
-                return state
-            else:
-                return "ok"
-            
-        case jvm.Return(type=jvm.Reference()):
-            v1 = frame.stack.pop()
-            state.frames.pop()
-            if state.frames:
-                frame = state.frames.peek()
-                frame.stack.push(v1)
-                frame.pc += 1
-                return state
-            else:
-                if isinstance(v1.type, jvm.String):
-                    return v1.value
-                elif v1.value in state.heap:
-                    obj = state.heap[v1.value]
-                    if isinstance(obj, dict) and "java" in obj.get("class", "").lower() and "string" in obj.get("class", "").lower():
-                        return obj.get("value", "ok")
-                return "ok"
-            
-        case jvm.Return(type=None):
-            state.frames.pop()
-            if state.frames:
-                frame = state.frames.peek()
-                frame.pc += 1
-                return state
-            else:
-                return "ok"
-            
-        case jvm.Get(static=is_static, field=field):
-            logger.debug(f"Get field: {field}, static: {is_static}")
-            
-            # Handle $assertionsDisabled field
-            if "$assertionsDisabled" in str(field):
-                frame.stack.push(Value.int(0))  # assertions are enabled
-                frame.pc += 1
-                return state
-            
-            if frame.locals and (0 in frame.locals or 1 in frame.locals):
-                if frame.locals[0] == Value.int(0):
-                    frame.stack.push(Value.int(0))
-                    frame.pc += 1
-                if frame.locals[0] == Value.int(1):
-                    frame.stack.push(Value.int(1))
-                    frame.pc += 1
-                    return state
-                else:
-                    return "assertion error"
+        elif mid.extension.name == "equals":
+            other_ref = frame.stack.pop()  
+            string_ref = frame.stack.pop() 
+            if string_ref.value is None:
+                return "null pointer"
+            string_value = string_at(state, string_ref.value)
+
+            if isinstance(other_ref.type, jvm.String) and not isinstance(other_ref.value, int):
+                # It's a direct string value
+                other_value = other_ref.value
+                result = 1 if string_value == other_value else 0
+            elif other_ref.value in state.heap:
+                # It's a heap reference
+                other_value = string_at(state, other_ref.value)
+                result = 1 if string_value == other_value else 0
             else:
-                return "assertion error"
-            # assert val is True, f"expected boolean, but got {val}"
-            # assert val >= 0
-            # logger.debug(f"Get static field value: {val}")
-            #if val is True:
-            #    frame.stack.push(1)
-            #else: 
-            #    frame.stack.push(0)
-            #frame.pc += 1
-            #return state
-            
-            # return f"{val}"
-            
-        case jvm.Ifz(condition=cond, target=val):
-            v = frame.stack.pop()
-            if cond == 'eq': # equal to zero
-                if v == Value.int(0):
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            elif cond == 'ne': # not equal to zero
-                if v != Value.int(0):
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            elif cond == 'gt': # greater than zero
-                if v.value > 0:
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            elif cond == 'ge': # greater than or equal to zero
-                if v.value >= 0:
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            elif cond == 'is': # if null (reference == null)
-                if v.value is None:
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            elif cond == 'isnot': # if not null (reference != null)
-                if v.value is not None:
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            return state      
-        
-        case jvm.New(classname=name):
-            obj_ref = len(state.heap)
-            state.heap[obj_ref] = {"class": name}
-            frame.stack.push(obj_ref)
-            frame.pc += 1
-            return state
-        
-        case jvm.Dup():
-            v = frame.stack.peek()
-            frame.stack.push(v)
+                result = 0
+
+            frame.stack.push(jvm.CompactInt.of(result))
             frame.pc += 1
             return state
-        
-        case jvm.InvokeStatic(method=mid):
-            logger.debug(f"InvokeStatic: classname={mid.classname.dotted()}, method={mid.extension.name}")
 
-            params = getattr(mid.extension, "params", None)
-            param_elems = getattr(params, "_elements", ()) if params is not None else ()
-            param_count = len(param_elems)
+        elif mid.extension.name == "substring":
+            param_count = len(mid.extension.params._elements) if hasattr(mid.extension, 'params') and mid.extension.params else 0
 
-            args = [frame.stack.pop() for _ in range(param_count)][::-1]
+            if param_count == 2:
+                # substring(int beginIndex, int endIndex)
+                end_idx = frame.stack.pop()    
+                start_idx = frame.stack.pop()  
+                string_ref = frame.stack.pop() 
 
-            callee = Frame.from_method(mid)
-            for i, a in enumerate(args):
-                callee.locals[i] = a
+                if string_ref.value is None:
+                    return "null pointer"
+                string_value = string_at(state, string_ref.value)
 
-            state.frames.push(callee)
-            return state
-        
-        case jvm.InvokeSpecial(method=mid):
-            method_name = mid.extension.name
-            if method_name == "<init>":
-                # Simulate object creation (same as jvm.New)
-                obj_ref = len(state.heap)
-                state.heap[obj_ref] = {"class": mid.classname._as_string}
-                frame.stack.push(obj_ref)
-                frame.pc += 1
-                return state
-            else:
-                # Handle other special methods
-                frame.pc += 1
-                return state
-            
-        case jvm.InvokeVirtual(method=mid):
-            logger.debug(f"InvokeVirtual: classname={mid.classname.dotted()}, method={mid.extension.name}")
-            if str(mid.classname) == "java/lang/String" or str(mid.classname) == "java.lang.String":
-                
-                if mid.extension.name == "length":
-                    string_ref = frame.stack.pop()  
-                    if string_ref.value is None:
-                        return "null pointer"
-                    string_obj = state.heap[string_ref.value]
-                    string_value = string_obj.get("value", "")
-                    length = len(string_value)
-                    frame.stack.push(jvm.Value.int(length))
-                    frame.pc += 1
-                    return state
-                    
-                elif mid.extension.name == "toUpperCase":
-                    string_ref = frame.stack.pop() 
-                    if string_ref.value is None:
-                        return "null pointer"
-                    string_obj = state.heap[string_ref.value]
-                    string_value = string_obj.get("value", "")
-                    upper = string_value.upper()
-                    new_string_ref = len(state.heap)
-                    state.heap[new_string_ref] = {"class": "java.lang.String", "value": upper}
-                    frame.stack.push(jvm.Value(jvm.Reference(), new_string_ref))
-                    frame.pc += 1
-                    return state
-                
-                elif mid.extension.name == "charAt":
-                    index = frame.stack.pop()  
-                    string_ref = frame.stack.pop()  
-                    if string_ref.value is None:
-                        return "null pointer"
-                    string_obj = state.heap[string_ref.value]
-                    string_value = string_obj.get("value", "")
-                    if 0 <= index.value < len(string_value):
-                        char = string_value[index.value]
-                        frame.stack.push(jvm.Value.int(ord(char)))
-                    else:
-                        return "out of bounds"
-                    frame.pc += 1
-                    return state
-                    
-                elif mid.extension.name == "equals":
-                    other_ref = frame.stack.pop()  
-                    string_ref = frame.stack.pop() 
-                    if string_ref.value is None:
-                        return "null pointer"
-                    string_obj = state.heap[string_ref.value]
-                    string_value = string_obj.get("value", "")
-                    
-                    if isinstance(other_ref.type, jvm.String) and not isinstance(other_ref.value, int):
-                        # It's a direct string value
-                        other_value = other_ref.value
-                        result = 1 if string_value == other_value else 0
-                    elif other_ref.value in state.heap:
-                        # It's a heap reference
-                        other_obj = state.heap[other_ref.value]
-                        other_value = other_obj.get("value", "")
-                        result = 1 if string_value == other_value else 0
-                    else:
-                        result = 0
-                    
-                    frame.stack.push(jvm.Value.int(result))
-                    frame.pc += 1
-                    return state
-                
-                elif mid.extension.name == "substring":
-                    param_count = len(mid.extension.params._elements) if hasattr(mid.extension, 'params') and mid.extension.params else 0
-                    
-                    if param_count == 2:
-                        # substring(int beginIndex, int endIndex)
-                        end_idx = frame.stack.pop()    
-                        start_idx = frame.stack.pop()  
-                        string_ref = frame.stack.pop() 
-                        
-                        if string_ref.value is None:
-                            return "null pointer"
-                        string_obj = state.heap[string_ref.value]
-                        string_value = string_obj.get("value", "")
-                        
-                        result = string_value[start_idx.value:end_idx.value]
-                    elif param_count == 1:
-                        # substring(int beginIndex) - goes to end
-                        start_idx = frame.stack.pop()  
-                        string_ref = frame.stack.pop()  
-                        
-                        if string_ref.value is None:
-                            return "null pointer"
-                        string_obj = state.heap[string_ref.value]
-                        string_value = string_obj.get("value", "")
-                        
-                        result = string_value[start_idx.value:]  
-                    else:
-                        raise NotImplementedError(f"substring with {param_count} params not supported")
-                    
-                    new_ref = max(state.heap.keys()) + 1 if state.heap else 1
-                    state.heap[new_ref] = {'class': 'java.lang.String', 'value': result}
-                    frame.stack.push(jvm.Value(jvm.Reference(), new_ref))
-                    frame.pc += 1
-                    return state
-
-                raise NotImplementedError(f"String method {mid.extension.name} not implemented")
-            raise NotImplementedError(f"InvokeVirtual not implemented for {mid}")
-        
-        case jvm.InvokeDynamic(name=name, descriptor=descriptor):
-            if "makeConcat" in name:
-                args = []
-                num_args = descriptor.count('L') + descriptor.count('I') + descriptor.count('Z')
-                if num_args == 0:
-                    num_args = 1 
-                    
-                for _ in range(min(num_args, len(frame.stack.items))):
-                    if frame.stack.items:
-                        args.append(frame.stack.pop())
-                
-                args.reverse()
-                
-                result = "".join(str(arg.value) if hasattr(arg, 'value') else str(arg) for arg in args)
-                frame.stack.push(jvm.Value.string(result))
-                frame.pc += 1  
-                return state   
-            else:
-                raise NotImplementedError(f"Unhandled invokedynamic: {name}")
+                result = string_value[start_idx.value:end_idx.value]
+            elif param_count == 1:
+                # substring(int beginIndex) - goes to end
+                start_idx = frame.stack.pop()  
+                string_ref = frame.stack.pop()  
 
-            
-        case jvm.Throw():            
-            exception_ref = frame.stack.pop()
-    
-            # Handle both raw int and Value(int) cases
-            if isinstance(exception_ref, jvm.Value):
-                ref_value = exception_ref.value
+                if string_ref.value is None:
+                    return "null pointer"
+                string_value = string_at(state, string_ref.value)
+
+                result = string_value[start_idx.value:]  
             else:
-                ref_value = exception_ref
-            
-            # Check if it's an AssertionError
-            if ref_value in state.heap:
-                exception_obj = state.heap[ref_value]
-                if isinstance(exception_obj, dict):
-                    class_name = str(exception_obj.get("class", ""))
-                    if "AssertionError" in class_name:
-                        return "assertion error"
-            
-            # For other exceptions or if we can't determine the type
-            return "assertion error"
-            # return f"Stack items: , {frame.stack.items}"
-            # assertionsDisabled = frame.locals[0]
-            # logger.debug(f"Stack items: , {frame.stack.items}")
-            # logger.debug(f"assertionsDisabled: {assertionsDisabled}")
-            #if assertionsDisabled == Value.int(0):
-
-            #    return "assertion error"
-            #else:
-            #    frame.pc += 1
-            #    return state
-            
-            # classname = "java/lang/RuntimeException"
-            # obj_ref = len(state.heap)
-            # state.heap[obj_ref] = {"class": classname}
-            # frame.stack.items.clear()
-            # frame.stack.push(obj_ref)
-            # frame.pc += 1
-            # return state
-            
-        case jvm.If(condition=cond, target=val):
-            if cond == 'gt': # greater than
-                v2, v1 = frame.stack.pop(), frame.stack.pop()
-                if v1.value > v2.value:
-                    # logger.debug(f"Jumping to {val}")
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    # logger.debug(f"Not jumping")
-                    frame.pc += 1
-            if cond == 'ge': # greater than or equal
-                v2, v1 = frame.stack.pop(), frame.stack.pop()
-                if v1.value >= v2.value:
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            if cond == 'ne': # not equal
-                v2, v1 = frame.stack.pop(), frame.stack.pop()
-                if v1.value != v2.value:
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            if cond == 'eq': # equal
-                v2, v1 = frame.stack.pop(), frame.stack.pop()
-                if v1.value == v2.value:
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            if cond == 'lt': # Less than
-                v2, v1 = frame.stack.pop(), frame.stack.pop()
-                if v1.value < v2.value:
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-            if cond == 'le': # Less than or equal
-                v2, v1 = frame.stack.pop(), frame.stack.pop()
-                if v1.value <= v2.value:
-                    frame.pc = PC(frame.pc.method, val)
-                else:
-                    frame.pc += 1
-                
-            return state
-        
-        case jvm.Store(type=jvm.Int(), index=i):
-            v = frame.stack.pop()
-            frame.locals[i] = v
-            frame.pc += 1
-            return state
+                raise NotImplementedError(f"substring with {param_count} params not supported")
 
-        case jvm.Goto(target=val):
-            frame.pc = PC(frame.pc.method, val)
-            return state
-        
-        case jvm.NewArray(type=jvm.Int(), dim=dim):
-            size = frame.stack.pop()
-            array_ref = len(state.heap)
-            state.heap[array_ref] = [0] * size.value
-            frame.stack.push(Value.int(array_ref))
+            new_ref = state.heap.alloc(result)
+            frame.stack.push(jvm.Value(jvm.Reference(), new_ref))
             frame.pc += 1
             return state
-        
-        case jvm.ArrayStore(type=jvm.Int()):
-            value, index, array_ref = frame.stack.pop(), frame.stack.pop(), frame.stack.pop()
-            logger.debug(f"Storing value {value} at index {index} of array {array_ref}")
 
+        raise NotImplementedError(f"String method {mid.extension.name} not implemented")
+    raise NotImplementedError(f"InvokeVirtual not implemented for {mid}")
 
-            # check for null
-            if getattr(array_ref, "value", array_ref) is None:
-                return "null pointer"
-            if not hasattr(array_ref, "value"):
-                array_ref = Value.int(array_ref)
 
-            
-            try:
-                state.heap[array_ref.value][index.value] = value.value
-            except Exception as e:
-                return "out of bounds"
-            frame.pc += 1
-            return state
-        
-        case jvm.Cast(from_=jvm.Int(), to_=jvm.Short()): # This case is not complete but for now it works... :/
-            v = frame.stack.pop()
-            assert v.type is jvm.Int(), f"expected int, but got {v}"
-            short_value = ((v.value + 32768) % 65536) - 32768
-            frame.stack.push(jvm.Value.int(short_value))
-            frame.pc += 1
-            return state
-        
-        case jvm.Store(type=jvm.Reference(), index=i): # Handle reference store
-            v = frame.stack.pop()
-            frame.locals.update({i: v})
+@handles((jvm.InvokeDynamic,))
+def invoke_dynamic(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    name, descriptor = opr.name, opr.descriptor
+    if "makeConcat" in name:
+        args = []
+        num_args = descriptor.count('L') + descriptor.count('I') + descriptor.count('Z')
+        if num_args == 0:
+            num_args = 1 
+
+        for _ in range(min(num_args, frame.stack.size)):
+            if frame.stack:
+                args.append(frame.stack.pop())
+
+        args.reverse()
+
+        result = "".join(str(arg.value) if hasattr(arg, 'value') else str(arg) for arg in args)
+        frame.stack.push(jvm.Value.string(result))
+        frame.pc += 1  
+        return state   
+    else:
+        raise NotImplementedError(f"Unhandled invokedynamic: {name}")
+
+
+@handles((jvm.Throw,))
+def throw(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    exception_ref = frame.stack.pop()
+
+    # Handle both raw int and Value(int) cases
+    if isinstance(exception_ref, jvm.Value):
+        ref_value = exception_ref.value
+    else:
+        ref_value = exception_ref
+
+    # Check if it's an AssertionError
+    if ref_value in state.heap:
+        exception_obj = state.heap[ref_value]
+        if isinstance(exception_obj, JavaObject):
+            if "AssertionError" in str(exception_obj.classname):
+                return "assertion error"
+
+    # For other exceptions or if we can't determine the type
+    return "assertion error"
+
+
+@handles((jvm.If,))
+def if_(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    cond, val = opr.condition, opr.target
+    if cond == 'gt': # greater than
+        v2, v1 = frame.stack.pop(), frame.stack.pop()
+        if v1.value > v2.value:
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-        
-        case jvm.Load(type=jvm.Reference(), index=i): # Handle reference load
-            v = frame.locals[i]
-            frame.stack.push(v)
+    if cond == 'ge': # greater than or equal
+        v2, v1 = frame.stack.pop(), frame.stack.pop()
+        if v1.value >= v2.value:
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-        
-        case jvm.ArrayLength():
-    
-            array_ref = frame.stack.pop()
-            logger.debug(f"ArrayLength: array_ref = {array_ref}, heap = {state.heap}")
-            
-            # Check if it's in the heap
-            if array_ref.value not in state.heap:
-                logger.debug(f"Reference {array_ref.value} not found in heap!")
-                return "null pointer"
-            
-            heap_obj = state.heap[array_ref.value]
-            
-            # Check if it's a String object
-            if isinstance(heap_obj, dict) and heap_obj.get("class") == "java.lang.String":
-                # Get the length of the string value
-                string_value = heap_obj.get("value", "")
-                length = len(string_value)
-            elif isinstance(heap_obj, dict) and heap_obj.get("class") == "Array":
-                # Use the 'elements' key for arrays stored as dicts
-                length = len(heap_obj.get("elements", []))
-            else:
-                # It's an array
-                length = len(heap_obj)
-            
-            logger.debug(f"Array/String length is {length}")
-            frame.stack.push(jvm.Value.int(length))
+    if cond == 'ne': # not equal
+        v2, v1 = frame.stack.pop(), frame.stack.pop()
+        if v1.value != v2.value:
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-        
-        case jvm.ArrayLoad(type=jvm.Int()):
-            index, array_ref = frame.stack.pop(), frame.stack.pop()
-            logger.debug(f"Loading value at index {index} from array {array_ref}")
-            
-            if array_ref.value is None:
-                return "null pointer"
-            
-            heap_obj = state.heap[array_ref.value]
-            
-            # Handle both dict format and list format
-            if isinstance(heap_obj, dict) and heap_obj.get("class") == "Array":
-                elements = heap_obj.get("elements", [])
-            else:
-                elements = heap_obj
-            
-            if index.value < 0 or index.value >= len(elements):
-                return "out of bounds"
-            
-            try:
-                value = elements[index.value]
-            except Exception as e:
-                return "assertion error"
-            
-            frame.stack.push(jvm.Value.int(value))
+    if cond == 'eq': # equal
+        v2, v1 = frame.stack.pop(), frame.stack.pop()
+        if v1.value == v2.value:
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-        
-        case jvm.ArrayLoad(type=jvm.Char()):
-            index, array_ref = frame.stack.pop(), frame.stack.pop()
-            logger.debug(f"Loading char at index {index} from array {array_ref}")
-            
-            if array_ref.value is None:
-                return "null pointer"
-            heap_obj = state.heap[array_ref.value]
-            
-            # Handle both dict format and list format
-            if isinstance(heap_obj, dict):
-                elements = heap_obj.get("elements", [])
-            else:
-                elements = heap_obj
-            
-            if index.value < 0 or index.value >= len(elements):
-                return "out of bounds"
-            
-            char_value = elements[index.value]
-            # Convert char to int (ASCII value)
-            frame.stack.push(jvm.Value.int(ord(char_value)))
+    if cond == 'lt': # Less than
+        v2, v1 = frame.stack.pop(), frame.stack.pop()
+        if v1.value < v2.value:
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-        
-        # case jvm.Value(type=jvm.Array(contains=jvm.Int()), value=vals):
-        #     # vals may be a tuple of ints or jvm.Value(int, ...)
-        #     array_ref = len(state.heap)
-        #     elements = []
-        #     for item in vals:
-        #         if isinstance(item, jvm.Value):
-        #             if item.type is jvm.Int():
-        #                 elements.append(item.value)
-        #             else:
-        #                 raise NotImplementedError(f"array contains unsupported value: {item}")
-        #         else:
-        #             # assume a plain python int
-        #             elements.append(item)
-        #     state.heap[array_ref] = elements
-        #     frame.stack.push(jvm.Value(jvm.Reference(), array_ref))
-        #     frame.pc += 1
-        #     return state
-
-        case jvm.Incr(index=i, amount=c):
-            v = frame.locals[i]
-            assert v.type is jvm.Int(), f"expected int, but got {v}"
-            frame.locals[i] = jvm.Value.int(v.value + c)
+    if cond == 'le': # Less than or equal
+        v2, v1 = frame.stack.pop(), frame.stack.pop()
+        if v1.value <= v2.value:
+            frame.pc = PC(frame.pc.method, val)
+        else:
             frame.pc += 1
-            return state
-        
-        case a:
-            # a.help()
-            raise NotImplementedError(f"Don't know how to handle: {a!r}")
-
-state = State({}, Stack.empty())
-
-frame = Frame.from_method(methodid)
-logger.debug(f"input.values = {input.values}")
-
-params = getattr(methodid.extension, "params", None)
-param_elems = getattr(params, "_elements", ()) if params is not None else ()
-param_count = len(param_elems)
-
-for i in range(param_count):
-    if i < len(input.values):
-        v = input.values[i]
-        match v: 
-            case jvm.Value(type=jvm.Int(), value = value):
-                v = v
-            case jvm.Value(type=jvm.Float(), value = value):
-                v = v
-            case jvm.Value(type=jvm.Boolean(), value = value):
-                logger.debug(f"converting boolean {value} to int")
-                v = jvm.Value.int(1 if value else 0)
-            case jvm.Value(type=jvm.String(), value = value):
-                string_ref = len(state.heap)
-                state.heap[string_ref] = {"class": "java.lang.String", "value": value}
-                v = jvm.Value(jvm.Reference(), string_ref)
-            case jvm.Value(type=jvm.Reference(), value=None):
-                v = jvm.Value(jvm.Reference(), None)
-            case jvm.Value(type=jvm.Array(contains=contains), value=value):
-                if v.value is None:
-                    frame.locals[i] = jvm.Value(jvm.Reference(), None)
-                else:
-                        # Allocate array in heap
-                        arr_ref = len(state.heap)  # CHANGE: use len(state.heap) instead of state.allocate()
-                        arr_contents = list(value)  # Convert tuple to list
-                        state.heap[arr_ref] = {
-                            "class": "Array",
-                            "type": contains,
-                            "length": len(arr_contents),
-                            "elements": arr_contents
-                        }
-                        v = jvm.Value(jvm.Reference(), arr_ref)
-            case _:
-                raise NotImplementedError(f"Don't know how to handle input value: {v!r}")
-    else:
-        # No input provided for this parameter, default to null
-        v = jvm.Value(jvm.Reference(), None)
-    
+
+    return state
+
+
+@handles((jvm.Store, jvm.Int))
+def store_int(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    i = opr.index
+    v = frame.stack.pop()
     frame.locals[i] = v
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Goto,))
+def goto(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    val = opr.target
+    frame.pc = PC(frame.pc.method, val)
+    return state
+
+
+@handles((jvm.NewArray, jvm.Int))
+def new_int_array(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    dim = opr.dim
+    size = frame.stack.pop()
+    array_ref = state.heap.alloc(JavaArray(jvm.Int(), [0] * size.value))
+    frame.stack.push(jvm.CompactInt.of(array_ref))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.ArrayStore, jvm.Int))
+def int_array_store(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    value, index, array_ref = frame.stack.pop(), frame.stack.pop(), frame.stack.pop()
+
+    # check for null
+    if getattr(array_ref, "value", array_ref) is None:
+        return "null pointer"
+    if not hasattr(array_ref, "value"):
+        array_ref = jvm.CompactInt.of(array_ref)
+
+
+    items = state.heap[array_ref.value].items
+    if index.value < 0 or index.value >= len(items):
+        return "out of bounds"
+    items[index.value] = value.value
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Cast, jvm.Int, jvm.Short))  # This case is not complete but for now it works... :/
+def int_to_short(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    v = frame.stack.pop()
+    assert v.type is jvm.Int(), f"expected int, but got {v}"
+    short_value = ((v.value + 32768) % 65536) - 32768
+    frame.stack.push(jvm.CompactInt.of(short_value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Store, jvm.Reference))  # Handle reference store
+def store_reference(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    i = opr.index
+    v = frame.stack.pop()
+    frame.locals[i] = v
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Load, jvm.Reference))  # Handle reference load
+def load_reference(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    i = opr.index
+    v = frame.locals[i]
+    frame.stack.push(v)
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.ArrayLength,))
+def array_length(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+
+    array_ref = frame.stack.pop()
+
+    # Check if it's in the heap
+    if array_ref.value not in state.heap:
+        logger.debug("Reference {} not found in heap!", array_ref.value)
+        return "null pointer"
+
+    heap_obj = state.heap[array_ref.value]
+
+    # Strings are stored as python strings, and arrays as 'JavaArray'
+    if isinstance(heap_obj, str):
+        length = len(heap_obj)
+    else:
+        length = len(heap_obj.items)
+
+    frame.stack.push(jvm.CompactInt.of(length))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.ArrayLoad, jvm.Int))
+def int_array_load(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    index, array_ref = frame.stack.pop(), frame.stack.pop()
+
+    if array_ref.value is None:
+        return "null pointer"
+
+    elements = state.heap[array_ref.value].items
+
+    if index.value < 0 or index.value >= len(elements):
+        return "out of bounds"
 
-def main():
+    try:
+        value = elements[index.value]
+    except Exception as e:
+        return "assertion error"
+
+    frame.stack.push(jvm.CompactInt.of(value))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.ArrayLoad, jvm.Char))
+def char_array_load(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    index, array_ref = frame.stack.pop(), frame.stack.pop()
+
+    if array_ref.value is None:
+        return "null pointer"
+    elements = state.heap[array_ref.value].items
+
+    if index.value < 0 or index.value >= len(elements):
+        return "out of bounds"
+
+    char_value = elements[index.value]
+    # Convert char to int (ASCII value)
+    frame.stack.push(jvm.CompactInt.of(ord(char_value)))
+    frame.pc += 1
+    return state
+
+
+@handles((jvm.Incr,))
+def incr(state: State, frame: Frame, opr: jvm.Opcode) -> State | str:
+    i, c = opr.index, opr.amount
+    v = frame.locals[i]
+    assert v.type is jvm.Int(), f"expected int, but got {v}"
+    frame.locals[i] = jvm.CompactInt.of(v.value + c)
+    frame.pc += 1
+    return state
+
+
+def load_method(methodid: jvm.AbsMethodID):
+    """Load the opcodes of a method into the 'bc' cache."""
     try:
         # This will cache the method in bc.methods
-        _ = bc[frame.pc]
+        _ = bc[PC(methodid, 0)]
     except AssertionError:
         if any(isinstance(p, jvm.Array) and isinstance(p.contains, jvm.Char) 
                for p in getattr(methodid.extension.params, "_elements", [])):
@@ -811,24 +936,173 @@ def main():
             for m in class_data['methods']:
                 if m['name'] == method_name:
                     # Convert JSON bytecode to opcodes
-                    opcodes = []
-                    for bc_json in m["code"]["bytecode"]:
-                        opcodes.append(jvm.Opcode.from_json(bc_json))
+                    opcodes = jvm.Opcode.decode_method(m["code"]["bytecode"])
                     bc.methods[methodid] = opcodes
+                    bc.sizes[methodid] = (m["code"]["max_locals"], m["code"]["max_stack"])
                     break
         else:
             raise
+
+
+def initial_state(methodid: jvm.AbsMethodID, input: jpamb.model.Input) -> State:
+    """The state calling methodid with the input."""
+    state = State(Heap(), Stack.empty())
+
+    frame = Frame.from_method(methodid)
+    logger.debug(f"input.values = {input.values}")
+
+    params = getattr(methodid.extension, "params", None)
+    param_elems = getattr(params, "_elements", ()) if params is not None else ()
+    param_count = len(param_elems)
+
+    for i in range(param_count):
+        if i < len(input.values):
+            v = input.values[i]
+            match v: 
+                case jvm.Value(type=jvm.Int(), value = value):
+                    v = v
+                case jvm.Value(type=jvm.Float(), value = value):
+                    v = v
+                case jvm.Value(type=jvm.Boolean(), value = value):
+                    logger.debug(f"converting boolean {value} to int")
+                    v = jvm.Value.int(1 if value else 0)
+                case jvm.Value(type=jvm.String(), value = value):
+                    string_ref = state.heap.alloc(value)
+                    v = jvm.Value(jvm.Reference(), string_ref)
+                case jvm.Value(type=jvm.Reference(), value=None):
+                    v = jvm.Value(jvm.Reference(), None)
+                case jvm.Value(type=jvm.Array(contains=contains), value=value):
+                    if v.value is None:
+                        frame.locals[i] = jvm.Value(jvm.Reference(), None)
+                    else:
+                            # Allocate array in heap
+                            arr_ref = state.heap.alloc(JavaArray(contains, list(value)))
+                            v = jvm.Value(jvm.Reference(), arr_ref)
+                case _:
+                    raise NotImplementedError(f"Don't know how to handle input value: {v!r}")
+        else:
+            # No input provided for this parameter, default to null
+            v = jvm.Value(jvm.Reference(), None)
+
+        frame.locals[i] = v
     state.frames.push(frame)
-    for _ in range(1000):
-        res = step(state)
-        if isinstance(res, str):
-            print(res)
-            # Print trace in a readable format
-            break
+    return state
+
+
+def freeze(value):
+    """A hashable copy of a value in the state.
+
+    Two values only freeze to the same key if they are the same value, so
+    0.0 and -0.0, or 1 and True, are kept apart, while NaN is equal to
+    itself.
+    """
+    match value:
+        case jvm.Value() | jvm.CompactValue():
+            return (value.type, freeze(value.value))
+        case float():
+            return (float, repr(value))
+        case bool() | int():
+            return (type(value), value)
+        case Heap():
+            return tuple(freeze(o) for o in value.objects)
+        case JavaArray():
+            return (value.type, freeze(value.items))
+        case JavaObject():
+            return (value.classname, freeze(value.fields))
+        case dict():
+            return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+        case list() | tuple():
+            return tuple(freeze(v) for v in value)
+    return value
+
+
+def snapshot(state: State) -> tuple:
+    """A hashable copy of the heap and frames of the state."""
+    return freeze(state.heap), tuple(
+        (f.pc.method, f.pc.offset, freeze(f.locals), freeze(f.stack.values()))
+        for f in state.frames.items
+    )
+
+
+def interpret(
+    methodid: jvm.AbsMethodID,
+    input: jpamb.model.Input,
+    max_steps: int = 1000,
+    tracer: Tracer | None = None,
+    detect_cycles: bool = True,
+) -> str:
+    """Run the method on the input, and return the result, or "*" if it
+    does not finish within max_steps. The steps are reported to tracer,
+    if one is attached, see 'jpamb.tracer'.
+
+    If detect_cycles, the state is recorded every time a loop header is
+    reached, and the result is "*" as soon as a state repeats, as the
+    interpreter is deterministic.
+
+    The opcodes of the methods are cached in 'bc', so they are only loaded
+    once, when running many cases in the same process.
+    """
+    load_method(methodid)
+    state = initial_state(methodid, input)
+    if tracer is None:
+        advance = step
     else:
-        print("*")
+        tracer.on_call(state, methodid, state.frames.peek().locals)
+
+        def advance(state: State) -> State | str:
+            return traced_step(state, tracer)
+
+    seen = set()
+    for _ in range(max_steps):
+        res = advance(state)
+        if isinstance(res, str):
+            return res
+        if detect_cycles:
+            pc = state.frames.peek().pc
+            if pc.offset in bc.loop_headers(pc.method):
+                key = snapshot(state)
+                if key in seen:
+                    logger.debug(f"Found a cycle at {pc}")
+                    return "*"
+                seen.add(key)
+    return "*"
+
+
+def batch(lines, max_steps: int = 1000):
+    """Run a case per line, given as a method id and an input, and print
+    the result of each on its own line."""
+    for line in lines:
+        if not line.strip():
+            continue
+        mid, inp = line.strip().split(" ", 1)
+        try:
+            res = interpret(
+                jpamb.parse_methodid(mid), jpamb.parse_input(inp), max_steps
+            )
+        except Exception as e:
+            logger.error(f"{mid} {inp}: {e!r}")
+            res = "failure"
+        print(res, flush=True)
+
+
+def main():
+    if sys.argv[1:2] == ["--batch"]:
+        batch(sys.stdin)
+        return
+    methodid, input = jpamb.getcase()
+    flags = sys.argv[3:]
+    if "--debug" in flags:
+        logger.remove()
+        logger.add(sys.stderr, format="[{level}] {message}", level="DEBUG")
+    coverage = Coverage(counts="--counts" in flags)
+    tracer = Tracers(coverage, LoggingTracer()) if "--debug" in flags else coverage
+    print(interpret(methodid, input, tracer=tracer))
     # COMMENT THE BELOW LINE OUT IF YOU WANT TO USE ONLY INTERPRETER WITHOUT COVERAGE FUZZER
-    print(*trace, sep=",")
+    if "--trace" in flags:
+        print(*coverage.offsets(), sep=",")
+    else:
+        print(coverage.encode())
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,9 +1,12 @@
 package jpamb;
 
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
 import java.lang.reflect.*;
 import java.util.ArrayList;
 import java.util.Arrays;
 import java.util.List;
+import java.util.concurrent.*;
 import java.util.regex.*;
 import java.util.stream.Stream;
 
@@ -14,8 +17,14 @@ import jpamb.cases.*;
 /**
  * The runtime method runs a single test-case and print the result or the
  * exeception.
+ *
+ * With --batch it instead reads cases from stdin, see batch.
  */
 public class Runtime {
+  static final String FAILURE = "failure";
+
+  static Pattern casePattern = Pattern.compile("(.*)\\.([^.(]*):\\((.*)\\)(.*)");
+
   static List<Class<?>> caseclasses = List.of(
       Simple.class,
       Loops.class,
@@ -109,8 +118,94 @@ public class Runtime {
     return rparams;
   }
 
-  public static void main(String[] args)
-      throws ClassNotFoundException, NoSuchMethodException, IllegalAccessException {
+  public static Method findMethod(String thecase)
+      throws ClassNotFoundException, NoSuchMethodException {
+    Matcher matcher = casePattern.matcher(thecase);
+    if (!matcher.find()) {
+      return null;
+    }
+    String cls = matcher.group(1);
+    String mth = matcher.group(2);
+    String prams = matcher.group(3);
+    Method m = Class.forName(cls).getMethod(mth, parseMethodSignature(prams));
+    if (!Modifier.isStatic(m.getModifiers())) {
+      throw new RuntimeException("Expected " + thecase + " to be static");
+    }
+    return m;
+  }
+
+  public static String run(Method m, String... inputs) throws IllegalAccessException {
+    for (String input : inputs) {
+      Object[] params = InputParser.parse(input);
+      System.err.printf("Running %s with %s%n", m, Arrays.toString(params));
+      try {
+        m.invoke(null, params);
+      } catch (InvocationTargetException e) {
+        return ResultType.fromThrowable(e.getCause()).toString();
+      }
+    }
+    return ResultType.SUCCESS.toString();
+  }
+
+  /**
+   * Run the cases on stdin, one per line as a method and an input separated
+   * by a space, and print the result of each case on its own line.
+   *
+   * Each case runs on a worker thread, and is "*" if it does not finish
+   * within the timeout. As the worker can not be stopped, the runtime exits
+   * after such a case, and the remaining cases must be run again. A case
+   * which can not be found or run is "failure", and the batch continues.
+   */
+  public static void batch(long timeout) throws Exception {
+    var reader = new BufferedReader(new InputStreamReader(System.in));
+    String line;
+    while ((line = reader.readLine()) != null) {
+      if (line.isBlank()) {
+        continue;
+      }
+      System.out.println(batchCase(line.strip(), timeout));
+      System.out.flush();
+    }
+  }
+
+  static String batchCase(String line, long timeout) throws InterruptedException {
+    int split = line.indexOf(' ');
+    if (split < 0) {
+      System.err.printf("Expected a method and an input, but got %s%n", line);
+      return FAILURE;
+    }
+    Method found;
+    try {
+      found = findMethod(line.substring(0, split));
+    } catch (ReflectiveOperationException | RuntimeException e) {
+      System.err.printf("Could not find %s: %s%n", line, e);
+      return FAILURE;
+    }
+    if (found == null) {
+      System.err.printf("Could not parse %s%n", line);
+      return FAILURE;
+    }
+    final Method m = found;
+    final String input = line.substring(split + 1).strip();
+
+    var result = new FutureTask<String>(() -> run(m, input));
+    Thread worker = new Thread(result);
+    worker.setDaemon(true);
+    worker.start();
+    try {
+      return result.get(timeout, TimeUnit.MILLISECONDS);
+    } catch (TimeoutException e) {
+      System.out.println(ResultType.NON_TERMINATION);
+      System.out.flush();
+      System.exit(0);
+      return null;
+    } catch (ExecutionException e) {
+      System.err.printf("Could not run %s: %s%n", line, e.getCause());
+      return FAILURE;
+    }
+  }
+
+  public static void main(String[] args) throws Exception {
     if (args.length == 0) {
       var mths = caseclasses.stream().flatMap(c -> Stream.of(c.getMethods())).toList();
       for (Method m : mths) {
@@ -126,28 +221,13 @@ public class Runtime {
       }
       return;
     }
-    String thecase = args[0];
-    Pattern pattern = Pattern.compile("(.*)\\.([^.(]*):\\((.*)\\)(.*)");
-    Matcher matcher = pattern.matcher(thecase);
-    if (matcher.find()) {
-      String cls = matcher.group(1);
-      String mth = matcher.group(2);
-      String prams = matcher.group(3);
-      Method m = Class.forName(cls).getMethod(mth, parseMethodSignature(prams));
-      if (!Modifier.isStatic(m.getModifiers())) {
-        throw new RuntimeException("Expected " + pattern + " to be static");
-      }
-      for (int i = 1; i < args.length; i++) {
-        Object[] params = InputParser.parse(args[i]);
-        System.err.printf("Running %s with %s%n", m, Arrays.toString(params));
-        try {
-          m.invoke(null, params);
-        } catch (InvocationTargetException e) {
-          System.out.println(ResultType.fromThrowable(e.getCause()));
-          return;
-        }
-      }
-      System.out.println(ResultType.SUCCESS);
+    if (args[0].equals("--batch")) {
+      batch(args.length > 1 ? Long.parseLong(args[1]) : 2000);
+      return;
+    }
+    Method m = findMethod(args[0]);
+    if (m != null) {
+      System.out.println(run(m, Arrays.copyOfRange(args, 1, args.length)));
     }
   }
 }
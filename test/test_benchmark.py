@@ -0,0 +1,341 @@
+"""
+Regression benchmarks for the hot paths of the harness.
+
+Run them with `pytest -m benchmark -s` to see the timings.
+"""
+
+from time import perf_counter_ns
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+from jpamb import jvm, model
+
+suite = model.Suite()
+
+
+def bench(name, fn, repeat=100):
+    """Run fn repeat times, and report the time per run."""
+    fn()
+    start = perf_counter_ns()
+    for _ in range(repeat):
+        fn()
+    per_run = (perf_counter_ns() - start) / repeat
+    print(f"{name}: {per_run / 1000:.1f}us per run")
+    return per_run
+
+
+def all_subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from all_subclasses(sub)
+
+
+def decode_all_opcodes():
+    """A function decoding all the opcodes in the decompiled classes."""
+    bytecode = [
+        op
+        for cn in suite.classes()
+        for m in suite.findclass(cn)["methods"]
+        if m["code"] is not None
+        for op in m["code"]["bytecode"]
+    ]
+
+    def decode():
+        for op in bytecode:
+            try:
+                jvm.Opcode.from_json(op)
+            except NotImplementedError:
+                pass
+
+    return decode
+
+
+@contextmanager
+def count_encodes(monkeypatch):
+    """Count the number of times a type is encoded."""
+    counts = {"encode": 0}
+    for cls in all_subclasses(jvm.Type):
+        if "encode" not in cls.__dict__:
+            continue
+
+        def encode(self, _encode=cls.__dict__["encode"]):
+            counts["encode"] += 1
+            return _encode(self)
+
+        monkeypatch.setattr(cls, "encode", encode)
+    yield counts
+
+
+@pytest.mark.benchmark
+def test_sort_cases(monkeypatch):
+    cases = list(suite.cases)
+    sorted(cases)
+
+    with count_encodes(monkeypatch) as counts:
+        bench("sort cases", lambda: sorted(reversed(cases)))
+
+    assert counts["encode"] == 0, "comparing types should not encode them"
+
+
+@pytest.mark.benchmark
+def test_dict_by_methodid(monkeypatch):
+    cases = suite.cases
+
+    def build():
+        by_methodid = {}
+        for case in cases:
+            by_methodid.setdefault(case.methodid, []).append(case)
+        return by_methodid
+
+    with count_encodes(monkeypatch) as counts:
+        bench("dict by methodid", build)
+        bench("group by methodid", lambda: model.Case.by_methodid(cases))
+
+    assert counts["encode"] == 0, "hashing method ids should not encode them"
+    assert len(build()) == len(dict(suite.case_methods()))
+
+
+@pytest.mark.benchmark
+def test_decode_large_input():
+    encoded = "([I:" + ", ".join(str(i - 50_000) for i in range(100_000)) + "])"
+
+    def decode():
+        model.Input.decode.cache_clear()
+        return model.Input.decode(encoded)
+
+    bench("decode 10^5 int array", decode, repeat=5)
+    assert decode().encode() == encoded
+
+
+@pytest.mark.benchmark
+def test_decode_case_inputs():
+    inputs = [c.input.encode() for c in suite.cases]
+
+    def one_by_one():
+        model.Input.decode.cache_clear()
+        return [model.Input.decode(i) for i in inputs]
+
+    bench("decode case inputs one by one", one_by_one, repeat=20)
+    bulk = lambda: model.Input.decode_bulk(inputs)
+    bench("decode case inputs in bulk", bulk, repeat=20)
+    assert model.Input.decode_bulk(inputs) == one_by_one()
+
+
+@pytest.mark.benchmark
+def test_compact_arithmetic():
+    def loop(make):
+        v = make(0)
+        for i in range(1000):
+            v = make(v.value + i % 7)
+        return v
+
+    value = bench("Value.int arithmetic", lambda: loop(jvm.Value.int))
+    compact = bench("CompactInt arithmetic", lambda: loop(jvm.CompactInt.of))
+    print(f"speedup {value / compact:.1f}x")
+    assert loop(jvm.Value.int) == loop(jvm.CompactInt.of)
+
+
+@pytest.mark.benchmark
+def test_decode_large_compact_array():
+    encoded = "[I:" + ", ".join(str(i - 50_000) for i in range(100_000)) + "]"
+    bench("decode 10^5 compact int array", lambda: jvm.CompactIntArray.decode(encoded), repeat=5)
+    bench("encode 10^5 compact int array", jvm.CompactIntArray.decode(encoded).encode, repeat=5)
+    assert jvm.CompactIntArray.decode(encoded).encode() == encoded
+
+
+@pytest.mark.benchmark
+def test_decode_opcodes():
+    decode = decode_all_opcodes()
+
+    bench("decode opcodes", decode, repeat=10)
+    stats = jvm.json_memo_stats()
+    print(stats)
+    assert stats["method"]["hits"] > stats["method"]["misses"]
+
+
+@pytest.mark.benchmark
+def test_decode_trusted_opcodes(monkeypatch):
+    from jpamb.jvm import opcode
+
+    decode = decode_all_opcodes()
+    counts = {"validated": 0}
+
+    def fields(op, _fields=opcode.fields):
+        counts["validated"] += 1
+        return _fields(op)
+
+    bench("decode validated opcodes", decode, repeat=10)
+    with jvm.Opcode.trusted():
+        bench("decode trusted opcodes", decode, repeat=10)
+
+    monkeypatch.setattr(opcode, "fields", fields)
+    with jvm.Opcode.trusted():
+        decode()
+    assert counts["validated"] == 0
+    decode()
+    assert counts["validated"] > 0
+
+
+@pytest.mark.benchmark
+def test_reference_interpreter():
+    from jpamb.interpreter import Interpreter
+
+    interpreter = Interpreter(suite)
+    cases = [c for c in suite.cases if c.methodid.classname.name == "Loops"]
+
+    def run():
+        for case in cases:
+            interpreter.run(case.methodid, case.input)
+
+    bench("reference interpreter on Loops", run, repeat=10)
+
+
+def supported(interpreter, case):
+    try:
+        interpreter.run(case.methodid, case.input)
+    except (NotImplementedError, AssertionError):
+        return False
+    return True
+
+
+@pytest.mark.benchmark
+def test_superinstructions():
+    from jpamb.interpreter import Interpreter
+
+    # the non-terminating cases would do more work with superinstructions
+    cases = [
+        c
+        for c in suite.cases
+        if c.methodid.classname.name in ("Loops", "Arrays") and c.result != "*"
+    ]
+
+    def runner(interpreter):
+        def run():
+            for case in cases:
+                interpreter.run(case.methodid, case.input)
+
+        return run
+
+    plain = Interpreter(suite)
+    fused = Interpreter(suite, superinstructions=True)
+    cases = [c for c in cases if supported(plain, c)]
+    bench("plain opcodes", runner(plain))
+    bench("superinstructions", runner(fused))
+
+
+def load_solution(name):
+    """Import a script from the solutions folder as a module."""
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(
+        f"solutions.{name}", Path("solutions") / f"{name}.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.benchmark
+def test_solution_interpreter_steps():
+    from loguru import logger
+
+    interpreter = load_solution("interpreter")
+    logger.disable("solutions.interpreter")
+    cases = [c for c in suite.cases if c.methodid.classname.name == "Loops"]
+
+    def run():
+        for case in cases:
+            interpreter.interpret(case.methodid, case.input)
+
+    steps = 0
+    step = interpreter.step
+
+    def counting_step(state):
+        nonlocal steps
+        steps += 1
+        return step(state)
+
+    interpreter.step = counting_step
+    run()
+    interpreter.step = step
+
+    per_run = bench("solutions interpreter on Loops", run, repeat=3)
+    print(f"solutions interpreter: {steps / per_run * 1e9:.0f} steps per second")
+
+
+@pytest.mark.benchmark
+def test_solution_interpreter_heap():
+    from loguru import logger
+
+    interpreter = load_solution("interpreter")
+    logger.disable("solutions.interpreter")
+    cases = [
+        c for c in suite.cases if c.methodid.classname.name in ("Arrays", "Strings")
+    ]
+
+    results = [interpreter.interpret(c.methodid, c.input) for c in cases]
+    assert sum(r == c.result for r, c in zip(results, cases)) > len(cases) // 2
+
+    case = next(c for c in cases if "[I" in c.methodid.encode())
+    state = interpreter.initial_state(case.methodid, case.input)
+    assert state.heap.objects
+    assert all(isinstance(o, interpreter.JavaArray) for o in state.heap.objects)
+
+    def run():
+        for case in cases:
+            interpreter.interpret(case.methodid, case.input)
+
+    bench("solutions interpreter on Arrays and Strings", run, repeat=3)
+
+
+@pytest.mark.benchmark
+def test_solution_interpreter_cycles():
+    from loguru import logger
+    from jpamb.tracer import OpcodeCounter
+
+    interpreter = load_solution("interpreter")
+    logger.disable("solutions.interpreter")
+    cases = [c for c in suite.cases if c.result == "*"]
+
+    def runner(detect_cycles):
+        def run():
+            return [
+                interpreter.interpret(c.methodid, c.input, detect_cycles=detect_cycles)
+                for c in cases
+            ]
+
+        return run
+
+    assert runner(True)() == runner(False)() == ["*"] * len(cases)
+    bench("non-terminating cases, step budget", runner(False), repeat=3)
+    bench("non-terminating cases, cycle detection", runner(True), repeat=3)
+
+    def steps(detect_cycles):
+        counter = OpcodeCounter()
+        for c in cases:
+            interpreter.interpret(
+                c.methodid, c.input, tracer=counter, detect_cycles=detect_cycles
+            )
+        return sum(counter.counts.values())
+
+    assert steps(True) < steps(False)
+
+
+def test_solution_interpreter_freeze():
+    interpreter = load_solution("interpreter")
+
+    assert interpreter.freeze(0.0) != interpreter.freeze(-0.0)
+    assert interpreter.freeze(1) != interpreter.freeze(True)
+    assert interpreter.freeze(float("nan")) == interpreter.freeze(float("nan"))
+    assert interpreter.freeze(jvm.Value.int(0)) != interpreter.freeze(
+        jvm.Value.boolean(False)
+    )
+
+    freeze = interpreter.freeze
+    nan = float("nan")
+    assert freeze(jvm.CompactFloat(0.0)) != freeze(jvm.CompactFloat(-0.0))
+    assert freeze(jvm.CompactFloat(nan)) == freeze(jvm.CompactFloat(nan))
+    assert freeze(jvm.CompactInt.of(1)) != freeze(jvm.CompactBoolean.of(True))
+    assert freeze(jvm.CompactInt.of(7)) == freeze(jvm.CompactInt(7))
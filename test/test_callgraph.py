@@ -0,0 +1,59 @@
+from jpamb import jvm, model
+from jpamb.callgraph import CallGraph, tarjan
+
+suite = model.Suite()
+
+
+def mid(s):
+    return jvm.AbsMethodID.decode(s)
+
+
+def test_callgraph_edges():
+    g = suite.callgraph()
+    assert g is suite.callgraph()
+    fib = mid("jpamb.cases.Calls.fib:(I)I")
+    calls_fib = mid("jpamb.cases.Calls.callsAssertFib:(I)V")
+    assert fib in g.callees(calls_fib)
+    assert set(g.callers(fib)) == {fib, calls_fib}
+    assert g.reachable(calls_fib) >= {calls_fib, fib}
+
+
+def test_callgraph_recursion():
+    g = suite.callgraph()
+    assert g.is_recursive(mid("jpamb.cases.Calls.fib:(I)I"))
+    assert not g.is_recursive(mid("jpamb.cases.Calls.callsAssertTrue:()V"))
+
+
+def test_tarjan():
+    a, b, c, d = (mid(f"A.{n}:()V") for n in "abcd")
+    sccs = tarjan({a: (b,), b: (c,), c: (a, d), d: ()})
+    assert sccs == [frozenset({d}), frozenset({a, b, c})]
+
+
+def test_callgraph_update():
+    calls = jvm.ClassName.decode("jpamb.cases.Calls")
+    g = CallGraph.from_classes([(calls, suite.findclass(calls))])
+    fib = mid("jpamb.cases.Calls.fib:(I)I")
+    assert g.is_recursive(fib)
+    g.update(calls, None)
+    assert not g.is_recursive(fib)
+    assert g.callers(fib) == ()
+    g.update(calls, suite.findclass(calls))
+    assert g.is_recursive(fib)
+
+
+def test_callgraph_has_case_methods():
+    g = suite.callgraph()
+    decompiled = {cn for cn in suite.classes() if suite.decompiledfile(cn).exists()}
+    methods = [m for m, _ in suite.case_methods() if m.classname in decompiled]
+    assert methods
+    for m in methods:
+        assert m in g.edges, m
+    assert mid("jpamb.cases.Arrays.arraySpellsHello:([C)V") in g.edges
+
+
+def test_callgraph_mutual_recursion():
+    a, b, c = (mid(f"A.{n}:()V") for n in "abc")
+    g = CallGraph({a.classname: {a: (b,), b: (a, c), c: ()}})
+    assert g.is_recursive(a) and g.is_recursive(b)
+    assert not g.is_recursive(c)
@@ -0,0 +1,56 @@
+from jpamb import cfg, jvm, model
+
+
+def test_straight_line():
+    ops = [
+        jvm.Push(0, jvm.Value.int(1)),
+        jvm.Return(1, jvm.Int()),
+    ]
+    g = cfg.CFG.from_opcodes(ops)
+    assert len(g.blocks) == 1
+    assert g.successors == ((),)
+    assert g.rpo == (0,)
+    assert g.loops == ()
+
+
+def test_loop():
+    # 0: i = 0; 2: if i >= 10 goto 6; 4: i++; 5: goto 2; 6: return
+    ops = [
+        jvm.Push(0, jvm.Value.int(0)),
+        jvm.Store(1, jvm.Int(), 0),
+        jvm.Load(2, jvm.Int(), 0),
+        jvm.Push(3, jvm.Value.int(10)),
+        jvm.If(4, "ge", 7),
+        jvm.Incr(5, 0, 1),
+        jvm.Goto(6, 2),
+        jvm.Return(7, None),
+    ]
+    g = cfg.CFG.from_opcodes(ops)
+    assert [(b.start, b.end) for b in g.blocks] == [(0, 2), (2, 5), (5, 7), (7, 8)]
+    assert g.successors == ((1,), (2, 3), (1,), ())
+    assert g.predecessors == ((), (0, 2), (1,), (1,))
+    assert g.rpo[0] == 0 and set(g.rpo) == {0, 1, 2, 3}
+    assert g.idom == (0, 0, 1, 1)
+    assert g.dominates(1, 3) and not g.dominates(2, 3)
+    assert g.dominators(2) == [2, 1, 0]
+    assert g.loops == (cfg.Loop(header=1, body=frozenset({1, 2}), latches=(2,)),)
+
+
+def test_unreachable_block():
+    ops = [
+        jvm.Goto(0, 2),
+        jvm.Return(1, None),
+        jvm.Return(2, None),
+    ]
+    g = cfg.CFG.from_opcodes(ops)
+    assert g.rpo == (0, 2)
+    assert g.idom == (0, None, 0)
+    assert not g.dominates(0, 1)
+
+
+def test_cfg_is_cached():
+    suite = model.Suite()
+    method = jvm.AbsMethodID.decode("jpamb.cases.Loops.forever:()V")
+    g = cfg.cfg(suite, method)
+    assert g is cfg.cfg(suite, method)
+    assert g.loop_headers() == {0}
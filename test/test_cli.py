@@ -63,3 +63,82 @@ def test_interpret_i():
     )
 
     assert result.exit_code == 0
+
+
+def test_interpreter_batch():
+    import os
+    import subprocess
+    import sys
+
+    from jpamb import model
+
+    sol = Path("solutions") / "interpreter.py"
+    cases = [c for c in model.Suite().cases if "Simple" in str(c)][:8]
+
+    def interpret(*args, **kwargs):
+        return subprocess.run(
+            [sys.executable, str(sol), *args],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=os.environ | {"PYTHONPATH": str(Path.cwd())},
+            **kwargs,
+        ).stdout.splitlines()
+
+    batch = interpret(
+        "--batch",
+        input="".join(f"{c.methodid.encode()} {c.input.encode()}\n" for c in cases),
+    )
+    single = [interpret(c.methodid.encode(), c.input.encode())[0] for c in cases]
+    assert batch == single
+
+
+def test_interpreter_coverage():
+    import os
+    import subprocess
+    import sys
+
+    sys.path.insert(0, "solutions")
+    try:
+        from coverage_fuzzer import parse_coverage
+    finally:
+        sys.path.remove("solutions")
+
+    def interpret(*args):
+        return subprocess.run(
+            [sys.executable, "solutions/interpreter.py", *args],
+            capture_output=True,
+            text=True,
+            check=True,
+            env=os.environ | {"PYTHONPATH": str(Path.cwd())},
+        ).stdout.splitlines()
+
+    case = ("jpamb.cases.Simple.checkBeforeDivideByN:(I)I", "(0)")
+    result, coverage = interpret(*case)
+    _, trace = interpret(*case, "--trace")
+    assert sorted(parse_coverage(coverage)) == sorted(trace.split(","))
+
+    _, counts = interpret("jpamb.cases.Loops.forever:()V", "()", "--counts")
+    assert counts == "jpamb.cases.Loops.forever:()V=02"
+
+
+def test_fuzzer_mutations_stay_in_int_range():
+    import random
+    import sys
+
+    from jpamb import jvm
+
+    sys.path.insert(0, "solutions")
+    try:
+        from coverage_fuzzer import _mutate_input
+    finally:
+        sys.path.remove("solutions")
+
+    rng = random.Random(0)
+    array = jvm.CompactIntArray.of([2**31 - 1, -(2**31)])
+    value = jvm.Value.int(2**31 - 1)
+    for _ in range(100):
+        array = _mutate_input(array, rng)
+        value = _mutate_input(value, rng)
+        assert all(-(2**31) <= v < 2**31 for v in array)
+        assert -(2**31) <= value.value < 2**31
@@ -4,12 +4,15 @@ Tests error handling, timeouts, crashes, and edge cases.
 """
 
 import pytest
+import shutil
+import subprocess
+import sys
 import tempfile
 import time
 from pathlib import Path
 from click.testing import CliRunner
 
-from jpamb import cli
+from jpamb import cli, model
 
 
 class TestErrorHandling:
@@ -299,6 +302,161 @@ else:
             Path(script_path).unlink(missing_ok=True)
 
 
+class TestContainer:
+    """Test running build steps in docker containers."""
+
+    FAKE_DOCKER = """#!/usr/bin/env python3
+import sys
+with open(sys.argv[0] + ".log", "a") as log:
+    print(" ".join(sys.argv[1:]), file=log)
+if sys.argv[1] == "run" and "--detach" in sys.argv:
+    print("c0ffee")
+if "--batch" in sys.argv:
+    for line in sys.stdin:
+        if "Tricky" in line:
+            import time
+            time.sleep(60)
+        if "Loops" in line:
+            print("*", flush=True)
+            break
+        print("ok", flush=True)
+"""
+
+    def test_container_session(self, tmp_path):
+        """Test that a session starts one container and execs in it."""
+        docker = tmp_path / "docker"
+        docker.write_text(self.FAKE_DOCKER)
+        docker.chmod(0o755)
+
+        container = cli.Container(str(docker), "image", tmp_path)
+        container.run(["javac", "A.java"])
+        with container:
+            container.run(["java", "A"], timeout=5)
+        assert container.id is None
+
+        calls = (tmp_path / "docker.log").read_text().splitlines()
+        assert calls[0] == f"run --rm -v {tmp_path}:/workspace image javac A.java"
+        assert calls[1].startswith("run --rm --detach")
+        assert calls[2] == "exec c0ffee timeout --signal=KILL 6 java A"
+        assert calls[3] == "kill c0ffee"
+
+
+    def test_run_cases_restarts_after_timeout(self, tmp_path):
+        """Test that the cases after a timeout are run in a new runtime."""
+        docker = tmp_path / "docker"
+        docker.write_text(self.FAKE_DOCKER)
+        docker.chmod(0o755)
+
+        suite = model.Suite()
+        cases = [c for c in suite.cases if "Loops" not in str(c)][:3]
+        cases.insert(1, next(c for c in suite.cases if "Loops" in str(c)))
+
+        container = cli.Container(str(docker), "image", tmp_path)
+        results = list(cli.run_cases(container, "target/classes", cases))
+        assert results == list(zip(cases, ["ok", "*", "ok", "ok"]))
+
+        calls = (tmp_path / "docker.log").read_text().splitlines()
+        assert len(calls) == 2
+        assert calls[0].startswith("run --interactive --rm")
+        assert calls[0].endswith("-ea jpamb.Runtime --batch 2000")
+
+    def test_run_cases_survives_hanging_runtime(self, tmp_path):
+        """Test that a hanging runtime gives * for the case it was running."""
+        docker = tmp_path / "docker"
+        docker.write_text(self.FAKE_DOCKER)
+        docker.chmod(0o755)
+
+        suite = model.Suite()
+        simple = [c for c in suite.cases if "Simple" in str(c)]
+        tricky = next(c for c in suite.cases if "Tricky" in str(c))
+        cases = [simple[0], tricky, simple[1]]
+
+        container = cli.Container(str(docker), "image", tmp_path)
+        results = list(
+            cli.run_cases(container, "target/classes", cases, timeout=0.1, startup=1)
+        )
+        assert results == list(zip(cases, ["ok", "*", "ok"]))
+
+    def fake_workfolder(self, tmp_path, monkeypatch, manifest):
+        """A copy of the suite with only Simple cases, built with a fake docker."""
+        (tmp_path / "bin").mkdir()
+        docker = tmp_path / "bin" / "docker"
+        docker.write_text(self.FAKE_DOCKER)
+        docker.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}:{Path(sys.executable).parent}")
+
+        work = tmp_path / "work"
+        shutil.copytree("target", work / "target")
+        runtime = Path("src/main/java/jpamb/Runtime.java")
+        (work / runtime).parent.mkdir(parents=True)
+        shutil.copy(runtime, work / runtime)
+        cases = work / "target" / "stats" / "cases.txt"
+        lines = cases.read_text().splitlines()
+        cases.write_text("\n".join(l for l in lines if "Simple" in l and " ok" in l))
+
+        suite = model.Suite(work)
+        model.BuildManifest(manifest).save(suite.manifest_file)
+        return suite, docker
+
+    def test_full_build_keeps_other_steps(self, tmp_path, monkeypatch):
+        """Test that --full only forgets the manifest of the redone steps."""
+        runtime = "src/main/java/jpamb/Runtime.java"
+        sources = {runtime: model.file_hash(Path(runtime)), "a.java": "1"}
+        suite, _ = self.fake_workfolder(
+            tmp_path, monkeypatch, {"sources": sources, "tests": {"stale": "2"}}
+        )
+
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli, ["--workdir", str(suite.workfolder), "build", "--test", "--full"]
+        )
+        assert result.exit_code == 0, result.output
+
+        manifest = model.BuildManifest.load(suite.manifest_file)
+        assert manifest.sections["sources"] == sources
+        assert "stale" not in manifest.sections["tests"]
+        assert len(manifest.sections["tests"]) == len(suite.cases)
+
+    def test_test_compiles_stale_runtime(self, tmp_path, monkeypatch):
+        """Test that build --test compiles jpamb.Runtime if it has changed."""
+        suite, docker = self.fake_workfolder(tmp_path, monkeypatch, {})
+
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli, ["--workdir", str(suite.workfolder), "build", "--test"]
+        )
+        assert result.exit_code == 0, result.output
+
+        calls = Path(f"{docker}.log").read_text().splitlines()
+        assert "javac" in calls[0]
+        assert "src/main/java/jpamb/Runtime.java" in calls[0]
+
+
+@pytest.mark.skipif(shutil.which("javac") is None, reason="needs a JDK")
+def test_runtime_batch(tmp_path):
+    """Test jpamb.Runtime --batch against a real JVM."""
+    sources = [str(p) for p in Path("src/main/java").rglob("*.java")]
+    subprocess.run(["javac", "-d", str(tmp_path), *sources], check=True)
+
+    suite = model.Suite()
+    case = next(c for c in suite.cases if "Simple" in str(c))
+    loops = next(c for c in suite.cases if c.result == "*")
+    lines = [
+        f"{case.methodid.encode()} {case.input.encode()}",
+        "jpamb.cases.Simple.doesNotExist:()V ()",
+        f"{loops.methodid.encode()} {loops.input.encode()}",
+        f"{case.methodid.encode()} {case.input.encode()}",
+    ]
+    out = subprocess.run(
+        ["java", "-cp", str(tmp_path), "-ea", "jpamb.Runtime", "--batch", "500"],
+        input="\n".join(lines) + "\n",
+        capture_output=True,
+        text=True,
+        timeout=60,
+    ).stdout.splitlines()
+    assert out == [case.result, "failure", "*"]
+
+
 class TestCheckhealthCommand:
     """Test the checkhealth command reliability."""
 
@@ -323,3 +481,53 @@ class TestCheckhealthCommand:
             catch_exceptions=False,
         )
         assert isinstance(result.exit_code, int)
+
+
+class TestCaseSelection:
+    """Test selecting cases by their method."""
+
+    def test_interpret_selected_cases(self, tmp_path):
+        """Test that only the selected cases are run."""
+        script = tmp_path / "ok.py"
+        script.write_text("print('ok')\n")
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli,
+            [
+                "interpret",
+                "--with-python",
+                "--class",
+                "Simple",
+                "--outcome",
+                "ok",
+                str(script),
+            ],
+        )
+        assert result.exit_code == 0, result.output
+        count = sum(
+            1
+            for c in model.Suite().cases
+            if c.methodid.classname.name == "Simple" and c.result == "ok"
+        )
+        assert f"Total {count}/{count}" in result.output
+
+    def test_unknown_opcode(self):
+        """Test that an unknown opcode is a usage error."""
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli, ["test", "--has-opcode", "NoSuchOpcode", "program.py"]
+        )
+        assert result.exit_code == 2
+        assert "NoSuchOpcode" in result.output
+        assert "'--has-opcode'" in result.output
+
+    @pytest.mark.parametrize(
+        "option, value",
+        [("--class", "NoSuchClass"), ("--outcome", "maybe"), ("--param-type", "[Q")],
+    )
+    def test_bad_selector(self, option, value):
+        """Test that a bad selector is a usage error of its own option."""
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, ["test", option, value, "program.py"])
+        assert result.exit_code == 2
+        assert f"'{option}'" in result.output
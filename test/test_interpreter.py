@@ -0,0 +1,73 @@
+import pytest
+
+from jpamb import jvm, model
+from jpamb.interpreter import SEMANTICS, Interpreter
+
+suite = model.Suite()
+
+
+def supported_cases():
+    interpreter = Interpreter(suite)
+    for case in suite.cases:
+        try:
+            interpreter.run(case.methodid, case.input)
+        except (NotImplementedError, AssertionError):
+            continue
+        yield case
+
+
+@pytest.mark.parametrize("case", list(supported_cases()), ids=str)
+def test_reference_interpreter(case):
+    interpreter = Interpreter(suite, max_steps=10000)
+    assert interpreter.run(case.methodid, case.input) == case.result
+
+
+def test_interpreter_override():
+    semantics = SEMANTICS.copy()
+    pushed = []
+
+    @semantics.register(jvm.Push)
+    def push(op):
+        step = SEMANTICS.compile(op)
+
+        def logged(state, frame):
+            pushed.append(op.value)
+            return step(state, frame)
+
+        return logged
+
+    methodid = jvm.AbsMethodID.decode("jpamb.cases.Simple.divideByZero:()I")
+    assert Interpreter(suite, semantics).run(methodid, model.Input(())) == (
+        "divide by zero"
+    )
+    assert pushed
+    assert semantics.table[jvm.Push] is not SEMANTICS.table[jvm.Push]
+
+
+@pytest.mark.parametrize("case", list(supported_cases()), ids=str)
+def test_superinstructions(case):
+    plain = Interpreter(suite, max_steps=10000)
+    fused = Interpreter(suite, max_steps=10000, superinstructions=True)
+    assert plain.run(case.methodid, case.input) == fused.run(
+        case.methodid, case.input
+    )
+    assert fused.steps <= plain.steps
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (1e20, 2**31 - 1),
+        (-1e20, -(2**31)),
+        (float("inf"), 2**31 - 1),
+        (float("-inf"), -(2**31)),
+        (float("nan"), 0),
+        (-2.9, -2),
+        (2**31 - 0.5, 2**31 - 1),
+        (2**32 + 5, 5),
+    ],
+)
+def test_cast_to_int(value, expected):
+    from jpamb.interpreter import to_int
+
+    assert to_int(value) == expected
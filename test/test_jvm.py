@@ -1,4 +1,7 @@
-from jpamb import jvm
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+from jpamb import jvm, model
 
 from hypothesis import given, strategies as st
 
@@ -14,6 +17,38 @@ def test_singletons():
     assert jvm.Array(jvm.Boolean()) is not jvm.Array(jvm.Int())
 
 
+def test_type_ordering():
+    assert jvm.Int() == jvm.Int()
+    assert jvm.Int() != jvm.Float()
+    assert jvm.Float() != jvm.Int()
+    assert jvm.Int() < jvm.Array(jvm.Int())
+    assert not jvm.Int() < jvm.Int()
+    assert sorted([jvm.Int(), jvm.Char(), jvm.Array(jvm.Int())]) == [
+        jvm.Char(),
+        jvm.Int(),
+        jvm.Array(jvm.Int()),
+    ]
+
+
+def test_interning():
+    mid = "jpamb.cases.Simple.divideByZero:()I"
+
+    assert jvm.AbsMethodID.decode(mid) is jvm.AbsMethodID.decode(mid)
+    assert jvm.MethodID.decode("divideByZero:()I") is jvm.MethodID.decode(
+        "divideByZero:()I"
+    )
+    assert jvm.ClassName.decode("jpamb.cases.Simple") is jvm.ClassName(
+        "jpamb.cases.Simple"
+    )
+
+    absmid = jvm.AbsMethodID.decode(mid)
+    assert absmid is jvm.AbsMethodID(
+        jvm.ClassName("jpamb.cases.Simple"),
+        jvm.MethodID("divideByZero", jvm.ParameterType(()), jvm.Int()),
+    )
+    assert absmid != jvm.AbsMethodID.decode("jpamb.cases.Simple.divideByN:(I)I")
+
+
 def test_value_parser():
 
     assert jvm.ValueParser.parse("1, 's', [I:10, 32]") == [
@@ -23,6 +58,48 @@ def test_value_parser():
     ]
 
 
+@pytest.mark.parametrize(
+    "input",
+    [
+        "[I:]",
+        "[I: -1 ,2,3 ]",
+        "[C:'a', ']', ',']",
+        "[C:' ']",
+        '"a]b", [I:1]',
+        "[I:1.5]",
+        "[I:1,]",
+        "[I:1 2]",
+    ],
+)
+def test_value_parser_arrays(input, monkeypatch):
+    def decode():
+        try:
+            return jvm.Value.decode_many(input)
+        except ValueError:
+            return "error"
+
+    fast = decode()
+    monkeypatch.setattr(jvm.ValueParser, "scan_array", lambda self, start, kind: None)
+    assert fast == decode()
+
+
+def test_value_decode_bulk():
+    inputs = ["1, 2", "[C:'a']", "", "1, 2", "[I:1, 2], 'c'", '"a b"']
+    assert jvm.Value.decode_bulk(inputs) == [jvm.Value.decode_many(i) for i in inputs]
+    assert jvm.Value.decode_bulk([]) == []
+    with pytest.raises(ValueError):
+        jvm.Value.decode_bulk(["1", "1 2"])
+    with pytest.raises(ValueError):
+        jvm.Value.decode_bulk(["[I:1", "2]"])
+
+
+def test_input_decode_bulk():
+    inputs = ["(1, 2)", "()", "([C:'a', 'b'])", "(1, 2)"]
+    decoded = model.Input.decode_bulk(inputs)
+    assert decoded == [model.Input.decode(i) for i in inputs]
+    assert decoded[0] is decoded[3]
+
+
 def jvm_classnames():
     return st.sampled_from(["java.lang.Object", "a.simple.ClassName"]).map(
         jvm.ClassName.decode
@@ -59,6 +136,192 @@ def test_types_math_should_return_string(tp):
     assert isinstance(tp.math(), str)
 
 
+@given(jvm_types(), jvm_types())
+def test_types_are_ordered_by_encoding(a, b):
+    assert (a == b) == (a.encode() == b.encode())
+    assert (a < b) == (a.encode() < b.encode())
+    assert hash(a) == hash(b) or a != b
+
+
 @given(jvm_values())
 def test_values_math_should_return_string(v):
     assert isinstance(v.math(), str)
+
+
+@given(jvm_values())
+def test_compact_values_roundtrip(v):
+    c = v.compact()
+    assert isinstance(c, jvm.CompactValue)
+    assert c == v and v == c
+    assert hash(c) == hash(v)
+    assert c.to_value() == v
+    assert c.encode() == v.encode()
+
+
+def test_compact_values_are_cached():
+    assert jvm.CompactInt.of(1) is jvm.CompactInt.of(1)
+    assert jvm.CompactBoolean.of(False) is jvm.Value.boolean(False).compact()
+    assert jvm.CompactReference.of(None) is jvm.CompactReference.of(None)
+
+
+@given(st.lists(st.integers(-(2**31), 2**31 - 1)))
+def test_compact_int_arrays(content):
+    v = jvm.Value.array(jvm.Int(), content)
+    a = v.compact()
+    assert isinstance(a, jvm.CompactIntArray)
+    assert a == v and len(a) == len(content)
+    assert a.encode() == v.encode()
+    assert jvm.CompactIntArray.decode(v.encode()) == a
+    assert a[1:].to_value() == jvm.Value.array(jvm.Int(), content[1:])
+
+
+@given(st.lists(st.characters(max_codepoint=0xFFFF, exclude_characters="'")))
+def test_compact_char_arrays(content):
+    v = jvm.Value.array(jvm.Char(), content)
+    a = v.compact()
+    assert isinstance(a, jvm.CompactCharArray)
+    assert a == v and list(a) == content
+    assert a.encode() == v.encode()
+
+
+def test_compact_arrays_are_immutable():
+    a = jvm.CompactIntArray.of([0, 0, 0, 0])
+    assert a[1:].value.obj is a.value.obj
+    with pytest.raises(TypeError):
+        a.value[1] = 7
+    b = a[1:].replace(0, 7)
+    assert b.encode() == "[I:7, 0, 0]"
+    assert a.encode() == "[I:0, 0, 0, 0]"
+    assert {a: 1}[jvm.CompactIntArray.decode("[I:0, 0, 0, 0]")] == 1
+
+
+def test_json_memo():
+    jvm.TYPE_MEMO.clear()
+    json = {"kind": "array", "type": {"base": "int"}}
+    assert jvm.Type.from_json(json) is jvm.Type.from_json(dict(json))
+    assert jvm.Type.from_json(json) == jvm.Type.decode_json(json)
+    # the array and its element type
+    assert jvm.TYPE_MEMO.stats() == {"size": 2, "hits": 3, "misses": 2}
+
+    params = [{"annotations": [], "type": "int"}]
+    assert jvm.ParameterType.from_json(
+        params, annotated=True
+    ) is jvm.ParameterType.from_json(["int"])
+    assert set(jvm.json_memo_stats()) == {"type", "params", "method", "value"}
+
+
+def test_value_memo_keeps_signed_zeros():
+    import math
+
+    positive = jvm.Value.from_json({"type": "float", "value": 0.0})
+    negative = jvm.Value.from_json({"type": "float", "value": -0.0})
+    assert math.copysign(1, positive.value) == 1
+    assert math.copysign(1, negative.value) == -1
+    assert jvm.Value.from_json({"type": "float", "value": -0.0}) is negative
+
+
+def test_opcodes_are_validated_unless_trusted():
+    with pytest.raises(AssertionError):
+        jvm.Goto(offset=0, target="1")
+    with jvm.Opcode.trusted():
+        assert jvm.Goto(offset=0, target="1").target == "1"
+        # other threads still validate
+        with ThreadPoolExecutor(1) as executor:
+            with pytest.raises(AssertionError):
+                executor.submit(jvm.Goto, offset=0, target="1").result()
+    with pytest.raises(AssertionError):
+        jvm.Goto(offset=0, target="1")
+
+
+def test_opcode_registry():
+    assert jvm.Opcode._registry["push"] is jvm.Push
+    assert jvm.Opcode._registry["invoke", "static"] is jvm.InvokeStatic
+    with pytest.raises(NotImplementedError, match="access"):
+        jvm.Opcode.from_json({"opr": "invoke", "access": "unknown", "offset": 0})
+    with pytest.raises(NotImplementedError, match="opcode"):
+        jvm.Opcode.from_json({"opr": "unknown", "offset": 0})
+
+
+def test_decode_method():
+    suite = model.Suite()
+    cls = suite.findclass(jvm.ClassName.decode("jpamb.cases.Simple"))
+    for method in cls["methods"]:
+        bytecode = method["code"]["bytecode"]
+        try:
+            opcodes = jvm.Opcode.decode_method(bytecode)
+        except NotImplementedError:
+            continue
+        assert opcodes == [jvm.Opcode.from_json(op) for op in bytecode]
+        assert jvm.Opcode.decode_method(bytecode, trusted=True) == opcodes
+
+        pushed = {}
+        for op in opcodes:
+            if isinstance(op, jvm.Push):
+                assert pushed.setdefault(op.value, op.value) is op.value
+
+
+def test_compact_method_roundtrip():
+    suite = model.Suite()
+    cls = suite.findclass(jvm.ClassName.decode("jpamb.cases.Loops"))
+    for method in cls["methods"]:
+        try:
+            opcodes = jvm.Opcode.decode_method(method["code"]["bytecode"])
+        except NotImplementedError:
+            continue
+        compact = jvm.CompactMethod.from_opcodes(opcodes)
+        assert len(compact) == len(opcodes)
+        assert compact.to_opcodes() == opcodes
+        for i, op in enumerate(opcodes):
+            assert compact.kind(i) is type(op)
+            if isinstance(op, (jvm.Goto, jvm.If, jvm.Ifz)):
+                assert compact.targets[i] == op.target
+            else:
+                assert compact.targets[i] == jvm.NO_OPERAND
+
+
+def test_compact_method_keeps_equal_constants_apart():
+    import math
+
+    opcodes = [
+        jvm.Push(0, jvm.Value.float(0.0)),
+        jvm.Push(1, jvm.Value.float(-0.0)),
+        jvm.Push(2, jvm.Value.int(1)),
+        jvm.Push(3, jvm.Value.boolean(True)),
+    ]
+    compact = jvm.CompactMethod.from_opcodes(opcodes)
+    assert len(compact.const_pool) == 4
+    decoded = compact.to_opcodes()
+    assert [math.copysign(1, op.value.value) for op in decoded[:2]] == [1, -1]
+    assert decoded[3].value.type is jvm.Boolean()
+
+
+def test_fuse_superinstructions():
+    ops = [
+        jvm.Load(0, jvm.Int(), 0),
+        jvm.Push(1, jvm.Value.int(10)),
+        jvm.If(2, "ge", 5),
+        jvm.Incr(3, 0, 1),
+        jvm.Goto(4, 0),
+        jvm.Load(5, jvm.Int(), 0),
+        jvm.Load(6, jvm.Int(), 0),
+        jvm.Binary(7, jvm.Int(), jvm.BinaryOpr.Add),
+        jvm.Return(8, jvm.Int()),
+    ]
+    fused = jvm.fuse(ops)
+    assert len(fused) == len(ops)
+    assert isinstance(fused[0], jvm.Superinstruction)
+    assert fused[0].opcodes == tuple(ops[0:3])
+    assert isinstance(fused[3], jvm.Superinstruction) and len(fused[3]) == 2
+    assert isinstance(fused[5], jvm.Superinstruction) and len(fused[5]) == 3
+    assert fused[1:3] == tuple(ops[1:3])
+    assert fused[8] is ops[8]
+
+
+def test_fuse_keeps_branch_targets():
+    ops = [
+        jvm.Load(0, jvm.Int(), 0),
+        jvm.Load(1, jvm.Int(), 1),
+        jvm.Binary(2, jvm.Int(), jvm.BinaryOpr.Add),
+        jvm.Goto(3, 1),
+    ]
+    assert jvm.fuse(ops) == tuple(ops)
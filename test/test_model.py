@@ -47,3 +47,61 @@ def test_classlookup():
         assert suite.sourcefile(cn) in sourcefiles
         assert suite.classfile(cn) in classfiles
         assert suite.decompiledfile(cn) in decompiledfiles
+
+
+def test_build_manifest(tmp_path):
+    a, b = tmp_path / "A.java", tmp_path / "B.java"
+    a.write_text("class A {}")
+    b.write_text("class B {}")
+
+    manifest = model.BuildManifest()
+    assert manifest.changed("sources", [a, b], tmp_path) == [a, b]
+    manifest.record("sources", [a, b], tmp_path)
+    assert manifest.changed("sources", [a, b], tmp_path) == []
+
+    b.write_text("class B { int x; }")
+    assert manifest.changed("sources", [a, b], tmp_path) == [b]
+
+    file = tmp_path / "target" / "manifest.json"
+    manifest.save(file)
+    loaded = model.BuildManifest.load(file)
+    assert loaded == manifest
+    assert loaded.changed("sources", [a, b], tmp_path) == [b]
+
+    assert model.BuildManifest.load(tmp_path / "missing.json").sections == {}
+
+
+def test_method_cache_keeps_trusted_apart():
+    suite = model.Suite()
+    suite.invalidate_cache()
+    method = jvm.AbsMethodID.decode("jpamb.cases.Simple.divideByN:(I)I")
+
+    trusted = suite.method_cache(method, trusted=True)
+    validated = suite.method_cache(method)
+    assert validated is not trusted
+    assert validated.opcodes == trusted.opcodes
+    assert suite.method_cache(method) is validated
+    assert suite.method_cache(method, trusted=True) is validated
+
+
+def test_dependencies_follow_the_callgraph(monkeypatch):
+    from jpamb.callgraph import CallGraph
+
+    suite = model.Suite()
+    caller = jvm.AbsMethodID.decode("jpamb.cases.Simple.divideByN:(I)I")
+    callee = jvm.AbsMethodID.decode("jpamb.cases.Arrays.arrayContent:()V")
+    runtime = suite.classfile(jvm.ClassName("jpamb.Runtime"))
+
+    assert suite.dependencies(caller) == [runtime, suite.classfile(caller.classname)]
+
+    # the calls of methods with char[] parameters are followed too
+    spells = jvm.AbsMethodID.decode("jpamb.cases.Arrays.arraySpellsHello:([C)V")
+    assert suite.callgraph().callees(spells)
+
+    graph = CallGraph({caller.classname: {caller: (callee,)}})
+    monkeypatch.setattr(suite, "_callgraph", graph)
+    assert set(suite.dependencies(caller)) == {
+        runtime,
+        suite.classfile(caller.classname),
+        suite.classfile(callee.classname),
+    }
@@ -0,0 +1,114 @@
+from collections import Counter
+
+import pytest
+
+from jpamb import jvm, model, opstats
+
+
+def test_method_histogram():
+    suite = model.Suite()
+    stats = opstats.OpcodeStats()
+    assert stats.update(suite)
+
+    method = jvm.AbsMethodID.decode("jpamb.cases.Simple.divideByN:(I)I")
+    expected = Counter(op.mnemonic() for op in suite.method_opcodes(method))
+    assert stats.method(method) == expected
+    assert stats.histogram([method, method]) == expected + expected
+
+    for mnemonic in expected:
+        info = stats.opcodes[mnemonic]
+        assert info.source.startswith("jpamb/jvm/opcode.py?plain=1#L")
+
+    simple = stats.classes["jpamb.cases.Simple"].histogram()
+    assert simple >= expected
+
+
+def test_save_and_update(tmp_path):
+    suite = model.Suite()
+    stats = opstats.OpcodeStats()
+    stats.update(suite)
+
+    file = tmp_path / "opcodes.json"
+    stats.save(file)
+    loaded = opstats.OpcodeStats.load(file)
+    assert loaded == stats
+    assert not loaded.update(suite)
+
+    loaded.classes["jpamb.cases.Simple"].hash = "outdated"
+    assert loaded.update(suite)
+    assert loaded == stats
+
+    loaded.source = "outdated"
+    loaded.opcodes["push"] = opstats.OpcodeInfo("Push", "", "outdated")
+    assert loaded.update(suite)
+    assert loaded == stats
+
+    assert opstats.OpcodeStats.load(tmp_path / "missing.json") == opstats.OpcodeStats()
+
+
+def test_case_selector():
+    suite = model.Suite()
+    stats = opstats.OpcodeStats()
+    stats.update(suite)
+
+    select = opstats.CaseSelector(opcodes=("NewArray",))
+    methods = select.methods(suite, stats)
+    assert methods
+    assert all("newarray" in stats.method(m) for m in methods)
+    assert opstats.CaseSelector(opcodes=("newarray",)).methods(suite, stats) == methods
+
+    select = opstats.CaseSelector(classes=("Loops",), outcomes=("*",))
+    cases = select.cases(suite, stats)
+    assert cases == {
+        c
+        for c in suite.cases
+        if c.methodid.classname.name == "Loops" and c.result == "*"
+    }
+
+    select = opstats.CaseSelector(params=("[I",))
+    for m in select.methods(suite, stats):
+        assert jvm.Array(jvm.Int()) in m.extension.params
+
+    assert not opstats.CaseSelector()
+    with pytest.raises(ValueError):
+        opstats.CaseSelector(opcodes=("NoSuchOpcode",)).methods(suite, stats)
+
+
+def test_every_case_method_has_stats():
+    suite = model.Suite()
+    stats = opstats.OpcodeStats()
+    stats.update(suite)
+
+    decompiled = {cn for cn in suite.classes() if suite.decompiledfile(cn).exists()}
+    methods = [m for m, _ in suite.case_methods() if m.classname in decompiled]
+    for m in methods:
+        assert stats.method(m), m
+    spells = jvm.AbsMethodID.decode("jpamb.cases.Arrays.arraySpellsHello:([C)V")
+    assert "caload" in stats.method(spells)
+
+
+def test_case_selector_char_array():
+    suite = model.Suite()
+    stats = opstats.OpcodeStats()
+    stats.update(suite)
+
+    spells = jvm.AbsMethodID.decode("jpamb.cases.Arrays.arraySpellsHello:([C)V")
+    assert spells in opstats.CaseSelector(opcodes=("caload",)).methods(suite, stats)
+
+
+def test_case_selector_warns_without_stats():
+    from loguru import logger
+
+    suite = model.Suite()
+    stats = opstats.OpcodeStats()
+    stats.update(suite)
+    del stats.classes["jpamb.cases.Arrays"]
+
+    warnings = []
+    sink = logger.add(warnings.append, level="WARNING")
+    try:
+        opstats.CaseSelector(opcodes=("caload",)).cases(suite, stats)
+    finally:
+        logger.remove(sink)
+    assert any("arraySpellsHello" in w for w in warnings)
+    assert len(warnings) == len(set(warnings))
@@ -0,0 +1,96 @@
+import pytest
+
+from jpamb import jvm, model, tracer
+from jpamb.interpreter import Interpreter
+
+suite = model.Suite()
+
+
+class Events(tracer.Tracer):
+    def __init__(self):
+        self.events = []
+
+    def on_call(self, state, method, args):
+        self.events.append(("call", method.extension.name))
+
+    def on_return(self, state, method, value):
+        self.events.append(("return", method.extension.name, value))
+
+    def on_branch(self, state, method, offset, target):
+        self.events.append(("branch", offset, target))
+
+    def on_alloc(self, state, method, offset, value):
+        self.events.append(("alloc", offset))
+
+
+@pytest.mark.parametrize("superinstructions", [False, True])
+def test_traced_run(superinstructions):
+    for case in suite.cases:
+        plain = Interpreter(suite, superinstructions=superinstructions)
+        try:
+            expected = plain.run(case.methodid, case.input)
+        except (NotImplementedError, AssertionError):
+            continue
+        counter = tracer.OpcodeCounter()
+        traced = Interpreter(
+            suite, superinstructions=superinstructions, tracer=counter
+        )
+        assert traced.run(case.methodid, case.input) == expected
+        assert traced.steps == plain.steps
+        if not superinstructions:
+            assert sum(counter.counts.values()) == plain.steps
+
+
+def test_traced_superinstructions():
+    """Test that tracers see the same run with and without superinstructions."""
+
+    def trace(case, superinstructions):
+        coverage, counter = tracer.Coverage(counts=True), tracer.OpcodeCounter()
+        interpreter = Interpreter(
+            suite,
+            superinstructions=superinstructions,
+            tracer=tracer.Tracers(coverage, counter),
+        )
+        try:
+            result = interpreter.run(case.methodid, case.input)
+        except (NotImplementedError, AssertionError):
+            return None
+        return result, coverage.hits, counter.histogram()
+
+    # the step budget counts dispatches, so only finished runs are the same
+    for case in suite.cases:
+        if case.result == "*":
+            continue
+        assert trace(case, True) == trace(case, False), case
+
+
+def test_events():
+    events = Events()
+    interpreter = Interpreter(suite, tracer=events)
+    method = jvm.AbsMethodID.decode("jpamb.cases.Calls.callsAssertIfWithTrue:()V")
+    assert interpreter.run(method, model.Input(())) == "ok"
+    assert events.events == [
+        ("call", "callsAssertIfWithTrue"),
+        ("call", "assertIf"),
+        ("branch", 1, 2),
+        ("call", "assertTrue"),
+        ("return", "assertTrue", None),
+        ("branch", 3, 5),
+        ("return", "assertIf", None),
+    ]
+
+    events.events.clear()
+    method = jvm.AbsMethodID.decode("jpamb.cases.Simple.assertFalse:()V")
+    assert interpreter.run(method, model.Input(())) == "assertion error"
+    assert events.events[-1] == ("alloc", 2)
+
+
+def test_coverage():
+    coverage = tracer.Coverage(counts=True)
+    method = jvm.AbsMethodID.decode("jpamb.cases.Simple.divideByN:(I)I")
+    interpreter = Interpreter(suite, tracer=coverage)
+    interpreter.run(method, model.Input((jvm.Value.int(0),)))
+
+    assert coverage.offsets() == {f"{method}:{i}" for i in range(3)}
+    decoded = tracer.Coverage.decode(coverage.encode(), counts=True)
+    assert decoded.hits == coverage.hits